@@ -0,0 +1,133 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, FilteredRelation, Q
+from django.utils.timezone import now
+
+from .models import UploadedFile
+
+
+def _cache_key(file_id, user_id):
+    return f"file-acl:{file_id}:{user_id}"
+
+
+class FileAccess:
+    """
+    What one user may do with one file: owner, view, download and share expiry.
+    """
+
+    def __init__(self, file_id, owner_id, user_id, view_permission, download_permission,
+                 expiration_time, file=None):
+        self.file_id = file_id
+        self.owner_id = owner_id
+        self.user_id = user_id
+        self.view_permission = view_permission
+        self.download_permission = download_permission
+        self.expiration_time = expiration_time
+        self._file = file
+
+    @property
+    def is_owner(self):
+        return self.owner_id == self.user_id
+
+    def _share_active(self):
+        # Same rule as SharedFile.is_access_allowed
+        return self.expiration_time is None or now() < self.expiration_time
+
+    @property
+    def can_view(self):
+        return self.is_owner or (self.view_permission and self._share_active())
+
+    @property
+    def can_download(self):
+        return self.is_owner or (self.download_permission and self._share_active())
+
+    @property
+    def file(self):
+        """
+        The UploadedFile row. Already loaded on a cache miss, fetched on first use otherwise.
+        """
+        if self._file is None:
+            self._file = UploadedFile.objects.select_related('blob').get(id=self.file_id)
+        return self._file
+
+    async def aget_file(self):
+        """
+        Async version of .file.
+        """
+        if self._file is None:
+            self._file = await UploadedFile.objects.select_related('blob').aget(id=self.file_id)
+        return self._file
+
+
+def _access_query(user, file_id):
+    return (
+        UploadedFile.objects.filter(id=file_id)
+        .select_related('blob')
+        .annotate(share=FilteredRelation('shared_files', condition=Q(shared_files__shared_with=user)))
+        .annotate(
+            share_id=F('share__id'),
+            share_view=F('share__view_permission'),
+            share_download=F('share__download_permission'),
+            share_expires=F('share__expiration_time'),
+        )
+    )
+
+
+def _access_facts(rows):
+    # Several rows only if the same file was shared twice with the same user
+    shares = [row for row in rows if row.share_id is not None]
+    expirations = [row.share_expires for row in shares]
+    return {
+        "owner_id": rows[0].user_id,
+        "view_permission": any(row.share_view for row in shares),
+        "download_permission": any(row.share_download for row in shares),
+        "expiration_time": None if None in expirations else max(expirations, default=None),
+    }
+
+
+def resolve_file_access(user, file_id):
+    """
+    Returns the FileAccess of user on file_id, or None if the file does not exist.
+
+    On a cache miss the file row and the user's share (if any) come back in a
+    single LEFT JOIN query; the permission facts are then cached for
+    FILE_ACL_CACHE_TIMEOUT seconds. Expiry is evaluated on every call, so a
+    cached share still stops working the moment it expires.
+    """
+    key = _cache_key(file_id, user.id)
+    cached = cache.get(key)
+    if cached is not None:
+        return FileAccess(file_id, user_id=user.id, **cached)
+
+    rows = list(_access_query(user, file_id))
+    if not rows:
+        return None
+
+    facts = _access_facts(rows)
+    cache.set(key, facts, settings.FILE_ACL_CACHE_TIMEOUT)
+    return FileAccess(file_id, user_id=user.id, file=rows[0], **facts)
+
+
+async def aresolve_file_access(user, file_id):
+    """
+    Async version of resolve_file_access, for views running on the event loop.
+    """
+    key = _cache_key(file_id, user.id)
+    cached = await cache.aget(key)
+    if cached is not None:
+        return FileAccess(file_id, user_id=user.id, **cached)
+
+    rows = [row async for row in _access_query(user, file_id)]
+    if not rows:
+        return None
+
+    facts = _access_facts(rows)
+    await cache.aset(key, facts, settings.FILE_ACL_CACHE_TIMEOUT)
+    return FileAccess(file_id, user_id=user.id, file=rows[0], **facts)
+
+
+def invalidate_file_access(file_id, user_ids):
+    """
+    Drops cached permissions after a share of file_id is created, changed or revoked.
+    """
+    cache.delete_many([_cache_key(file_id, user_id) for user_id in user_ids])
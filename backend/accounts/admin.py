@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.utils.timezone import now
 from django.http import HttpResponse
-from .models import CustomUser, UploadedFile, SharedFile
+from .models import CustomUser, OutboundEmail, UploadedFile, SharedFile
 import os
 
 
@@ -45,7 +45,15 @@ class SharedFileAdmin(admin.ModelAdmin):
     is_valid.short_description = 'Access Allowed'
 
 
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipients', 'attempts', 'next_attempt_at', 'created_at')
+    list_filter = ('attempts',)
+    search_fields = ('subject', 'last_error')
+    ordering = ('next_attempt_at',)
+
+
 # Register the models with the admin site
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(UploadedFile, UploadedFileAdmin)
 admin.site.register(SharedFile, SharedFileAdmin)
+admin.site.register(OutboundEmail, OutboundEmailAdmin)
@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        # Registers the signal that releases blobs of deleted files
+        from . import blobs  # noqa: F401
+        # Registers the signals that invalidate cached user principals, which
+        # must run even in processes that never authenticate a request
+        from . import authentication  # noqa: F401
+
+        from django.conf import settings
+        if settings.SHARE_REAPER_INTERVAL:
+            from .sharing import start_share_reaper
+            start_share_reaper(settings.SHARE_REAPER_INTERVAL)
@@ -0,0 +1,91 @@
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import CustomUser
+
+# Fields of the cached principal: what permissions and views read from
+# request.user. Any other field is loaded from the database on first access.
+# In model field order, as Model.from_db expects.
+PRINCIPAL_FIELDS = (
+    'id', 'is_superuser', 'username', 'first_name', 'last_name', 'email', 'is_staff', 'is_active', 'role',
+)
+
+
+def _version_key(user_id):
+    return f"auth-user-version:{user_id}"
+
+
+def _version(user_id):
+    """
+    Returns the user's current principal version, starting one if there is none.
+    """
+    key = _version_key(user_id)
+    value = cache.get(key)
+    if value is None:
+        # Random rather than 1, so a counter lost to eviction never revives an old entry
+        cache.add(key, secrets.randbits(48), None)
+        value = cache.get(key)
+    return value
+
+
+def invalidate_principal(user_id):
+    """
+    Moves a user's cached principal to a new version, so the next request loads it again.
+    """
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.set(_version_key(user_id), secrets.randbits(48), None)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def _invalidate_saved_user(sender, instance, **kwargs):
+    # Saves cover deactivation, role changes and password resets. Invalidate
+    # now for this transaction, and again on commit so a request that read the
+    # old row in the meantime cannot have cached it under the new version.
+    invalidate_principal(instance.pk)
+    transaction.on_commit(lambda: invalidate_principal(instance.pk))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that loads the user from a cached principal instead of
+    the database.
+
+    The principal holds PRINCIPAL_FIELDS and is cached for
+    AUTH_USER_CACHE_TIMEOUT seconds under the user's ID and version, which
+    every save or delete of the user moves on. Queryset update() calls do not
+    send signals: call invalidate_principal() after one that changes a user.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+        if api_settings.USER_ID_FIELD != 'id' or api_settings.CHECK_REVOKE_TOKEN:
+            # The principal is keyed by primary key and holds no password hash
+            return super().get_user(validated_token)
+
+        key = f"auth-user:{user_id}:{_version(user_id)}"
+        values = cache.get(key)
+        if values is None:
+            values = CustomUser.objects.filter(id=user_id).values_list(*PRINCIPAL_FIELDS).first()
+            if values is None:
+                raise AuthenticationFailed("User not found", code="user_not_found")
+            cache.set(key, values, settings.AUTH_USER_CACHE_TIMEOUT)
+
+        user = CustomUser.from_db('default', PRINCIPAL_FIELDS, values)
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        return user
@@ -0,0 +1,257 @@
+import hashlib
+import os
+import secrets
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from . import metrics
+from .compression import compress_blocks, decompress_blocks, get_codec, worth_compressing, write_codec
+from .downloads import read_file_range, slice_blocks
+from .encryption import ctr_cipher_at, new_data_key, unwrap_key, wrap_key
+from .models import Blob, UploadedFile
+from .parallel_crypto import ctr_transform_stream
+from .storage import blob_storage, media_file_path
+
+
+def _decrypt_blocks(blocks, data_key, data_nonce, offset=0, parallel=False):
+    # Parallel for whole-file work on one request; per-block for streamed downloads,
+    # which would otherwise buffer a segment per crypto thread for every client
+    if parallel:
+        yield from ctr_transform_stream(blocks, data_key, data_nonce, offset)
+        return
+    cipher = ctr_cipher_at(data_key, data_nonce, offset)
+    for block in blocks:
+        yield cipher.update(block)
+
+
+def content_hash(path, data_key, data_nonce):
+    """
+    Returns the SHA-256 hex digest of the plaintext of a file encrypted at rest.
+    """
+    digest = hashlib.sha256()
+    for block in _decrypt_blocks(read_file_range(path, settings.DOWNLOAD_BLOCK_SIZE), data_key, data_nonce, parallel=True):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def _compress_part(part_path, data_key, data_nonce, file_name):
+    """
+    Compresses an encrypted part file into a new one under a fresh data key.
+
+    Returns (path, codec name, data key, data nonce) of the compressed part and
+    removes the original, or returns None and leaves it alone when the file's
+    type or sample ratio says compression is not worth it.
+    """
+    codec = write_codec()
+    if codec is None:
+        return None
+
+    size = os.path.getsize(part_path)
+    sample = b''.join(_decrypt_blocks(
+        read_file_range(part_path, settings.DOWNLOAD_BLOCK_SIZE, 0, settings.FILE_COMPRESSION_PROBE_BYTES),
+        data_key, data_nonce,
+    ))
+    compress, reason = worth_compressing(file_name, sample, codec)
+    if not compress:
+        metrics.increment(f"compression.skipped_{reason}")
+        return None
+
+    # A fresh key: the compressed stream must not reuse the plaintext's keystream
+    compressed_key, compressed_nonce = new_data_key()
+    compressed_path = f"{part_path}.{codec.name}"
+    encryptor = ctr_cipher_at(compressed_key, compressed_nonce, 0)
+    plaintext = _decrypt_blocks(read_file_range(part_path, settings.DOWNLOAD_BLOCK_SIZE), data_key, data_nonce, parallel=True)
+    with open(compressed_path, 'wb') as f:
+        for block in compress_blocks(plaintext, codec):
+            f.write(encryptor.update(block))
+
+    stored_size = os.path.getsize(compressed_path)
+    if size < settings.FILE_COMPRESSION_MIN_RATIO * stored_size:
+        os.remove(compressed_path)
+        metrics.increment("compression.skipped_ratio")
+        return None
+
+    os.remove(part_path)
+    metrics.increment("compression.files")
+    metrics.increment("compression.bytes_in", size)
+    metrics.increment("compression.bytes_out", stored_size)
+    return compressed_path, codec.name, compressed_key, compressed_nonce
+
+
+def _publish(part_path, digest, data_key, data_nonce, file_name):
+    """
+    Compresses (when worthwhile) and publishes a finished upload under a new
+    storage name, consuming part_path. Returns the fields of its Blob row.
+    """
+    fields = {"size": os.path.getsize(part_path), "data_key": wrap_key(data_key), "data_nonce": data_nonce}
+    compressed = _compress_part(part_path, data_key, data_nonce, file_name)
+    if compressed:
+        part_path, fields["codec"], compressed_key, fields["data_nonce"] = compressed
+        fields["data_key"] = wrap_key(compressed_key)
+        fields["stored_size"] = os.path.getsize(part_path)
+    # Every upload has its own key, so concurrent uploads of the same new
+    # content write different bytes: each publishes under a name of its own
+    fields["storage_name"] = f"{digest[:2]}/{digest[2:4]}/{digest}.{secrets.token_hex(8)}"
+    blob_storage().save(fields["storage_name"], part_path)
+    return fields
+
+
+def _take_reference(digest, fields):
+    """
+    Takes a reference to the blob with the given digest, creating it from
+    fields when there is none and fields are given. Returns the Blob and
+    whether it was created, or (None, False).
+    """
+    while True:
+        if fields is None:
+            blob, created = Blob.objects.filter(sha256=digest).first(), False
+            if blob is None:
+                return None, False
+        else:
+            blob, created = Blob.objects.get_or_create(sha256=digest, defaults=fields)
+        # Zero rows updated means the last reference was released meanwhile
+        if Blob.objects.filter(id=blob.id).update(refcount=F('refcount') + 1):
+            blob.refcount += 1
+            return blob, created
+
+
+@contextmanager
+def stored_blob(part_path, data_key, data_nonce, file_name=None):
+    """
+    Files a finished upload (encrypted at rest under data_key) in the blob store
+    and yields its Blob, with one more reference taken, inside a transaction in
+    which the caller creates the referencing rows.
+
+    Content that is already stored only costs the hash: the upload is
+    discarded and the existing blob, with its own key, is referenced instead.
+    New content is compressed when file_name's type and a sample allow it,
+    and published to the storage backend before the transaction starts, so
+    no database lock is held while a large file is copied. Of concurrent
+    uploads of the same new content, the first to create the row wins and
+    the others delete their copy; so does a transaction that rolls back.
+    """
+    digest = content_hash(part_path, data_key, data_nonce)
+    fields = None
+    if not Blob.objects.filter(sha256=digest).exists():
+        fields = _publish(part_path, digest, data_key, data_nonce, file_name)
+    published = fields and fields["storage_name"]
+
+    try:
+        with transaction.atomic():
+            blob, created = _take_reference(digest, fields)
+            if blob is None:
+                # The last reference was released since the check: publish after all
+                fields = _publish(part_path, digest, data_key, data_nonce, file_name)
+                published = fields["storage_name"]
+                blob, created = _take_reference(digest, fields)
+            if published and not created:
+                blob_storage().delete(published)
+                published = None
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            yield blob
+    except BaseException:
+        if published:
+            blob_storage().delete(published)
+        raise
+
+
+def release_blob(blob_id):
+    """
+    Drops one reference to a blob, deleting it and its file with the last one.
+    """
+    with transaction.atomic():
+        Blob.objects.filter(id=blob_id).update(refcount=F('refcount') - 1)
+        blob = Blob.objects.select_for_update().filter(id=blob_id, refcount=0).first()
+        if blob is None:
+            return
+        name = blob.name
+        blob.delete()
+
+    transaction.on_commit(lambda: blob_storage().delete(name))
+
+
+def content_size(uploaded_file):
+    """
+    Size in bytes of a file's stored content (the same as its plaintext size).
+    """
+    return uploaded_file.blob.size if uploaded_file.blob_id else os.path.getsize(uploaded_file.file.path)
+
+
+def stored_as_served(uploaded_file):
+    """
+    Whether a file's stored bytes are exactly its AES-CTR stream under its own
+    data key, so they can be sent to clients as they are (compressed blobs and
+    plaintext legacy files are not).
+    """
+    return uploaded_file.encrypted and not (uploaded_file.blob_id and uploaded_file.blob.codec)
+
+
+def open_content(uploaded_file, start=0, length=None):
+    """
+    Yields a file's stored bytes, or length bytes of them from start, block by
+    block from whichever backend holds it.
+    """
+    if length == 0:
+        return iter(())
+    if uploaded_file.blob_id:
+        return blob_storage().open(uploaded_file.blob.name, start, length)
+    return read_file_range(uploaded_file.file.path, settings.DOWNLOAD_BLOCK_SIZE, start, length)
+
+
+def read_plaintext(uploaded_file, start=0, length=None, parallel=False):
+    """
+    Yields a file's plaintext, or length bytes of it from start, block by block.
+
+    Compressed blobs are decrypted and decompressed as a stream, so memory stays
+    at about one block; a range of one is found by decompressing up to it.
+    parallel decrypts on the crypto thread pool, for callers that read the
+    whole file at once.
+    """
+    if not uploaded_file.encrypted:
+        return read_file_range(uploaded_file.file.path, settings.DOWNLOAD_BLOCK_SIZE, start, length)
+
+    data_key, data_nonce = unwrap_key(uploaded_file.wrapped_key), uploaded_file.key_nonce
+    if stored_as_served(uploaded_file):
+        return _decrypt_blocks(open_content(uploaded_file, start, length), data_key, data_nonce, start, parallel)
+
+    codec = get_codec(uploaded_file.blob.codec)
+    plaintext = decompress_blocks(_decrypt_blocks(open_content(uploaded_file), data_key, data_nonce, 0, parallel), codec)
+    return slice_blocks(plaintext, start, length)
+
+
+def transfer_secret(uploaded_file):
+    """
+    Returns (secret, context) from which a file's transfer keys are derived:
+    its data key, or for files stored in plaintext the key-encryption key and
+    the file's path. Either way the secret never leaves the server.
+    """
+    if uploaded_file.encrypted:
+        return unwrap_key(uploaded_file.wrapped_key), ''
+    return bytes.fromhex(settings.FILE_KEY_ENCRYPTION_KEY), uploaded_file.file.name
+
+
+def media_path(uploaded_file):
+    """
+    Path of a file's content relative to media/ when it is on this node's
+    disk (so nginx can send it), otherwise None.
+    """
+    if uploaded_file.blob_id:
+        path = blob_storage().local_path(uploaded_file.blob.name)
+        if path is None:
+            return None
+    else:
+        path = uploaded_file.file.path
+    relative_path = os.path.relpath(path, media_file_path())
+    return None if relative_path.startswith(os.pardir) else relative_path
+
+
+@receiver(post_delete, sender=UploadedFile)
+def release_uploaded_file_blob(sender, instance, **kwargs):
+    if instance.blob_id:
+        release_blob(instance.blob_id)
@@ -0,0 +1,258 @@
+import os
+import time
+from functools import lru_cache
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .encryption import ctr_transform
+from .parallel_crypto import ctr_transform_parallel, map_in_order, regroup
+
+# Transfers between client and server are encrypted with a negotiated cipher
+# suite. Clients list the suites they support in an X-Cipher-Suites header
+# (downloads) or name the one they used in cipher_suite (uploads); requests
+# without either keep the original AES-CBC (JSON) and AES-CTR (binary) formats.
+#
+# Framed suites split the plaintext into frames of frame_size bytes (the last
+# one shorter, or a single empty frame for an empty file) and seal each one
+# separately with an AEAD, so every frame is verified as it arrives. Frame i
+# is sealed under the base nonce with its last 8 bytes XORed with i, and
+# authenticates i and whether it is the final frame as associated data, so
+# frames cannot be reordered, dropped or cut off at a frame boundary. On the
+# wire each frame is its ciphertext followed by the 16-byte tag.
+
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+TAG_BYTES = 16
+
+
+class IntegrityError(ValueError):
+    """
+    Raised when a frame fails authentication or the frame sequence is incomplete.
+    """
+
+
+class CipherSuite:
+    name = None
+    key_size = 32
+    nonce_size = 16
+    authenticated = False
+    framed = False
+
+    def new_key(self):
+        return os.urandom(self.key_size), os.urandom(self.nonce_size)
+
+    def derive_key(self, secret, context, frame_size):
+        """
+        A key and nonce for this suite derived from a secret, so the same file
+        always encrypts to the same bytes and ranges of separate responses line up.
+        """
+        material = HKDF(
+            algorithm=hashes.SHA256(), length=self.key_size + self.nonce_size, salt=None,
+            info=f"fileshare:{self.name}:{frame_size}:{context}".encode(),
+        ).derive(secret)
+        return material[:self.key_size], material[self.key_size:]
+
+    def encrypt(self, key, nonce, data, frame_size):
+        """
+        Encrypts a whole payload in memory, on the crypto thread pool.
+        """
+        raise NotImplementedError
+
+
+class AesCtrSuite(CipherSuite):
+    """
+    AES-256-CTR as a single stream: fast and seekable, but unauthenticated.
+    """
+    name = 'aes-256-ctr'
+
+    def encrypt(self, key, nonce, data, frame_size):
+        return ctr_transform_parallel(key, nonce, 0, data)
+
+
+class FramedAeadSuite(CipherSuite):
+    authenticated = True
+    framed = True
+    nonce_size = 12
+    aead = None
+
+    def frame_nonce(self, nonce, index):
+        return nonce[:4] + (int.from_bytes(nonce[4:], 'big') ^ index).to_bytes(8, 'big')
+
+    @staticmethod
+    def frame_aad(index, final):
+        return index.to_bytes(8, 'big') + (b'\1' if final else b'\0')
+
+    def seal_frame(self, key, nonce, index, plaintext, final):
+        return self.aead(key).encrypt(self.frame_nonce(nonce, index), bytes(plaintext), self.frame_aad(index, final))
+
+    def open_frame(self, key, nonce, index, record, final):
+        try:
+            return self.aead(key).decrypt(self.frame_nonce(nonce, index), bytes(record), self.frame_aad(index, final))
+        except InvalidTag:
+            raise IntegrityError(f"Frame {index} failed authentication.") from None
+
+    @staticmethod
+    def frame_count(size, frame_size):
+        return max(-(-size // frame_size), 1)
+
+    def wire_size(self, size, frame_size):
+        """
+        Length of the framed ciphertext of size plaintext bytes.
+        """
+        return size + self.frame_count(size, frame_size) * TAG_BYTES
+
+    def seal_frames(self, key, nonce, frames, first_index, last_index, parallel=False):
+        """
+        Yields the sealed records of an iterable of plaintext frames numbered
+        from first_index, in a file whose final frame is last_index.
+        """
+        def arguments():
+            index = first_index
+            for frame in frames:
+                yield key, nonce, index, frame, index == last_index
+                index += 1
+            if index == 0:
+                # An empty file is a single empty final frame
+                yield key, nonce, 0, b'', True
+
+        if parallel:
+            return map_in_order(self.seal_frame, arguments())
+        return (self.seal_frame(*frame_arguments) for frame_arguments in arguments())
+
+    def encrypt(self, key, nonce, data, frame_size):
+        view = memoryview(data)
+        frames = (view[position:position + frame_size] for position in range(0, len(data), frame_size))
+        last_index = self.frame_count(len(data), frame_size) - 1
+        return b''.join(self.seal_frames(key, nonce, frames, 0, last_index, parallel=True))
+
+    def records(self, chunks, frame_size):
+        """
+        Yields (index, record, final) for a framed ciphertext arriving in
+        chunks of any size, looking one record ahead to find the final one.
+        """
+        previous = None
+        index = 0
+        for record in regroup(chunks, frame_size + TAG_BYTES):
+            if previous is not None:
+                if len(previous) < frame_size + TAG_BYTES:
+                    raise IntegrityError("Only the final frame may be shorter than the frame size.")
+                yield index, previous, False
+                index += 1
+            previous = record
+        if previous is None or len(previous) < TAG_BYTES:
+            raise IntegrityError("The framed ciphertext is truncated.")
+        yield index, previous, True
+
+
+class AesGcmFramesSuite(FramedAeadSuite):
+    """
+    AES-256-GCM frames. Fastest where AES has hardware support, and available
+    in browsers through WebCrypto.
+    """
+    name = 'aes-256-gcm-frames'
+    aead = AESGCM
+
+
+class ChaCha20Poly1305FramesSuite(FramedAeadSuite):
+    """
+    ChaCha20-Poly1305 frames, faster than AES-GCM on CPUs without AES instructions.
+    """
+    name = 'chacha20-poly1305-frames'
+    aead = ChaCha20Poly1305
+
+
+CIPHER_SUITES = {suite.name: suite for suite in (AesGcmFramesSuite(), ChaCha20Poly1305FramesSuite(), AesCtrSuite())}
+
+
+def get_suite(name):
+    """
+    Returns the suite called name, or raises ValueError if there is none.
+    """
+    try:
+        return CIPHER_SUITES[name]
+    except KeyError:
+        raise ValueError(f"Unsupported cipher suite '{name}'.") from None
+
+
+def measure_throughput(suite, size=1024 * 1024, repeat=3):
+    """
+    Bytes per second suite encrypts on one thread of this machine, in
+    CIPHER_FRAME_SIZE frames for framed suites.
+    """
+    key, nonce = suite.new_key()
+    data = os.urandom(size)
+    frame_size = settings.CIPHER_FRAME_SIZE
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if suite.framed:
+            for index, position in enumerate(range(0, size, frame_size)):
+                suite.seal_frame(key, nonce, index, data[position:position + frame_size], False)
+        else:
+            ctr_transform(key, nonce, 0, data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return size / best
+
+
+# Authenticated suites first, AES-GCM ahead of ChaCha20-Poly1305 as it is the
+# faster of the two on CPUs with AES instructions. Fixed rather than measured,
+# so every process and node negotiates the same suite for the same offer.
+DEFAULT_SUITE_ORDER = ('aes-256-gcm-frames', 'chacha20-poly1305-frames', 'aes-256-ctr')
+
+
+@lru_cache(maxsize=None)
+def suite_ranking():
+    """
+    Suite names in the server's order of preference: CIPHER_SUITES, or
+    DEFAULT_SUITE_ORDER when it is not set.
+    """
+    return tuple(get_suite(name).name for name in settings.CIPHER_SUITES or DEFAULT_SUITE_ORDER)
+
+
+@receiver(setting_changed)
+def _reset_suite_ranking(setting, **kwargs):
+    if setting == 'CIPHER_SUITES':
+        suite_ranking.cache_clear()
+
+
+def negotiate(offered):
+    """
+    Picks the server's most preferred suite among those a client offered in a
+    comma-separated list, or None when there is no list or no suite in common.
+    """
+    if not offered:
+        return None
+    names = {name.strip().lower() for name in offered.split(',')}
+    for name in suite_ranking():
+        if name in names:
+            return CIPHER_SUITES[name]
+    return None
+
+
+def frame_size_from(value):
+    """
+    Parses a client's frame size, defaulting to CIPHER_FRAME_SIZE. Raises ValueError when invalid.
+    """
+    if value in (None, ''):
+        return settings.CIPHER_FRAME_SIZE
+    frame_size = int(value)
+    if not 0 < frame_size <= MAX_FRAME_SIZE:
+        raise ValueError(f"frame_size must be between 1 and {MAX_FRAME_SIZE}.")
+    return frame_size
+
+
+def upload_cipher(suite_name, frame_size):
+    """
+    Returns (suite, frame size) for an upload's cipher_suite and frame_size
+    fields, with None as the suite for the original AES-CBC format. Raises
+    ValueError for an unknown suite or invalid frame size.
+    """
+    if not suite_name:
+        return None, None
+    return get_suite(suite_name.strip().lower()), frame_size_from(frame_size)
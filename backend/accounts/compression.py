@@ -0,0 +1,110 @@
+import mimetypes
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import zstandard
+except ImportError:  # Optional: zlib from the standard library is used instead
+    zstandard = None
+
+
+class ZlibCodec:
+    name = 'zlib'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compressor(self):
+        return zlib.compressobj(self.level)
+
+    def decompressor(self):
+        return zlib.decompressobj()
+
+
+class ZstdCodec:
+    name = 'zstd'
+
+    def __init__(self, level=3):
+        self.level = level
+
+    def compressor(self):
+        return zstandard.ZstdCompressor(level=self.level).compressobj()
+
+    def decompressor(self):
+        return zstandard.ZstdDecompressor().decompressobj()
+
+
+def get_codec(name):
+    """
+    Returns the codec called name, as recorded on a blob.
+    """
+    if name == 'zstd':
+        if zstandard is None:
+            raise ImproperlyConfigured("Reading zstd-compressed files needs the zstandard package.")
+        return ZstdCodec()
+    if name == 'zlib':
+        return ZlibCodec()
+    raise ValueError(f"Unknown compression codec '{name}'.")
+
+
+def write_codec():
+    """
+    The codec new blobs are compressed with, or None when compression is off.
+
+    FILE_COMPRESSION_CODEC is 'auto' (zstd when installed, zlib otherwise),
+    'zstd', 'zlib' or '' to store everything uncompressed.
+    """
+    name = settings.FILE_COMPRESSION_CODEC
+    if not name:
+        return None
+    if name == 'auto':
+        name = 'zstd' if zstandard is not None else 'zlib'
+    return get_codec(name)
+
+
+def worth_compressing(file_name, sample, codec):
+    """
+    Decides from the file's type and a sample of its content whether to compress.
+
+    Types listed in FILE_COMPRESSION_SKIP_TYPES (images, audio, video,
+    archives...) are already compressed and are skipped outright. Anything else
+    is compressed only if the sample shrinks by at least FILE_COMPRESSION_MIN_RATIO.
+    Returns (decision, reason).
+    """
+    content_type, encoding = mimetypes.guess_type(file_name or '')
+    if encoding or (content_type and content_type.startswith(tuple(settings.FILE_COMPRESSION_SKIP_TYPES))):
+        return False, 'type'
+    if not sample:
+        return False, 'ratio'
+
+    compressor = codec.compressor()
+    compressed = compressor.compress(sample) + compressor.flush()
+    if len(sample) < settings.FILE_COMPRESSION_MIN_RATIO * len(compressed):
+        return False, 'ratio'
+    return True, None
+
+
+def compress_blocks(blocks, codec):
+    """
+    Yields the compressed form of an iterable of byte blocks.
+    """
+    compressor = codec.compressor()
+    for block in blocks:
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def decompress_blocks(blocks, codec):
+    """
+    Yields the decompressed form of an iterable of compressed byte blocks.
+    """
+    decompressor = codec.decompressor()
+    for block in blocks:
+        data = decompressor.decompress(block)
+        if data:
+            yield data
+    yield decompressor.flush()
@@ -0,0 +1,86 @@
+from .encryption import ctr_cipher_at
+
+
+def parse_range(range_header, size):
+    """
+    Parses a single 'bytes=start-end' Range header into an inclusive (start, end) pair.
+
+    Returns None when the header is absent or not a single byte range, in
+    which case the whole file is served. Raises ValueError when the range
+    cannot be satisfied for a file of the given size.
+    """
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+
+    first, _, last = spec.strip().partition('-')
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # Suffix range: the final N bytes
+            suffix = int(last)
+            start, end = max(size - suffix, 0), size - 1 if suffix else -1
+    except ValueError:
+        return None
+
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable.")
+    return start, min(end, size - 1)
+
+
+def read_file_range(file_path, block_size, start=0, length=None):
+    """
+    Yields a file, or the length bytes starting at start, one block_size read at a time.
+    """
+    remaining = length
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        while remaining is None or remaining > 0:
+            block = f.read(block_size if remaining is None else min(block_size, remaining))
+            if not block:
+                break
+            if remaining is not None:
+                remaining -= len(block)
+            yield block
+
+
+def ctr_encrypt_stream(file_path, aes_key, aes_nonce, block_size, start=0, length=None):
+    """
+    Yields a file (or the byte range starting at start) encrypted with AES-CTR,
+    one block_size read at a time.
+
+    CTR is a stream mode with no padding or chaining across reads, so memory
+    per request is one block and the first bytes go out immediately. The
+    keystream position is derived from the byte offset, so a range is the
+    exact slice of what the whole-file encryption would have produced.
+    """
+    return ctr_encrypt_blocks(read_file_range(file_path, block_size, start, length), aes_key, aes_nonce, start)
+
+
+def ctr_encrypt_blocks(blocks, aes_key, aes_nonce, start=0):
+    """
+    Yields plaintext blocks that begin at byte start of a file encrypted with AES-CTR.
+    """
+    encryptor = ctr_cipher_at(aes_key, aes_nonce, start)
+    for block in blocks:
+        yield encryptor.update(block)
+    yield encryptor.finalize()
+
+
+def slice_blocks(blocks, start, length):
+    """
+    Yields the length bytes (or the rest) from byte start of an iterable of blocks.
+    """
+    position = 0
+    end = None if length is None else start + length
+    for block in blocks:
+        block_start, position = position, position + len(block)
+        if position <= start:
+            continue
+        if end is not None and block_start >= end:
+            break
+        yield block[max(start - block_start, 0):None if end is None else end - block_start]
@@ -0,0 +1,56 @@
+import os
+
+from django.conf import settings
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.keywrap import aes_key_wrap, aes_key_unwrap
+
+AES_BLOCK_BYTES = algorithms.AES.block_size // 8
+
+
+def new_data_key():
+    """
+    Returns a fresh 256-bit key and an initial counter block for AES-CTR.
+
+    The low 64 bits of the counter block start at zero, so clients that only
+    increment a 64-bit counter (WebCrypto's AES-CTR 'length: 64') stay in step.
+    """
+    return os.urandom(32), os.urandom(8) + bytes(8)
+
+
+def _key_encryption_key():
+    return bytes.fromhex(settings.FILE_KEY_ENCRYPTION_KEY)
+
+
+def wrap_key(data_key):
+    """
+    Wraps a per-file data key with the server's key-encryption key (RFC 3394).
+    """
+    return aes_key_wrap(_key_encryption_key(), data_key)
+
+
+def unwrap_key(wrapped_key):
+    """
+    Recovers a per-file data key wrapped by wrap_key.
+    """
+    return aes_key_unwrap(_key_encryption_key(), bytes(wrapped_key))
+
+
+def ctr_cipher_at(aes_key, aes_nonce, offset):
+    """
+    Returns an AES-CTR encryptor positioned at a byte offset of the stream that
+    starts at the aes_nonce counter block. Encryption and decryption are the same
+    operation in CTR, so this serves both directions.
+    """
+    counter = (int.from_bytes(aes_nonce, 'big') + offset // AES_BLOCK_BYTES) % (1 << 128)
+    cipher = Cipher(algorithms.AES(aes_key), modes.CTR(counter.to_bytes(16, 'big'))).encryptor()
+    # Burn the keystream bytes that precede offset within its AES block
+    cipher.update(bytes(offset % AES_BLOCK_BYTES))
+    return cipher
+
+
+def ctr_transform(aes_key, aes_nonce, offset, data):
+    """
+    Encrypts or decrypts data that sits at offset in an AES-CTR stream.
+    """
+    return ctr_cipher_at(aes_key, aes_nonce, offset).update(data)
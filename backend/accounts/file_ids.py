@@ -0,0 +1,64 @@
+import base64
+from functools import lru_cache
+
+from django.conf import settings
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+# An encoded ID is one AES block: the 8-byte file ID followed by 8 zero bytes.
+# The zero half is checked on decode, so a guessed token has a 2**-64 chance of
+# naming any file at all.
+_CHECK_BYTES = bytes(8)
+
+
+@lru_cache(maxsize=None)
+def _cipher(key_hex):
+    return Cipher(algorithms.AES(bytes.fromhex(key_hex)), modes.ECB())
+
+
+@lru_cache(maxsize=65536)
+def _encode(file_id, key_id, key_hex):
+    encryptor = _cipher(key_hex).encryptor()
+    block = encryptor.update(file_id.to_bytes(8, 'big') + _CHECK_BYTES) + encryptor.finalize()
+    return f"{key_id}.{base64.urlsafe_b64encode(block).rstrip(b'=').decode()}"
+
+
+@lru_cache(maxsize=65536)
+def _decode(token, key_hex):
+    block = base64.urlsafe_b64decode(token + '==')
+    if len(block) != 16:
+        raise ValueError("Malformed file ID.")
+    decryptor = _cipher(key_hex).decryptor()
+    plain = decryptor.update(block) + decryptor.finalize()
+    if plain[8:] != _CHECK_BYTES:
+        raise ValueError("Malformed file ID.")
+    return int.from_bytes(plain[:8], 'big')
+
+
+def encode_file_id(file_id):
+    """
+    Turns a file's primary key into the opaque ID used in URLs.
+
+    The encoding is a single AES block under the active key in FILE_ID_KEYS,
+    so it is deterministic, identical on every worker and cached per ID.
+    """
+    key_id = settings.FILE_ID_ACTIVE_KEY
+    return _encode(int(file_id), key_id, settings.FILE_ID_KEYS[key_id])
+
+
+def decode_file_id(encoded_id):
+    """
+    Recovers a file's primary key from an ID made by encode_file_id.
+
+    IDs carry the name of the key that produced them, so IDs issued before a
+    rotation keep working as long as their key stays in FILE_ID_KEYS. Raises
+    ValueError for anything that is not a valid ID.
+    """
+    key_id, _, token = encoded_id.partition('.')
+    key_hex = settings.FILE_ID_KEYS.get(key_id)
+    if not key_hex or not token:
+        raise ValueError("Unknown or malformed file ID.")
+    try:
+        return _decode(token, key_hex)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Malformed file ID.") from e
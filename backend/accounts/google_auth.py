@@ -0,0 +1,81 @@
+import re
+import threading
+import time
+from functools import lru_cache
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from google.auth import jwt
+
+# Google ID tokens are verified locally against Google's signing certificates,
+# which are kept in the default cache for as long as Google's Cache-Control
+# allows. Refreshes are single-flight: while one thread fetches, the others in
+# the process wait for its result instead of fetching too.
+
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+_CACHE_KEY = 'google-oauth-certs'
+_refresh_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _session():
+    # One pooled session per process, so refreshes reuse the TLS connection
+    return requests.Session()
+
+
+def _max_age(response):
+    """
+    Seconds the certificates may be cached: Cache-Control max-age less the
+    Age they already had, or GOOGLE_CERTS_DEFAULT_MAX_AGE without a max-age.
+    """
+    match = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+    if not match:
+        return settings.GOOGLE_CERTS_DEFAULT_MAX_AGE
+    return max(int(match.group(1)) - int(response.headers.get('Age', 0)), 0)
+
+
+def _fetch_certs():
+    response = _session().get(settings.GOOGLE_OAUTH_CERTS_URL, timeout=settings.GOOGLE_CERTS_TIMEOUT)
+    response.raise_for_status()
+    entry = {'certs': response.json(), 'fetched_at': time.time()}
+    max_age = _max_age(response)
+    if max_age:
+        cache.set(_CACHE_KEY, entry, max_age)
+    return entry['certs']
+
+
+def google_certs(key_id=None):
+    """
+    Returns Google's signing certificates as {key id: x509 PEM}, fetching
+    them if the cached set has expired or lacks key_id. Raises
+    requests.RequestException when they cannot be fetched.
+    """
+    entry = cache.get(_CACHE_KEY)
+    if entry is not None and (key_id is None or key_id in entry['certs']):
+        return entry['certs']
+
+    with _refresh_lock:
+        # Another thread may have refreshed them while this one waited
+        entry = cache.get(_CACHE_KEY)
+        if entry is not None:
+            if key_id is None or key_id in entry['certs']:
+                return entry['certs']
+            # An unknown key ID may be a newly rotated key, or a forged one:
+            # refetch for it at most once per GOOGLE_CERTS_MIN_REFRESH seconds
+            if time.time() - entry['fetched_at'] < settings.GOOGLE_CERTS_MIN_REFRESH:
+                return entry['certs']
+        return _fetch_certs()
+
+
+def verify_google_id_token(token, audience):
+    """
+    Verifies a Google ID token issued for audience and returns its claims.
+    Raises ValueError if the token is malformed, forged, expired or not
+    issued by Google.
+    """
+    key_id = jwt.decode_header(token).get('kid')
+    id_info = jwt.decode(token, certs=google_certs(key_id), audience=audience)
+    if id_info.get('iss') not in GOOGLE_ISSUERS:
+        raise ValueError(f"Wrong issuer '{id_info.get('iss')}'.")
+    return id_info
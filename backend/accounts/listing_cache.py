@@ -0,0 +1,107 @@
+import hashlib
+import math
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+
+# Listing scopes, each versioned by its own generation counter
+UPLOADED_FILES = 'uploads'  # files uploaded by a user
+SHARED_WITH_USER = 'shared-with'  # files shared with a user
+FILE_SHARES = 'shares'  # users a file is shared with
+
+
+def _generation_key(scope, scope_id):
+    return f"listing-gen:{scope}:{scope_id}"
+
+
+def _new_generation():
+    # Random rather than 1, so a counter lost to eviction never reuses an old ETag
+    return secrets.randbits(48)
+
+
+def generation(scope, scope_id):
+    """
+    Returns the current generation of a listing, starting one if there is none.
+    """
+    key = _generation_key(scope, scope_id)
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, _new_generation(), None)
+        value = cache.get(key)
+    return value
+
+
+def bump(scope, scope_ids):
+    """
+    Moves listings to a new generation, orphaning their cached pages and ETags.
+    """
+    for scope_id in set(scope_ids):
+        try:
+            cache.incr(_generation_key(scope, scope_id))
+        except ValueError:
+            cache.set(_generation_key(scope, scope_id), _new_generation(), None)
+
+
+def bump_share_listings(file_id, user_ids):
+    """
+    Invalidates the listings affected by creating, changing or revoking shares
+    of file_id with user_ids.
+    """
+    bump(FILE_SHARES, [file_id])
+    bump(SHARED_WITH_USER, user_ids)
+
+
+def earliest_expiry(rows):
+    """
+    The earliest expiration_time among listing rows, or None when none expires.
+    """
+    return min((row["expiration_time"] for row in rows if row["expiration_time"]), default=None)
+
+
+def cached_listing(request, scope, scope_id, build):
+    """
+    Serves a JSON listing from the cache, building it with build() on a miss.
+
+    Pages are cached under the listing's generation and query string, and
+    their ETag also covers the content, so a client holding the current
+    version gets a 304 after two cache lookups. A listing of shares sets
+    valid_until on the response build() returns to the earliest expiry among
+    them, and is only cached until then: once a share expires, the page is
+    built again without it under a new ETag. Only 200 responses are cached;
+    errors from build() are returned as they are.
+    """
+    query = request.GET.urlencode()
+    version = hashlib.sha256(f"{scope}:{scope_id}:{generation(scope, scope_id)}:{query}".encode()).hexdigest()
+    key = f"listing:{version}"
+
+    entry = cache.get(key)
+    if entry is None:
+        response = build()
+        if response.status_code != 200:
+            return response
+        body = response.content
+        etag = f'"{hashlib.sha256(version.encode() + body).hexdigest()[:32]}"'
+        timeout = settings.FILE_LISTING_CACHE_TIMEOUT
+        valid_until = getattr(response, 'valid_until', None)
+        if valid_until is not None:
+            timeout = min(timeout, math.floor((valid_until - timezone.now()).total_seconds()))
+        if timeout > 0:
+            cache.set(key, (body, etag), timeout)
+    else:
+        body, etag = entry
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+
+    response['ETag'] = etag
+    # Listings are per user: browsers may keep them but must revalidate
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
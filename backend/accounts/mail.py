@@ -0,0 +1,95 @@
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+# Views queue their emails in the database instead of talking to the SMTP
+# server, so a request never waits on the mail server. The send_queued_mail
+# command sends the queue in batches over one SMTP connection and retries
+# failed messages with exponential backoff.
+
+
+def queue_mail(subject, body, recipients, from_email=None):
+    """
+    Queues an email for the send_queued_mail command; a drop-in for send_mail.
+    """
+    return OutboundEmail.objects.create(
+        subject=subject, body=body, recipients=list(recipients), from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+    )
+
+
+def retry_delay(attempts):
+    """
+    How long to wait before the next try of a message that has failed attempts times.
+    """
+    delay = settings.MAIL_QUEUE_RETRY_DELAY * 2 ** (attempts - 1)
+    return min(delay, settings.MAIL_QUEUE_MAX_RETRY_DELAY)
+
+
+def _claim_batch(batch_size):
+    """
+    Returns up to batch_size due messages, leased for MAIL_QUEUE_LEASE so
+    that concurrent senders skip them.
+    """
+    current_time = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(next_attempt_at__lte=current_time)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        OutboundEmail.objects.filter(id__in=[message.id for message in batch]).update(
+            next_attempt_at=current_time + settings.MAIL_QUEUE_LEASE,
+        )
+    return batch
+
+
+def _record_failure(message, error):
+    message.attempts += 1
+    message.last_error = str(error)
+    if message.attempts >= settings.MAIL_QUEUE_MAX_ATTEMPTS:
+        message.next_attempt_at = None
+        logger.error(f"Giving up on email {message.id} after {message.attempts} attempts: {error}")
+    else:
+        message.next_attempt_at = timezone.now() + retry_delay(message.attempts)
+    message.save(update_fields=['attempts', 'last_error', 'next_attempt_at'])
+    metrics.increment('mail.failed')
+
+
+def send_queued_mail(batch_size=None):
+    """
+    Sends every due message, batch_size at a time, over a single connection
+    to the email backend. Returns (sent, failed).
+    """
+    batch_size = batch_size or settings.MAIL_QUEUE_BATCH_SIZE
+    sent = failed = 0
+    connection = get_connection()
+    try:
+        while batch := _claim_batch(batch_size):
+            for message in batch:
+                email = EmailMessage(
+                    message.subject, message.body, message.from_email, message.recipients, connection=connection,
+                )
+                try:
+                    # Connects on first use; later messages reuse the open connection
+                    connection.open()
+                    email.send()
+                except Exception as e:
+                    _record_failure(message, e)
+                    failed += 1
+                    # Start afresh in case the server dropped the connection
+                    connection.close()
+                else:
+                    message.delete()
+                    metrics.increment('mail.sent')
+                    sent += 1
+    finally:
+        connection.close()
+    return sent, failed
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import time
+
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from django.core.management.base import BaseCommand
+
+from accounts.cipher_suites import CIPHER_SUITES, measure_throughput, suite_ranking
+from accounts.encryption import new_data_key
+from accounts.parallel_crypto import crypto_threads, ctr_transform_parallel
+from accounts.uploads import decrypt_stream_to_file
+
+
+class Command(BaseCommand):
+    help = "Measures whole-file crypto throughput with 1 to N threads, and the throughput of each transfer cipher suite."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=256, help="Payload size in MiB (default 256).")
+        parser.add_argument('--threads', type=int, nargs='+', help="Thread counts to try (default 1, 2, 4... up to the core count).")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per measurement; the best is reported.")
+
+    def handle(self, *args, **options):
+        size = options['size'] * 1024 * 1024
+        thread_counts = options['threads'] or self._default_thread_counts()
+        data = os.urandom(size)
+        key, nonce = new_data_key()
+        aes_key, aes_iv = os.urandom(32), os.urandom(16)
+        ciphertext = self._cbc_encrypt(aes_key, aes_iv, data)
+
+        workdir = tempfile.mkdtemp()
+        part_path = os.path.join(workdir, 'benchmark.part')
+
+        benchmarks = {
+            'ctr': lambda threads: ctr_transform_parallel(key, nonce, 0, data, threads),
+            # Upload ingest: CBC decryption, CTR re-encryption and the file write
+            'upload': lambda threads: decrypt_stream_to_file(aes_key, aes_iv, [ciphertext], part_path, key, nonce, threads),
+        }
+        self.stdout.write(f"{options['size']} MiB payload, {os.cpu_count()} cores")
+        try:
+            for name, run in benchmarks.items():
+                baseline = None
+                for threads in thread_counts:
+                    seconds = min(self._time(run, threads) for _ in range(options['repeat']))
+                    baseline = baseline or seconds
+                    self.stdout.write(
+                        f"{name:>6} x{threads:<3} {size / seconds / 1e6:9.0f} MB/s  speedup {baseline / seconds:5.2f}"
+                    )
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            os.rmdir(workdir)
+
+        # Transfer cipher suites on one thread; CIPHER_SUITES sets the server's preference
+        self.stdout.write("Cipher suites (one thread):")
+        for name, suite in CIPHER_SUITES.items():
+            throughput = measure_throughput(suite, min(size, 64 * 1024 * 1024), options['repeat'])
+            self.stdout.write(f"{name:>26} {throughput / 1e6:9.0f} MB/s")
+        self.stdout.write(f"Server preference: {', '.join(suite_ranking())}")
+
+    @staticmethod
+    def _default_thread_counts():
+        counts = [1]
+        while counts[-1] * 2 <= crypto_threads():
+            counts.append(counts[-1] * 2)
+        if counts[-1] != crypto_threads():
+            counts.append(crypto_threads())
+        return counts
+
+    @staticmethod
+    def _cbc_encrypt(aes_key, aes_iv, data):
+        padder = padding.PKCS7(algorithms.AES.block_size).padder()
+        encryptor = Cipher(algorithms.AES(aes_key), modes.CBC(aes_iv)).encryptor()
+        return encryptor.update(padder.update(data) + padder.finalize()) + encryptor.finalize()
+
+    @staticmethod
+    def _time(run, threads):
+        start = time.perf_counter()
+        run(threads)
+        return time.perf_counter() - start
@@ -0,0 +1,45 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts.blobs import stored_blob
+from accounts.downloads import ctr_encrypt_stream
+from accounts.encryption import new_data_key
+from accounts.models import UploadedFile
+from accounts.storage import upload_part_path
+
+
+class Command(BaseCommand):
+    help = "Encrypts files that were stored in plaintext and moves them into the blob store."
+
+    def handle(self, *args, **options):
+        converted = 0
+        for uploaded_file in UploadedFile.objects.filter(encrypted=False).iterator():
+            source_path = uploaded_file.file.path
+            if not os.path.exists(source_path):
+                self.stderr.write(f"Skipping {uploaded_file.id}: {source_path} is missing.")
+                continue
+
+            data_key, data_nonce = new_data_key()
+            part_path = upload_part_path()
+            os.makedirs(os.path.dirname(part_path), exist_ok=True)
+
+            with open(part_path, 'wb') as f:
+                for block in ctr_encrypt_stream(source_path, data_key, data_nonce, settings.DOWNLOAD_BLOCK_SIZE):
+                    f.write(block)
+
+            with stored_blob(part_path, data_key, data_nonce, uploaded_file.file_name) as blob:
+                UploadedFile.objects.filter(id=uploaded_file.id).update(
+                    file=blob.name,
+                    encrypted=True,
+                    blob=blob,
+                    data_key=None,
+                    data_nonce=None,
+                )
+            # Other rows may still name the same path after an overwrite
+            if not UploadedFile.objects.filter(file=uploaded_file.file.name, blob__isnull=True).exists():
+                os.remove(source_path)
+            converted += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Encrypted {converted} file(s) at rest."))
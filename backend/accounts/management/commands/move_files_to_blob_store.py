@@ -0,0 +1,41 @@
+import os
+import shutil
+
+from django.core.management.base import BaseCommand
+
+from accounts.blobs import stored_blob
+from accounts.encryption import unwrap_key
+from accounts.models import UploadedFile
+from accounts.storage import upload_part_path
+
+
+class Command(BaseCommand):
+    help = "Moves files encrypted at rest under their own keys into the deduplicated blob store."
+
+    def handle(self, *args, **options):
+        moved = 0
+        for uploaded_file in UploadedFile.objects.filter(encrypted=True, blob__isnull=True).iterator():
+            source_path = uploaded_file.file.path
+            if not os.path.exists(source_path):
+                self.stderr.write(f"Skipping {uploaded_file.id}: {source_path} is missing.")
+                continue
+
+            # stored_blob consumes its input, and other rows may still name the same path
+            part_path = upload_part_path()
+            os.makedirs(os.path.dirname(part_path), exist_ok=True)
+            shutil.copyfile(source_path, part_path)
+
+            with stored_blob(
+                part_path, unwrap_key(uploaded_file.data_key), bytes(uploaded_file.data_nonce), uploaded_file.file_name,
+            ) as blob:
+                UploadedFile.objects.filter(id=uploaded_file.id).update(
+                    file=blob.name,
+                    blob=blob,
+                    data_key=None,
+                    data_nonce=None,
+                )
+            if not UploadedFile.objects.filter(file=uploaded_file.file.name, blob__isnull=True).exists():
+                os.remove(source_path)
+            moved += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} file(s) into the blob store."))
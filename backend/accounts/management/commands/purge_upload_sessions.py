@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from accounts.uploads import purge_upload_sessions
+
+
+class Command(BaseCommand):
+    help = "Deletes expired or abandoned upload sessions and their part files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Sessions deleted per statement (default 1000).")
+
+    def handle(self, *args, **options):
+        sessions, files = purge_upload_sessions(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {sessions} upload session(s) and {files} part file(s)."))
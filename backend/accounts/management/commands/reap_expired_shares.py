@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.sharing import reap_expired_shares
+
+
+class Command(BaseCommand):
+    help = "Deletes expired shares in small batches, keeping locks short."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Shares deleted per transaction (default 1000).")
+        parser.add_argument('--loop', action='store_true', help="Keep running, reaping every --interval seconds.")
+        parser.add_argument('--interval', type=float, default=60, help="Seconds between runs with --loop (default 60).")
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = reap_expired_shares(options['batch_size'])
+            if deleted or not options['loop']:
+                self.stdout.write(f"Deleted {deleted} expired share(s).")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
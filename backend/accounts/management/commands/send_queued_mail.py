@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.mail import send_queued_mail
+
+
+class Command(BaseCommand):
+    help = "Sends queued emails over one SMTP connection, retrying failed ones with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help="Messages claimed at a time (default MAIL_QUEUE_BATCH_SIZE).")
+        parser.add_argument('--loop', action='store_true', help="Keep running, checking the queue every --interval seconds.")
+        parser.add_argument('--interval', type=float, default=2, help="Seconds between checks with --loop (default 2).")
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_queued_mail(options['batch_size'])
+            if sent or failed or not options['loop']:
+                self.stdout.write(f"Sent {sent} email(s), {failed} failed.")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
+
+from accounts import metrics
+from accounts.models import Blob
+
+COMPRESSION_COUNTERS = [
+    'compression.files', 'compression.bytes_in', 'compression.bytes_out',
+    'compression.skipped_type', 'compression.skipped_ratio',
+]
+
+
+class Command(BaseCommand):
+    help = "Reports blob store usage and the bytes saved by compression."
+
+    def handle(self, *args, **options):
+        rows = Blob.objects.values('codec').annotate(
+            blobs=Count('id'),
+            plaintext_bytes=Coalesce(Sum('size'), 0),
+            stored_bytes=Coalesce(Sum(Coalesce('stored_size', F('size'))), 0),
+        ).order_by('codec')
+
+        total_size = total_stored = 0
+        for row in rows:
+            total_size += row['plaintext_bytes']
+            total_stored += row['stored_bytes']
+            self.stdout.write(
+                f"{row['codec'] or 'none':>6}: {row['blobs']} blob(s), {row['plaintext_bytes']} bytes stored as {row['stored_bytes']}"
+            )
+        saved = total_size - total_stored
+        ratio = total_size / total_stored if total_stored else 1
+        self.stdout.write(f" total: {total_size} bytes stored as {total_stored}, {saved} saved ({ratio:.2f}x)")
+
+        # Counters since the cache was last cleared, from this process or the shared cache
+        for name, value in metrics.snapshot(COMPRESSION_COUNTERS).items():
+            self.stdout.write(f"{name}: {value}")
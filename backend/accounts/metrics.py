@@ -0,0 +1,30 @@
+from django.core.cache import cache
+
+# Counters live in the default cache, so they are per process with the local
+# memory cache and shared by every worker with a shared cache backend.
+_KEY_PREFIX = 'metrics:'
+
+
+def increment(name, value=1):
+    """
+    Adds value to the counter called name.
+    """
+    key = _KEY_PREFIX + name
+    try:
+        cache.incr(key, value)
+    except ValueError:
+        # First use, or the counter was evicted; a racing add keeps the other value
+        if not cache.add(key, value, None):
+            cache.incr(key, value)
+
+
+def get(name):
+    return cache.get(_KEY_PREFIX + name, 0)
+
+
+def snapshot(names):
+    """
+    Returns {name: value} for the given counters.
+    """
+    values = cache.get_many([_KEY_PREFIX + name for name in names])
+    return {name: values.get(_KEY_PREFIX + name, 0) for name in names}
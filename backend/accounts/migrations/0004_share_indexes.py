@@ -0,0 +1,60 @@
+# Generated by Django 4.2.18 on 2026-10-18 18:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def remove_duplicate_shares(apps, schema_editor):
+    """
+    Keeps only the most recent share of each (file, shared_with) pair so the
+    uniqueness constraint can be added.
+    """
+    SharedFile = apps.get_model('accounts', 'SharedFile')
+    duplicates = (
+        SharedFile.objects.values('file_id', 'shared_with_id')
+        .annotate(latest_id=models.Max('id'), count=models.Count('id'))
+        .filter(count__gt=1)
+    )
+    for row in duplicates:
+        SharedFile.objects.filter(
+            file_id=row['file_id'], shared_with_id=row['shared_with_id']
+        ).exclude(id=row['latest_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_file_data_keys'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sharedfile',
+            name='file',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='shared_files', to='accounts.uploadedfile'),
+        ),
+        migrations.AlterField(
+            model_name='sharedfile',
+            name='shared_with',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='shared_files', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='uploadedfile',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='uploaded_files', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='sharedfile',
+            index=models.Index(fields=['shared_with', 'expiration_time'], name='share_recipient_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['user', 'uploaded_at'], name='upload_owner_date_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_shares, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='sharedfile',
+            constraint=models.UniqueConstraint(fields=('file', 'shared_with'), name='share_file_recipient_uniq'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.18 on 2026-10-18 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_share_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sharedfile',
+            index=models.Index(fields=['shared_with', 'id'], name='share_recipient_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['user', 'file_name'], name='upload_owner_name_idx'),
+        ),
+    ]
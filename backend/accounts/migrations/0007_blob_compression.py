@@ -0,0 +1,23 @@
+# Generated by Django 4.2.18 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_blob_store'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='codec',
+            field=models.CharField(blank=True, default='', max_length=8),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='stored_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.2.18 on 2026-10-18 19:26
+
+import hashlib
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def move_tokens(apps, schema_editor):
+    """
+    Moves outstanding verification and reset tokens off the user table,
+    storing their hashes.
+    """
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    OneTimeToken = apps.get_model('accounts', 'OneTimeToken')
+    for token_field, expiry_field, purpose in (
+        ('email_verification_code', 'email_verification_expiry', 'verify_email'),
+        ('password_reset_token', 'password_reset_expiry', 'reset_password'),
+    ):
+        users = CustomUser.objects.filter(
+            **{f'{token_field}__isnull': False, f'{expiry_field}__isnull': False},
+        ).values_list('id', token_field, expiry_field)
+        OneTimeToken.objects.bulk_create(
+            [
+                OneTimeToken(
+                    user_id=user_id, purpose=purpose, token_hash=hashlib.sha256(token.encode()).hexdigest(),
+                    expires_at=expires_at,
+                )
+                for user_id, token, expires_at in users.iterator() if token
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_outbound_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OneTimeToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('purpose', models.CharField(choices=[('verify_email', 'Email verification'), ('reset_password', 'Password reset')], max_length=16)),
+                ('token_hash', models.CharField(max_length=64, unique=True)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='one_time_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'purpose'], name='onetime_token_user_idx'), models.Index(fields=['expires_at'], name='onetime_token_expiry_idx')],
+            },
+        ),
+        migrations.RunPython(move_tokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='customuser',
+            name='email_verification_code',
+        ),
+        migrations.RemoveField(
+            model_name='customuser',
+            name='email_verification_expiry',
+        ),
+        migrations.RemoveField(
+            model_name='customuser',
+            name='password_reset_expiry',
+        ),
+        migrations.RemoveField(
+            model_name='customuser',
+            name='password_reset_token',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.18 on 2026-10-18 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_one_time_tokens'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sharedfile',
+            index=models.Index(fields=['expiration_time'], name='share_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.18 on 2026-10-18 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_share_expiry_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='storage_name',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
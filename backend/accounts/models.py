@@ -1,11 +1,16 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils.timezone import now
 import pyotp
 
+from .storage import upload_part_path
+
 class CustomUser(AbstractUser):
     """
-    Custom User model with roles, MFA, email verification, and password reset support.
+    Custom User model with roles and MFA. Email verification and password
+    reset tokens are OneTimeTokens.
     """
     USER_ROLE_CHOICES = (
         ('admin', 'Admin'),
@@ -14,39 +19,108 @@ class CustomUser(AbstractUser):
     )
     role = models.CharField(max_length=10, choices=USER_ROLE_CHOICES, default='guest')
     mfa_secret = models.CharField(max_length=16, default=pyotp.random_base32)
-    email_verification_code = models.CharField(max_length=64, blank=True, null=True)
-    email_verification_expiry = models.DateTimeField(blank=True, null=True)
-    password_reset_token = models.CharField(max_length=64, blank=True, null=True)
-    password_reset_expiry = models.DateTimeField(blank=True, null=True)
     def __str__(self):
         return self.username
     
 
+class Blob(models.Model):
+    """
+    File content stored once per distinct SHA-256, encrypted at rest under its own
+    data key and shared by every UploadedFile with that content.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.PositiveBigIntegerField()  # Plaintext size
+    codec = models.CharField(max_length=8, blank=True, default='')  # Compression codec, '' for none
+    stored_size = models.PositiveBigIntegerField(blank=True, null=True)  # Size after compression
+    data_key = models.BinaryField()  # AES key of the stored bytes, wrapped with FILE_KEY_ENCRYPTION_KEY
+    data_nonce = models.BinaryField()  # AES-CTR initial counter block
+    refcount = models.PositiveIntegerField(default=0)  # UploadedFile rows pointing here
+    # Key in BLOB_STORAGE, the hash plus a random suffix; blank for older blobs,
+    # which are stored under their hash alone
+    storage_name = models.CharField(max_length=100, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+    @property
+    def name(self):
+        """
+        The blob's key in the configured BLOB_STORAGE backend.
+        """
+        # Two levels of fan-out keep every directory small at millions of blobs
+        return self.storage_name or f"{self.sha256[:2]}/{self.sha256[2:4]}/{self.sha256}"
+
+
 class UploadedFile(models.Model):
     """
     Model to handle uploaded files with optional encryption.
     """
-    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='uploaded_files')
+    # Indexed through owner_date_idx below
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='uploaded_files', db_index=False)
     file = models.FileField(upload_to='uploaded_files/')
     file_name = models.CharField(max_length=255)
     encrypted = models.BooleanField(default=True)
+    # Content and key for new uploads, whose file field holds the blob's name;
+    # data_key and data_nonce below are only used by files stored before the blob store
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, related_name='files', blank=True, null=True)
+    data_key = models.BinaryField(blank=True, null=True)  # Per-file AES key, wrapped with FILE_KEY_ENCRYPTION_KEY
+    data_nonce = models.BinaryField(blank=True, null=True)  # AES-CTR initial counter block
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # A user's files in upload order
+            models.Index(fields=['user', 'uploaded_at'], name='upload_owner_date_idx'),
+            # A user's files by name, for name-prefix filters and name ordering
+            models.Index(fields=['user', 'file_name'], name='upload_owner_name_idx'),
+        ]
+
     def __str__(self):
         return f"{self.file_name} uploaded by {self.user.username}"
 
+    @property
+    def wrapped_key(self):
+        """
+        The wrapped at-rest data key, from the blob for deduplicated files.
+        """
+        return self.blob.data_key if self.blob_id else self.data_key
+
+    @property
+    def key_nonce(self):
+        """
+        The at-rest AES-CTR initial counter block, from the blob for deduplicated files.
+        """
+        return bytes(self.blob.data_nonce if self.blob_id else self.data_nonce)
+
 class SharedFile(models.Model):
     """
     Model to manage file sharing between users with permissions and time restrictions.
     """
-    file = models.ForeignKey(UploadedFile, on_delete=models.CASCADE, related_name='shared_files')
-    shared_with = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='shared_files')
+    # Both indexed through the composite index and constraint below
+    file = models.ForeignKey(UploadedFile, on_delete=models.CASCADE, related_name='shared_files', db_index=False)
+    shared_with = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='shared_files', db_index=False)
     owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='owned_files')
     view_permission = models.BooleanField(default=False)
     download_permission = models.BooleanField(default=False)
     share_link = models.CharField(max_length=512, blank=True, null=True)
     expiration_time = models.DateTimeField(blank=True, null=True)
 
+    class Meta:
+        constraints = [
+            # One share per (file, recipient); also the index for permission checks,
+            # permission updates and revocations
+            models.UniqueConstraint(fields=['file', 'shared_with'], name='share_file_recipient_uniq'),
+        ]
+        indexes = [
+            # Files shared with a user, optionally restricted to unexpired shares
+            models.Index(fields=['shared_with', 'expiration_time'], name='share_recipient_expiry_idx'),
+            # Files shared with a user in the order they were shared
+            models.Index(fields=['shared_with', 'id'], name='share_recipient_order_idx'),
+            # Expired shares, oldest first, for reap_expired_shares
+            models.Index(fields=['expiration_time'], name='share_expiry_idx'),
+        ]
+
     def __str__(self):
         return f"Shared {self.file.file_name} with {self.shared_with.username}"
 
@@ -55,3 +129,84 @@ class SharedFile(models.Model):
         Check if the shared link is still valid based on the expiration time.
         """
         return self.expiration_time is None or now() < self.expiration_time
+
+
+class UploadSession(models.Model):
+    """
+    Model to track a resumable, chunked upload until it is committed as an UploadedFile.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='upload_sessions')
+    file_name = models.CharField(max_length=255)
+    aes_key = models.CharField(max_length=64)
+    next_iv = models.CharField(max_length=32)
+    data_key = models.BinaryField()
+    data_nonce = models.BinaryField()
+    next_chunk = models.PositiveIntegerField(default=0)
+    received_bytes = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Upload of {self.file_name} by {self.user.username}"
+
+    @property
+    def part_path(self):
+        return upload_part_path(self.id)
+
+    def is_expired(self):
+        return now() >= self.expires_at
+
+
+class OutboundEmail(models.Model):
+    """
+    An email waiting to be sent by the send_queued_mail command.
+    """
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField()
+    attempts = models.PositiveIntegerField(default=0)
+    # When the message is next due; None once MAIL_QUEUE_MAX_ATTEMPTS have failed
+    next_attempt_at = models.DateTimeField(default=now, blank=True, null=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Due messages, oldest first
+            models.Index(fields=['next_attempt_at'], name='outbound_email_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.recipients)}"
+
+
+class OneTimeToken(models.Model):
+    """
+    A single-use token emailed to a user, stored as the SHA-256 of the token
+    so the table never holds a usable link.
+    """
+    VERIFY_EMAIL = 'verify_email'
+    RESET_PASSWORD = 'reset_password'
+    PURPOSE_CHOICES = (
+        (VERIFY_EMAIL, 'Email verification'),
+        (RESET_PASSWORD, 'Password reset'),
+    )
+    # Indexed through onetime_token_user_idx below
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='one_time_tokens', db_index=False)
+    purpose = models.CharField(max_length=16, choices=PURPOSE_CHOICES)
+    token_hash = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # A user's tokens of one purpose, replaced when a new one is issued
+            models.Index(fields=['user', 'purpose'], name='onetime_token_user_idx'),
+            # Expired tokens, for purge_expired_tokens
+            models.Index(fields=['expires_at'], name='onetime_token_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_purpose_display()} token for {self.user.username}"
@@ -0,0 +1,59 @@
+import hashlib
+from secrets import token_urlsafe
+
+from django.utils import timezone
+
+from .models import OneTimeToken
+
+# Email verification and password reset links carry a random token. Only its
+# SHA-256 is stored, under a unique index, so a click is one index lookup and
+# a leaked table yields no usable links.
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue_token(user, purpose, lifetime):
+    """
+    Returns a new token for user, valid for lifetime, replacing any earlier
+    token of the same purpose.
+    """
+    token = token_urlsafe(32)
+    OneTimeToken.objects.filter(user=user, purpose=purpose).delete()
+    OneTimeToken.objects.create(
+        user=user, purpose=purpose, token_hash=hash_token(token), expires_at=timezone.now() + lifetime,
+    )
+    return token
+
+
+def consume_token(token, purpose):
+    """
+    Returns the user of an unexpired token issued for purpose and deletes the
+    token, or returns None. A token is only ever consumed once.
+    """
+    if not token or not isinstance(token, str):
+        return None
+    one_time_token = (
+        OneTimeToken.objects.select_related('user')
+        .filter(token_hash=hash_token(token), purpose=purpose, expires_at__gt=timezone.now())
+        .first()
+    )
+    # Of two concurrent requests with the same token, only one deletes it
+    if one_time_token is None or not OneTimeToken.objects.filter(id=one_time_token.id).delete()[0]:
+        return None
+    return one_time_token.user
+
+
+def purge_expired_tokens(batch_size=1000):
+    """
+    Deletes expired tokens batch_size at a time, keeping each delete short.
+    Returns the number deleted.
+    """
+    deleted = 0
+    cutoff = timezone.now()
+    while True:
+        ids = list(OneTimeToken.objects.filter(expires_at__lte=cutoff).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += OneTimeToken.objects.filter(id__in=ids).delete()[0]
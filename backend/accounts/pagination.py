@@ -0,0 +1,122 @@
+import base64
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidPageRequest(ValueError):
+    """
+    Raised for a malformed cursor, page size, sort or filter value.
+    """
+
+
+def _encode_value(value):
+    # Full isoformat keeps microseconds, which the keyset comparison needs
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps([_encode_value(v) for v in values]).encode()).decode()
+
+
+def decode_cursor(cursor, count):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidPageRequest("Invalid cursor.") from e
+    if not isinstance(values, list) or len(values) != count:
+        raise InvalidPageRequest("Invalid cursor.")
+    return values
+
+
+def _model_field(model, path):
+    # Follows a lookup path such as 'file__uploaded_at' to its model field
+    *relations, name = path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def _cursor_values(queryset, fields, cursor):
+    """
+    Decodes a cursor and converts each value to the type of its sort field, so a
+    forged cursor is rejected here rather than by the database.
+    """
+    values = []
+    for field, value in zip(fields, decode_cursor(cursor, len(fields))):
+        try:
+            if value is None or isinstance(value, (list, dict)):
+                raise ValidationError("Not a sort value.")
+            values.append(_model_field(queryset.model, field).to_python(value))
+        except (ValidationError, TypeError, ValueError) as e:
+            raise InvalidPageRequest("Invalid cursor.") from e
+    return values
+
+
+def page_size_from(params):
+    try:
+        page_size = int(params.get('page_size', settings.FILE_LIST_PAGE_SIZE))
+    except ValueError as e:
+        raise InvalidPageRequest("'page_size' must be an integer.") from e
+    if not 1 <= page_size <= settings.FILE_LIST_MAX_PAGE_SIZE:
+        raise InvalidPageRequest(f"'page_size' must be between 1 and {settings.FILE_LIST_MAX_PAGE_SIZE}.")
+    return page_size
+
+
+def datetime_from(params, name):
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise InvalidPageRequest(f"'{name}' must be an ISO 8601 date and time.")
+    return parsed
+
+
+def keyset_filter(queryset, ordering, cursor):
+    """
+    Restricts queryset to the rows that sort strictly after the cursor.
+    """
+    fields = [field.lstrip('-') for field in ordering]
+    values = _cursor_values(queryset, fields, cursor)
+
+    after = Q()
+    for position, field in enumerate(ordering):
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        step = Q(**{f"{fields[position]}__{lookup}": values[position]})
+        for previous in range(position):
+            step &= Q(**{fields[previous]: values[previous]})
+        after |= step
+
+    # The redundant non-strict bound on the leading field is what lets the
+    # database seek into the index instead of scanning up to the cursor
+    leading = 'lte' if ordering[0].startswith('-') else 'gte'
+    return queryset.filter(after, **{f"{fields[0]}__{leading}": values[0]})
+
+
+def keyset_page(queryset, ordering, cursor, page_size):
+    """
+    Returns (rows, next_cursor) for one page of a .values() queryset.
+
+    ordering lists the sort fields, each optionally prefixed with '-', and must
+    end with a unique field so rows never tie. The cursor holds the sort values
+    of the last row served, and the next page starts strictly after it. With an
+    index matching the filter plus ordering, each page is an index range scan,
+    so its cost does not depend on how many rows come before it.
+    """
+    if cursor:
+        queryset = keyset_filter(queryset, ordering, cursor)
+
+    rows = list(queryset.order_by(*ordering)[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    return rows, encode_cursor([rows[-1][field.lstrip('-')] for field in ordering])
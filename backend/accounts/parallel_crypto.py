@@ -0,0 +1,108 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import lru_cache
+
+from django.conf import settings
+
+from .encryption import ctr_transform
+
+# AES-CTR has no chaining, so a large payload splits into segments that are
+# encrypted independently at their own offsets and joined back in order. The
+# cryptography package releases the GIL while it encrypts, so the segments run
+# on all cores at once.
+
+
+def crypto_threads():
+    """
+    Number of threads for segment crypto: CRYPTO_THREADS, or one per core.
+    """
+    return settings.CRYPTO_THREADS or os.cpu_count() or 1
+
+
+@lru_cache(maxsize=None)
+def _executor(threads):
+    """
+    The crypto thread pool of the given size, created on first use.
+    """
+    return ThreadPoolExecutor(max_workers=threads, thread_name_prefix='crypto')
+
+
+def map_in_order(func, argument_tuples, threads=None):
+    """
+    Yields func(*arguments) for each tuple, computed on a pool of threads
+    (default crypto_threads()) and returned in order.
+
+    Arguments are consumed lazily and at most that many calls are in flight,
+    so memory stays at that many segments however long the input is. With a
+    single thread everything runs inline. Do not call from func: the pool's
+    threads would end up waiting on each other.
+    """
+    threads = threads or crypto_threads()
+    if threads == 1:
+        for arguments in argument_tuples:
+            yield func(*arguments)
+        return
+
+    pending = deque()
+    try:
+        for arguments in argument_tuples:
+            pending.append(_executor(threads).submit(func, *arguments))
+            if len(pending) >= threads:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # On error or early close, let running calls finish before returning,
+        # since they may still be using the caller's resources (open files)
+        for future in pending:
+            future.cancel()
+        wait(pending)
+
+
+def regroup(blocks, size):
+    """
+    Yields the bytes of an iterable of blocks in pieces of exactly size bytes,
+    the last one possibly shorter.
+    """
+    buffer = bytearray()
+    for block in blocks:
+        buffer += block
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield bytes(buffer)
+
+
+def ctr_transform_stream(blocks, aes_key, aes_nonce, start=0):
+    """
+    Encrypts or decrypts a stream of blocks starting at byte start of an
+    AES-CTR stream, CRYPTO_SEGMENT_SIZE bytes per task. Yields the output in
+    segments of that size.
+    """
+    segment_size = settings.CRYPTO_SEGMENT_SIZE
+
+    def arguments():
+        offset = start
+        for segment in regroup(blocks, segment_size):
+            yield aes_key, aes_nonce, offset, segment
+            offset += len(segment)
+
+    return map_in_order(ctr_transform, arguments())
+
+
+def ctr_transform_parallel(aes_key, aes_nonce, offset, data, threads=None):
+    """
+    Parallel equivalent of encryption.ctr_transform for a payload in memory,
+    on the given number of threads (default crypto_threads()).
+    """
+    segment_size = settings.CRYPTO_SEGMENT_SIZE
+    if len(data) <= segment_size:
+        return ctr_transform(aes_key, aes_nonce, offset, data)
+
+    view = memoryview(data)
+    return b''.join(map_in_order(ctr_transform, (
+        (aes_key, aes_nonce, offset + position, view[position:position + segment_size])
+        for position in range(0, len(data), segment_size)
+    ), threads))
@@ -0,0 +1,14 @@
+from rest_framework.renderers import BaseRenderer
+
+
+class OctetStreamRenderer(BaseRenderer):
+    """
+    Lets file endpoints negotiate raw binary bodies alongside JSON.
+    """
+    media_type = 'application/octet-stream'
+    format = 'bin'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
@@ -0,0 +1,226 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .access import invalidate_file_access
+from .file_ids import decode_file_id
+from .listing_cache import bump_share_listings
+from .models import CustomUser, UploadedFile, SharedFile
+
+logger = logging.getLogger(__name__)
+
+SHARE_UPDATE_FIELDS = ['owner', 'view_permission', 'download_permission', 'expiration_time']
+
+
+def _truthy(value):
+    return value in [True, 'true', 'True']
+
+
+def _resolve_items(owner, items):
+    """
+    Decodes the file IDs and usernames of a batch in two queries.
+
+    Returns one dict per item with either 'file_id' and 'user_id' set or an
+    'error' (with an HTTP-style 'code') explaining why the item was rejected.
+    """
+    results = []
+    for index, item in enumerate(items):
+        result = {"index": index}
+        if not isinstance(item, dict):
+            result.update(error="Each item must be an object.", code=400)
+        else:
+            result.update(encrypted_file_id=item.get('encrypted_file_id'), username=item.get('username'))
+            try:
+                result['file_id'] = decode_file_id(str(result['encrypted_file_id'] or ''))
+            except ValueError:
+                result.update(error="Invalid or malformed file ID.", code=400)
+            if not result['username'] and 'error' not in result:
+                result.update(error="Missing 'username'.", code=400)
+        results.append(result)
+
+    pending = [result for result in results if 'error' not in result]
+    owned = set(
+        UploadedFile.objects.filter(user=owner, id__in={r['file_id'] for r in pending}).values_list('id', flat=True)
+    )
+    user_ids = dict(
+        CustomUser.objects.filter(username__in={r['username'] for r in pending}).values_list('username', 'id')
+    )
+
+    seen = set()
+    for result in pending:
+        if result['file_id'] not in owned:
+            result.update(error="File not found or unauthorized.", code=404)
+        elif result['username'] not in user_ids:
+            result.update(error=f"User '{result['username']}' not found.", code=404)
+        else:
+            result['user_id'] = user_ids[result['username']]
+            pair = (result['file_id'], result['user_id'])
+            if pair in seen:
+                result.update(error="Duplicate of an earlier item.", code=400)
+            seen.add(pair)
+    return results
+
+
+def _invalidate(pairs):
+    user_ids_by_file = defaultdict(list)
+    for file_id, user_id in pairs:
+        user_ids_by_file[file_id].append(user_id)
+    for file_id, user_ids in user_ids_by_file.items():
+        invalidate_file_access(file_id, user_ids)
+        bump_share_listings(file_id, user_ids)
+
+
+def _pairs_filter(pairs):
+    # One OR branch per file keeps the statement small and on the unique index
+    user_ids_by_file = defaultdict(list)
+    for file_id, user_id in pairs:
+        user_ids_by_file[file_id].append(user_id)
+    condition = Q(pk__in=[])
+    for file_id, user_ids in user_ids_by_file.items():
+        condition |= Q(file_id=file_id, shared_with_id__in=user_ids)
+    return condition
+
+
+def _public(result):
+    if 'error' in result:
+        result['status'] = "failed"
+    return {key: value for key, value in result.items() if key not in ('file_id', 'user_id')}
+
+
+def bulk_share(owner, items):
+    """
+    Creates or updates the shares described by items, all in one transaction.
+
+    Each item holds encrypted_file_id, username, view_permission,
+    download_permission and expiration (hours, default 24), like share_file.
+    Files and users are resolved in one query each, existing shares are read
+    in one query and all rows are written with a single upsert on the
+    (file, shared_with) unique constraint. Returns one result per item, in order.
+    """
+    results = _resolve_items(owner, items)
+    now = timezone.now()
+    for result, item in zip(results, items):
+        if 'error' in result:
+            continue
+        try:
+            result['expiration'] = now + timedelta(hours=int(item.get('expiration', 24)))
+        except (TypeError, ValueError):
+            result.update(error="Invalid 'expiration' value. Must be an integer.", code=400)
+            continue
+        result['view_permission'] = _truthy(item.get('view_permission', False))
+        result['download_permission'] = _truthy(item.get('download_permission', False))
+
+    accepted = [result for result in results if 'error' not in result]
+    pairs = [(result['file_id'], result['user_id']) for result in accepted]
+    if accepted:
+        with transaction.atomic():
+            existing = set(SharedFile.objects.filter(_pairs_filter(pairs)).values_list('file_id', 'shared_with_id'))
+            SharedFile.objects.bulk_create(
+                [
+                    SharedFile(
+                        file_id=result['file_id'],
+                        shared_with_id=result['user_id'],
+                        owner=owner,
+                        view_permission=result['view_permission'],
+                        download_permission=result['download_permission'],
+                        expiration_time=result['expiration'],
+                    )
+                    for result in accepted
+                ],
+                update_conflicts=True,
+                # MySQL resolves conflicts on any unique key and rejects an explicit target
+                unique_fields=['file', 'shared_with'] if connection.features.supports_update_conflicts_with_target else None,
+                update_fields=SHARE_UPDATE_FIELDS,
+            )
+        _invalidate(pairs)
+
+    for result in accepted:
+        result['status'] = "updated" if (result['file_id'], result['user_id']) in existing else "created"
+        result['expiration'] = result['expiration'].isoformat()
+    return [_public(result) for result in results]
+
+
+def bulk_revoke(owner, items):
+    """
+    Removes the shares named by items ({encrypted_file_id, username}) in one transaction.
+
+    Returns one result per item, in order; items naming a share that does not
+    exist are reported as errors without affecting the rest of the batch.
+    """
+    results = _resolve_items(owner, items)
+    accepted = [result for result in results if 'error' not in result]
+    pairs = [(result['file_id'], result['user_id']) for result in accepted]
+    existing = {}
+    if accepted:
+        with transaction.atomic():
+            existing = {
+                (file_id, user_id): share_id
+                for share_id, file_id, user_id in SharedFile.objects.filter(_pairs_filter(pairs))
+                .select_for_update()
+                .values_list('id', 'file_id', 'shared_with_id')
+            }
+            SharedFile.objects.filter(id__in=existing.values()).delete()
+        _invalidate(existing)
+
+    for result in accepted:
+        if (result['file_id'], result['user_id']) in existing:
+            result['status'] = "revoked"
+        else:
+            result.update(error="No shared record found for this user and file.", code=404)
+    return [_public(result) for result in results]
+
+
+def active_shares():
+    """
+    Shares that have not expired, by the same rule as SharedFile.is_access_allowed.
+    """
+    return SharedFile.objects.filter(Q(expiration_time__isnull=True) | Q(expiration_time__gt=timezone.now()))
+
+
+def reap_expired_shares(batch_size=1000):
+    """
+    Deletes expired shares batch_size at a time, oldest first, each batch in
+    its own short transaction, and invalidates the permissions and listings
+    they appeared in. Returns the number deleted.
+    """
+    deleted = 0
+    cutoff = timezone.now()
+    while True:
+        with transaction.atomic():
+            rows = list(
+                SharedFile.objects.filter(expiration_time__lte=cutoff)
+                .order_by('expiration_time')
+                .values_list('id', 'file_id', 'shared_with_id')[:batch_size]
+            )
+            if not rows:
+                return deleted
+            # A share extended since it was read is no longer expired and stays
+            deleted += SharedFile.objects.filter(
+                id__in=[share_id for share_id, _, _ in rows], expiration_time__lte=cutoff,
+            ).delete()[0]
+        _invalidate([(file_id, user_id) for _, file_id, user_id in rows])
+
+
+def start_share_reaper(interval):
+    """
+    Runs reap_expired_shares every interval seconds on a daemon thread of this process.
+    """
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                reap_expired_shares()
+            except Exception as e:
+                logger.error(f"Error reaping expired shares: {str(e)}")
+            finally:
+                close_old_connections()
+
+    thread = threading.Thread(target=run, name='share-reaper', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,327 @@
+import bisect
+import hashlib
+import os
+import shutil
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .downloads import read_file_range
+
+
+def media_file_path(*parts):
+    """
+    Path of parts under media/, where every stored file lives. Stored file
+    names start with 'media/' and, like FileField names, are resolved against
+    MEDIA_ROOT, which by default is the working directory.
+    """
+    return os.path.join(settings.MEDIA_ROOT, 'media', *parts)
+
+
+def upload_part_path(name=None):
+    """
+    Path of an upload's part file under media/upload_sessions/, named after
+    name or else a fresh UUID.
+    """
+    return media_file_path('upload_sessions', f"{name or uuid.uuid4()}.part")
+
+
+class BlobStorage:
+    """
+    Where blob contents live. Names are the blobs' fan-out keys (ab/cd/<sha256>)
+    and contents are the at-rest ciphertext, so backends only move bytes.
+    """
+
+    def save(self, name, local_path):
+        """
+        Publishes a finished local file under name and consumes local_path.
+        Readers must never see a partially written object.
+        """
+        raise NotImplementedError
+
+    def open(self, name, start=0, length=None):
+        """
+        Yields the length bytes of name starting at start (or the rest of it)
+        one DOWNLOAD_BLOCK_SIZE block at a time.
+        """
+        raise NotImplementedError
+
+    def exists(self, name):
+        raise NotImplementedError
+
+    def delete(self, name):
+        raise NotImplementedError
+
+    def local_path(self, name):
+        """
+        The object's path on this node's disk, or None when it is stored remotely.
+        """
+        return None
+
+
+class LocalBlobStorage(BlobStorage):
+    """
+    Blobs as files under a directory on this node, renamed into place when
+    saved. A relative root is under MEDIA_ROOT.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.join(settings.MEDIA_ROOT, root)
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def save(self, name, local_path):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.replace(local_path, path)
+        except OSError:
+            # A different filesystem: copy next to the target, then rename
+            part_path = f"{path}.part"
+            shutil.copyfile(local_path, part_path)
+            os.replace(part_path, path)
+            os.remove(local_path)
+
+    def open(self, name, start=0, length=None):
+        return read_file_range(self._path(name), settings.DOWNLOAD_BLOCK_SIZE, start, length)
+
+    def exists(self, name):
+        return os.path.exists(self._path(name))
+
+    def delete(self, name):
+        if self.exists(name):
+            os.remove(self._path(name))
+
+    def local_path(self, name):
+        return self._path(name)
+
+
+class ShardedBlobStorage(BlobStorage):
+    """
+    Spreads blobs over several backends (mount points, nodes or buckets) with a
+    consistent-hash ring.
+
+    Each shard is placed on the ring at `replicas` points, so load stays even
+    and adding a shard only moves the names that land on its points. A moved
+    name used to belong to the next shard clockwise, so reads walk the ring
+    from the name's owner until the blob is found: shards can be added without
+    copying anything first, and rebalancing can happen in the background.
+    """
+
+    def __init__(self, shards, replicas=100):
+        if not shards:
+            raise ImproperlyConfigured("ShardedBlobStorage needs at least one shard.")
+        self.shards = {shard_name: build_storage(config) for shard_name, config in shards.items()}
+        self._ring = sorted(
+            (self._hash(f"{shard_name}#{replica}"), shard_name)
+            for shard_name in self.shards for replica in range(replicas)
+        )
+        self._points = [point for point, _ in self._ring]
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+    def owners(self, name):
+        """
+        Shard names in ring order starting at name's owner, each listed once.
+        """
+        start = bisect.bisect(self._points, self._hash(name))
+        owners = []
+        for offset in range(len(self._ring)):
+            shard_name = self._ring[(start + offset) % len(self._ring)][1]
+            if shard_name not in owners:
+                owners.append(shard_name)
+                if len(owners) == len(self.shards):
+                    break
+        return owners
+
+    def _locate(self, name):
+        for shard_name in self.owners(name):
+            if self.shards[shard_name].exists(name):
+                return self.shards[shard_name]
+        return None
+
+    def save(self, name, local_path):
+        self.shards[self.owners(name)[0]].save(name, local_path)
+
+    def open(self, name, start=0, length=None):
+        shard = self._locate(name)
+        if shard is None:
+            raise FileNotFoundError(name)
+        return shard.open(name, start, length)
+
+    def exists(self, name):
+        return self._locate(name) is not None
+
+    def delete(self, name):
+        shard = self._locate(name)
+        if shard is not None:
+            shard.delete(name)
+
+    def local_path(self, name):
+        shard = self._locate(name)
+        return shard.local_path(name) if shard is not None else None
+
+
+def _is_missing(error):
+    return getattr(error, 'response', {}).get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+
+class S3BlobStorage(BlobStorage):
+    """
+    Blobs as objects in an S3-compatible bucket, shared by every node.
+
+    Uploads go through the client's managed (multipart) transfer and reads are
+    ranged GETs streamed block by block. Uses boto3 unless emulator_root is
+    set, in which case EmulatedS3Client stands in for the service.
+    """
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region_name=None, emulator_root=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        if emulator_root:
+            self.client = EmulatedS3Client(emulator_root)
+        else:
+            try:
+                import boto3
+            except ImportError as e:
+                raise ImproperlyConfigured("S3BlobStorage needs boto3 (pip install boto3).") from e
+            self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region_name)
+
+    def _key(self, name):
+        return f"{self.prefix}{name}"
+
+    def save(self, name, local_path):
+        self.client.upload_file(local_path, self.bucket, self._key(name))
+        os.remove(local_path)
+
+    def open(self, name, start=0, length=None):
+        end = '' if length is None else start + length - 1
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=self._key(name), Range=f"bytes={start}-{end}")['Body']
+        except Exception as e:
+            if _is_missing(e):
+                raise FileNotFoundError(name) from e
+            raise
+        return self._iter_body(body)
+
+    @staticmethod
+    def _iter_body(body):
+        try:
+            yield from body.iter_chunks(settings.DOWNLOAD_BLOCK_SIZE)
+        finally:
+            body.close()
+
+    def exists(self, name):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+        except Exception as e:
+            if _is_missing(e):
+                return False
+            raise
+        return True
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+
+class EmulatedClientError(Exception):
+    """
+    Mimics botocore's ClientError, carrying the S3 error code in .response.
+    """
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class _EmulatedBody:
+    def __init__(self, path, start, end):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start + 1
+
+    def iter_chunks(self, chunk_size):
+        while self._remaining > 0:
+            chunk = self._file.read(min(chunk_size, self._remaining))
+            if not chunk:
+                break
+            self._remaining -= len(chunk)
+            yield chunk
+
+    def close(self):
+        self._file.close()
+
+
+class EmulatedS3Client:
+    """
+    A local stand-in for the subset of the boto3 S3 client used by
+    S3BlobStorage, storing objects as files under root/<bucket>/<key>. A
+    relative root is under MEDIA_ROOT.
+
+    For development and tests; point endpoint_url at MinIO or a similar
+    server instead to exercise a real S3 API locally.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.join(settings.MEDIA_ROOT, root)
+
+    def _path(self, bucket, key):
+        return os.path.join(self.root, bucket, *key.split('/'))
+
+    def upload_file(self, filename, bucket, key):
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Objects appear atomically, as they do in S3
+        shutil.copyfile(filename, f"{path}.upload")
+        os.replace(f"{path}.upload", path)
+
+    def head_object(self, Bucket, Key):
+        path = self._path(Bucket, Key)
+        if not os.path.exists(path):
+            raise EmulatedClientError('404')
+        return {'ContentLength': os.path.getsize(path)}
+
+    def get_object(self, Bucket, Key, Range=None):
+        size = self.head_object(Bucket, Key)['ContentLength']
+        start, end = 0, size - 1
+        if Range:
+            first, _, last = Range.partition('=')[2].partition('-')
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+            if start >= size:
+                raise EmulatedClientError('InvalidRange')
+        return {'Body': _EmulatedBody(self._path(Bucket, Key), start, end), 'ContentLength': end - start + 1}
+
+    def delete_object(self, Bucket, Key):
+        path = self._path(Bucket, Key)
+        if os.path.exists(path):
+            os.remove(path)
+        return {}
+
+
+def build_storage(config):
+    """
+    Instantiates a backend from a {'BACKEND': dotted path, 'OPTIONS': {...}} dict.
+    """
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+@lru_cache(maxsize=None)
+def blob_storage():
+    """
+    The backend configured in BLOB_STORAGE, built once per process.
+    """
+    return build_storage(settings.BLOB_STORAGE)
+
+
+@receiver(setting_changed)
+def _reset_blob_storage(setting, **kwargs):
+    if setting in ('BLOB_STORAGE', 'MEDIA_ROOT'):
+        blob_storage.cache_clear()
@@ -1,3 +1,2144 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from types import SimpleNamespace
+from urllib.parse import quote
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, padding, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.keywrap import InvalidUnwrap
+from cryptography.x509.oid import NameOID
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F, FilteredRelation, Q
+from django.http import StreamingHttpResponse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern
+from django.utils import timezone
+from google.auth import crypt, jwt as google_jwt
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts import blobs, metrics, urls as account_urls
+from accounts.access import resolve_file_access
+from accounts.blobs import read_plaintext
+from accounts.mail import queue_mail, retry_delay, send_queued_mail
+from accounts.cipher_suites import CIPHER_SUITES, TAG_BYTES, IntegrityError, negotiate, suite_ranking
+from accounts.downloads import parse_range
+from accounts.encryption import ctr_transform, new_data_key, unwrap_key, wrap_key
+from accounts.file_ids import decode_file_id, encode_file_id
+from accounts.google_auth import verify_google_id_token
+from accounts.models import Blob, CustomUser, OneTimeToken, OutboundEmail, UploadedFile, UploadSession, SharedFile
+from accounts.one_time_tokens import consume_token, hash_token, issue_token, purge_expired_tokens
+from accounts.pagination import encode_cursor, keyset_filter
+from accounts.sharing import reap_expired_shares
+from accounts.parallel_crypto import ctr_transform_parallel, ctr_transform_stream
+from accounts.storage import ShardedBlobStorage, blob_storage, media_file_path
+from accounts.throttling import CacheRateStore, LocalMemoryRateStore, rate_store
+from accounts.uploads import decrypt_stream_to_file
+
+
+@skipUnless(connection.vendor == 'sqlite', "Query plans are checked against SQLite's EXPLAIN QUERY PLAN.")
+class HotQueryPlanTests(TestCase):
+    """
+    The file and share lookups on every request must stay index searches,
+    never table scans or temporary sorts, however large the tables grow.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner')
+        cls.recipient = CustomUser.objects.create_user('recipient')
+        cls.file = UploadedFile.objects.create(user=cls.owner, file_name='a.pdf', file='a.pdf')
+
+    def assertIndexSearch(self, queryset, table, index, condition):
+        plan = queryset.explain()
+        self.assertIn(f"SEARCH {table} USING", plan)
+        self.assertIn(f"{index} ({condition})", plan)
+        self.assertNotIn("SCAN", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_permission_check_uses_unique_share_index(self):
+        queryset = UploadedFile.objects.filter(id=self.file.id).annotate(
+            share=FilteredRelation('shared_files', condition=Q(shared_files__shared_with=self.recipient)),
+        ).annotate(share_view=F('share__view_permission'))
+        self.assertIndexSearch(queryset, 'share', 'sqlite_autoindex_accounts_sharedfile_1', 'file_id=? AND shared_with_id=?')
+
+    def test_download_check_uses_unique_share_index(self):
+        queryset = SharedFile.objects.filter(
+            file_id=self.file.id,
+            shared_with=self.recipient,
+            download_permission=True,
+            expiration_time__gte=timezone.now(),
+        )
+        self.assertIndexSearch(queryset, 'accounts_sharedfile', 'sqlite_autoindex_accounts_sharedfile_1', 'file_id=? AND shared_with_id=?')
+
+    def test_update_and_revoke_lookup_uses_unique_share_index(self):
+        queryset = SharedFile.objects.filter(file_id=self.file.id, shared_with__username='recipient')
+        self.assertIndexSearch(queryset, 'accounts_sharedfile', 'sqlite_autoindex_accounts_sharedfile_1', 'file_id=? AND shared_with_id=?')
+
+    def test_shared_with_me_listing_uses_recipient_index(self):
+        queryset = SharedFile.objects.filter(shared_with=self.recipient).order_by('-id').values('file__id', 'owner__username')
+        self.assertIndexSearch(queryset, 'accounts_sharedfile', 'share_recipient_order_idx', 'shared_with_id=?')
+
+    def test_unexpired_shares_use_recipient_expiry_index(self):
+        queryset = SharedFile.objects.filter(shared_with=self.recipient, expiration_time__gte=timezone.now()).values('id')
+        self.assertIndexSearch(queryset, 'accounts_sharedfile', 'COVERING INDEX share_recipient_expiry_idx', 'shared_with_id=? AND expiration_time>?')
+
+    def test_uploaded_files_listing_is_index_ordered(self):
+        queryset = UploadedFile.objects.filter(user=self.owner).order_by('uploaded_at').values('id', 'uploaded_at')
+        self.assertIndexSearch(queryset, 'accounts_uploadedfile', 'COVERING INDEX upload_owner_date_idx', 'user_id=?')
+
+    def test_uploaded_files_page_seeks_past_cursor(self):
+        ordering = ['-uploaded_at', '-id']
+        queryset = keyset_filter(
+            UploadedFile.objects.filter(user=self.owner), ordering, encode_cursor([timezone.now(), 10]),
+        ).order_by(*ordering).values('id', 'file_name', 'uploaded_at')
+        self.assertIndexSearch(queryset, 'accounts_uploadedfile', 'upload_owner_date_idx', 'user_id=? AND uploaded_at<?')
+
+    def test_uploaded_files_name_page_seeks_past_cursor(self):
+        ordering = ['file_name', 'id']
+        queryset = keyset_filter(
+            UploadedFile.objects.filter(user=self.owner, file_name__startswith='a'), ordering, encode_cursor(['a.pdf', 10]),
+        ).order_by(*ordering).values('id', 'file_name', 'uploaded_at')
+        self.assertIndexSearch(queryset, 'accounts_uploadedfile', 'upload_owner_name_idx', 'user_id=? AND file_name>?')
+
+    def test_one_time_token_lookup_uses_unique_hash_index(self):
+        queryset = OneTimeToken.objects.filter(
+            token_hash=hash_token('token'), purpose=OneTimeToken.VERIFY_EMAIL, expires_at__gt=timezone.now(),
+        )
+        self.assertIndexSearch(queryset, 'accounts_onetimetoken', 'sqlite_autoindex_accounts_onetimetoken_1', 'token_hash=?')
+
+    def test_expired_token_purge_uses_expiry_index(self):
+        queryset = OneTimeToken.objects.filter(expires_at__lte=timezone.now()).values('id')
+        self.assertIndexSearch(queryset, 'accounts_onetimetoken', 'COVERING INDEX onetime_token_expiry_idx', 'expires_at<?')
+
+    def test_expired_share_reaper_walks_expiry_index(self):
+        queryset = SharedFile.objects.filter(expiration_time__lte=timezone.now()).order_by('expiration_time').values('id')
+        self.assertIndexSearch(queryset, 'accounts_sharedfile', 'COVERING INDEX share_expiry_idx', 'expiration_time<?')
+
+    def test_shared_with_me_page_seeks_past_cursor(self):
+        ordering = ['-id']
+        queryset = keyset_filter(
+            SharedFile.objects.filter(shared_with=self.recipient), ordering, encode_cursor([10]),
+        ).order_by(*ordering).values('id', 'file__file_name', 'owner__username')
+        self.assertIndexSearch(queryset, 'accounts_sharedfile', 'share_recipient_order_idx', 'shared_with_id=? AND id<?')
+
+
+def _cbc_encrypt(key, iv, data):
+    padder = padding.PKCS7(128).padder()
+    encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+    return encryptor.update(padder.update(data) + padder.finalize()) + encryptor.finalize()
+
+
+class MediaRootMixin:
+    """
+    Stores each test's files under a temporary MEDIA_ROOT, with helpers to
+    upload and download them through the synchronous endpoints.
+    """
+
+    KEY = bytes(32)
+    IV = bytes(16)
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        # Storage resolves file paths against MEDIA_ROOT, which it caches on first use
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def upload(self, user, file_name, data):
+        """
+        Uploads data as user with the legacy JSON transport and returns the new file.
+        """
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post('/api/upload/', {
+            'file_name': file_name, 'aes_key': self.KEY.hex(), 'aes_iv': self.IV.hex(),
+            'encrypted_content': base64.b64encode(_cbc_encrypt(self.KEY, self.IV, data)).decode(),
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return UploadedFile.objects.select_related('blob').filter(user=user).latest('id')
+
+    def download(self, uploaded_file, **headers):
+        """
+        Downloads a file as its owner with the binary transport and returns the plaintext.
+        """
+        client = APIClient()
+        client.force_authenticate(uploaded_file.user)
+        response = client.get(
+            f'/api/view/{encode_file_id(uploaded_file.id)}/', HTTP_ACCEPT='application/octet-stream', **headers,
+        )
+        key = base64.b64decode(response['X-AES-Key'])
+        nonce = base64.b64decode(response['X-AES-IV'])
+        start = int(response['Content-Range'].split(' ')[1].split('-')[0]) if response.status_code == 206 else 0
+        return ctr_transform(key, nonce, start, b''.join(response.streaming_content))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class QueryBudgetTests(MediaRootMixin, TestCase):
+    """
+    Every endpoint in accounts/urls.py must issue the same number of SQL
+    queries however many files, shares and users its request touches.
+
+    Each scenario builds a dataset of a given size, then returns the request
+    to measure. A scenario is run once per size in DATASET_SIZES, each in its
+    own rolled-back transaction with a cold cache, and the query counts must
+    all be equal. New endpoints need a scenario in SCENARIOS.
+    """
+
+    DATASET_SIZES = (1, 4, 16)
+    AES_KEY = bytes(range(32))
+    AES_IV = bytes(range(16))
+
+    # Datasets
+
+    def populate(self, size):
+        """
+        Creates an owner with size files, each shared with size recipients.
+        """
+        self.owner = CustomUser.objects.create_user('owner', email='owner@example.com', password='secret')
+        self.recipients = [
+            CustomUser.objects.create_user(f'recipient{i}', email=f'recipient{i}@example.com') for i in range(size)
+        ]
+        self.files = [self.store_file(self.owner, f'file{i}.txt', b'contents' * 100) for i in range(size)]
+        SharedFile.objects.bulk_create([
+            SharedFile(
+                file=uploaded_file, shared_with=recipient, owner=self.owner, view_permission=True,
+                download_permission=True, expiration_time=timezone.now() + timezone.timedelta(hours=1),
+            )
+            for uploaded_file in self.files for recipient in self.recipients
+        ])
+        self.file_id = encode_file_id(self.files[0].id)
+
+    def store_file(self, user, file_name, data):
+        data_key, data_nonce = new_data_key()
+        path = media_file_path('encrypted_files', file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as stored:
+            stored.write(ctr_transform(data_key, data_nonce, 0, data))
+        return UploadedFile.objects.create(
+            user=user, file_name=file_name, file=os.path.relpath(path, settings.MEDIA_ROOT), encrypted=True,
+            data_key=wrap_key(data_key), data_nonce=data_nonce,
+        )
+
+    def client_for(self, user):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client
+
+    def bearer_client_for(self, user):
+        # The async endpoints authenticate the JWT themselves, bypassing DRF's force_authenticate
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+    def start_upload_session(self, size):
+        response = self.client_for(self.owner).post('/api/upload/sessions/', {
+            'file_name': f'session{size}.bin', 'aes_key': self.AES_KEY.hex(), 'aes_iv': self.AES_IV.hex(),
+        }, format='json')
+        return response.json()['upload_id']
+
+    def share_items(self, size):
+        return [
+            {'encrypted_file_id': encode_file_id(uploaded_file.id), 'username': recipient.username, 'view_permission': True}
+            for uploaded_file, recipient in zip(self.files, self.recipients)
+        ]
+
+    # Scenarios: given the dataset size, prepare and return the request to measure
+
+    def scenario_register(self, size):
+        return lambda: self.client_for(None).post('/api/register/', {
+            'username': 'newcomer', 'password': 'secret', 'email': 'newcomer@example.com',
+        }, format='json')
+
+    def scenario_login(self, size):
+        self.owner.is_active = True
+        self.owner.save()
+        return lambda: self.client_for(None).post('/api/login/', {'username': 'owner', 'password': 'secret'}, format='json')
+
+    def scenario_logout(self, size):
+        return lambda: self.client_for(self.owner).post('/api/logout/', {}, format='json')
+
+    def scenario_verify_email(self, size):
+        token = issue_token(self.owner, OneTimeToken.VERIFY_EMAIL, timezone.timedelta(hours=1))
+        return lambda: self.client_for(None).get('/api/verify-email/', {'token': token})
+
+    def scenario_google_login(self, size):
+        return lambda: self.client_for(None).post('/api/google-login/', {}, format='json')
+
+    def scenario_reset_password_request(self, size):
+        return lambda: self.client_for(None).post('/api/reset-password/', {'email': 'owner@example.com'}, format='json')
+
+    def scenario_reset_password_confirm(self, size):
+        token = issue_token(self.owner, OneTimeToken.RESET_PASSWORD, timezone.timedelta(hours=1))
+        return lambda: self.client_for(None).post(
+            '/api/reset-password-confirm/', {'token': token, 'new_password': 'changed'}, format='json',
+        )
+
+    def scenario_get_user_details(self, size):
+        return lambda: self.client_for(self.owner).get('/api/user-details/')
+
+    def scenario_upload_file(self, size):
+        return lambda: self.client_for(self.owner).post('/api/upload/', {
+            'file_name': 'upload.bin',
+            'encrypted_content': base64.b64encode(_cbc_encrypt(self.AES_KEY, self.AES_IV, b'x' * size)).decode(),
+            'aes_key': self.AES_KEY.hex(),
+            'aes_iv': self.AES_IV.hex(),
+        }, format='json')
+
+    def scenario_init_upload_session(self, size):
+        return lambda: self.client_for(self.owner).post('/api/upload/sessions/', {
+            'file_name': 'session.bin', 'aes_key': self.AES_KEY.hex(), 'aes_iv': self.AES_IV.hex(),
+        }, format='json')
+
+    def scenario_upload_session_status(self, size):
+        upload_id = self.start_upload_session(size)
+        return lambda: self.client_for(self.owner).get(f'/api/upload/sessions/{upload_id}/')
+
+    def scenario_upload_chunk(self, size):
+        upload_id = self.start_upload_session(size)
+        return lambda: self.client_for(self.owner).put(
+            f'/api/upload/sessions/{upload_id}/chunks/0/', b'\0' * 16 * size, content_type='application/octet-stream',
+        )
+
+    def scenario_commit_upload_session(self, size):
+        upload_id = self.start_upload_session(size)
+        self.client_for(self.owner).put(
+            f'/api/upload/sessions/{upload_id}/chunks/0/', _cbc_encrypt(self.AES_KEY, self.AES_IV, b'x' * size),
+            content_type='application/octet-stream',
+        )
+        return lambda: self.client_for(self.owner).post(f'/api/upload/sessions/{upload_id}/commit/')
+
+    def scenario_share_file(self, size):
+        newcomer = CustomUser.objects.create_user('newcomer')
+        return lambda: self.client_for(self.owner).post(
+            f'/api/share/{self.file_id}/', {'user_id': newcomer.username, 'view_permission': True}, format='json',
+        )
+
+    def scenario_access_shared_file(self, size):
+        return lambda: self.client_for(self.recipients[0]).get(f'/api/access/{self.file_id}/')
+
+    def scenario_revoke_access(self, size):
+        return lambda: self.client_for(self.owner).post(
+            f'/api/revoke/{self.file_id}/', {'username': self.recipients[0].username}, format='json',
+        )
+
+    def scenario_get_current_access_files(self, size):
+        return lambda: self.client_for(self.recipients[0]).get('/api/current-access-files/')
+
+    def scenario_view_file(self, size):
+        return lambda: self.client_for(self.recipients[0]).get(f'/api/view/{self.file_id}/')
+
+    def scenario_get_all_uploaded_files(self, size):
+        return lambda: self.client_for(self.owner).get('/api/all-files/')
+
+    def scenario_get_shared_users(self, size):
+        return lambda: self.client_for(self.owner).get(f'/api/shared-with/{self.file_id}/')
+
+    def scenario_update_permission(self, size):
+        return lambda: self.client_for(self.owner).post(f'/api/update-permission/{self.file_id}/', {
+            'username': self.recipients[0].username, 'permission_type': 'download_permission', 'value': False,
+        }, format='json')
+
+    def scenario_bulk_share_files(self, size):
+        SharedFile.objects.all().delete()
+        return lambda: self.client_for(self.owner).post('/api/bulk-share/', {'shares': self.share_items(size)}, format='json')
+
+    def scenario_bulk_revoke_access(self, size):
+        return lambda: self.client_for(self.owner).post(
+            '/api/bulk-revoke/', {'revocations': self.share_items(size)}, format='json',
+        )
+
+    def scenario_get_cipher_suites(self, size):
+        return lambda: self.client_for(None).get('/api/cipher-suites/')
+
+    def scenario_upload_file_async(self, size):
+        return lambda: self.bearer_client_for(self.owner).post('/api/async/upload/', {
+            'file_name': 'upload.bin',
+            'encrypted_content': base64.b64encode(_cbc_encrypt(self.AES_KEY, self.AES_IV, b'x' * size)).decode(),
+            'aes_key': self.AES_KEY.hex(),
+            'aes_iv': self.AES_IV.hex(),
+        }, format='json')
+
+    def scenario_view_file_async(self, size):
+        return lambda: self.bearer_client_for(self.recipients[0]).get(f'/api/async/view/{self.file_id}/')
+
+    def scenario_access_shared_file_async(self, size):
+        return lambda: self.bearer_client_for(self.recipients[0]).get(
+            f'/api/async/access/{self.file_id}/', HTTP_ACCEPT='application/octet-stream',
+        )
+
+    # Harness
+
+    def measure(self, scenario, size):
+        """
+        Returns the response and captured queries of scenario on a dataset of size.
+        """
+        with transaction.atomic():
+            cache.clear()
+            self.populate(size)
+            request = scenario(size)
+            cache.clear()
+            # Fresh rate limit counters, so no run is throttled by the ones before
+            rate_store.cache_clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = request()
+            transaction.set_rollback(True)
+        return response, queries
+
+    def assertQueryCountConstant(self, name):
+        scenario = getattr(self, f'scenario_{name}')
+        counts = {}
+        for size in self.DATASET_SIZES:
+            response, queries = self.measure(scenario, size)
+            if response.status_code >= 500:
+                self.fail(f"{name} failed with {size} rows: {response.content[:200]!r}")
+            counts[size] = len(queries)
+        if len(set(counts.values())) > 1:
+            statements = '\n'.join(query['sql'] for query in queries.captured_queries)
+            self.fail(f"Query count of {name} grows with the data: {counts}\n{statements}")
+
+    def test_every_endpoint_has_a_scenario(self):
+        names = {pattern.name for pattern in account_urls.urlpatterns if isinstance(pattern, URLPattern)}
+        missing = sorted(name for name in names if not hasattr(self, f'scenario_{name}'))
+        self.assertEqual(missing, [], "Add a query budget scenario for these endpoints.")
+
+    def test_query_counts_do_not_grow_with_data(self):
+        for pattern in account_urls.urlpatterns:
+            if hasattr(self, f'scenario_{pattern.name}'):
+                with self.subTest(endpoint=pattern.name):
+                    self.assertQueryCountConstant(pattern.name)
+
+
+class UploadTransportTests(MediaRootMixin, TestCase):
+    """
+    Both upload endpoints accept the ciphertext as a multipart 'file' part or
+    as a raw application/octet-stream body, as well as base64 in JSON.
+    """
+
+    DATA = os.urandom(5000)
+    URLS = ('/api/upload/', '/api/async/upload/')
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user('user')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def stored_plaintext(self, file_name):
+        uploaded_file = UploadedFile.objects.select_related('blob').get(user=self.user, file_name=file_name)
+        return b''.join(read_plaintext(uploaded_file))
+
+    def test_multipart_upload(self):
+        for index, url in enumerate(self.URLS):
+            with self.subTest(url=url):
+                response = self.client.post(url, {
+                    'file_name': f'notes{index}.txt', 'aes_key': self.KEY.hex(), 'aes_iv': self.IV.hex(),
+                    'file': SimpleUploadedFile('blob', _cbc_encrypt(self.KEY, self.IV, self.DATA)),
+                })
+                self.assertEqual(response.status_code, 200, response.content)
+                self.assertEqual(self.stored_plaintext(f'notes{index}.txt'), self.DATA)
+
+    def test_multipart_upload_is_named_after_its_file_part(self):
+        for index, url in enumerate(self.URLS):
+            with self.subTest(url=url):
+                response = self.client.post(url, {
+                    'aes_key': self.KEY.hex(), 'aes_iv': self.IV.hex(),
+                    'file': SimpleUploadedFile(f'report{index}.pdf', _cbc_encrypt(self.KEY, self.IV, self.DATA)),
+                })
+                self.assertEqual(response.status_code, 200, response.content)
+                self.assertEqual(self.stored_plaintext(f'report{index}.pdf'), self.DATA)
+
+    def test_octet_stream_upload_with_encoded_file_name(self):
+        for index, url in enumerate(self.URLS):
+            with self.subTest(url=url):
+                file_name = f'Q3 report {index} – résumé.pdf'
+                response = self.client.post(
+                    url, _cbc_encrypt(self.KEY, self.IV, self.DATA), content_type='application/octet-stream',
+                    HTTP_X_FILE_NAME=quote(file_name), HTTP_X_AES_KEY=self.KEY.hex(), HTTP_X_AES_IV=self.IV.hex(),
+                )
+                self.assertEqual(response.status_code, 200, response.content)
+                self.assertEqual(self.stored_plaintext(file_name), self.DATA)
+
+    def test_empty_body_is_rejected(self):
+        for url in self.URLS:
+            with self.subTest(url=url):
+                response = self.client.post(
+                    url, b'', content_type='application/octet-stream',
+                    HTTP_X_FILE_NAME='empty.bin', HTTP_X_AES_KEY=self.KEY.hex(), HTTP_X_AES_IV=self.IV.hex(),
+                )
+                self.assertEqual(response.status_code, 400)
+                response = self.client.post(url, {'file_name': 'empty.bin', 'aes_key': self.KEY.hex(), 'aes_iv': self.IV.hex()})
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadedFile.objects.exists())
+        self.assertFalse(Blob.objects.exists())
+
+
+class StreamingDownloadTests(MediaRootMixin, TestCase):
+    """
+    Binary downloads stream AES-CTR ciphertext whose X-AES-IV counter block
+    refers to byte 0 of the file, whatever range is requested.
+    """
+
+    DATA = os.urandom(100000)
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user('user')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.file_id = encode_file_id(self.upload(self.user, 'data.bin', self.DATA).id)
+
+    def test_download_streams_ciphertext(self):
+        response = self.client.get(f'/api/view/{self.file_id}/', HTTP_ACCEPT='application/octet-stream')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['X-AES-Mode'], 'CTR')
+        self.assertEqual(int(response['Content-Length']), len(self.DATA))
+        ciphertext = b''.join(response.streaming_content)
+        self.assertNotEqual(ciphertext, self.DATA)
+        decryptor = Cipher(
+            algorithms.AES(base64.b64decode(response['X-AES-Key'])), modes.CTR(base64.b64decode(response['X-AES-IV'])),
+        ).decryptor()
+        self.assertEqual(decryptor.update(ciphertext) + decryptor.finalize(), self.DATA)
+
+    def test_range_decrypts_from_the_counter_of_byte_zero(self):
+        response = self.client.get(
+            f'/api/view/{self.file_id}/', HTTP_ACCEPT='application/octet-stream', HTTP_RANGE='bytes=1600-3199',
+        )
+
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response.streaming)
+        # Clients advance the counter by start // 16 blocks
+        counter = int.from_bytes(base64.b64decode(response['X-AES-IV']), 'big') + 1600 // 16
+        decryptor = Cipher(
+            algorithms.AES(base64.b64decode(response['X-AES-Key'])), modes.CTR(counter.to_bytes(16, 'big')),
+        ).decryptor()
+        self.assertEqual(decryptor.update(b''.join(response.streaming_content)), self.DATA[1600:3200])
+
+
+class RangeRequestTests(MediaRootMixin, TestCase):
+    """
+    Downloads answer a single byte range with 206, an unsatisfiable one with
+    416, and anything else with the whole file.
+    """
+
+    DATA = os.urandom(100000)
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user('user')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.file_id = encode_file_id(self.upload(self.user, 'data.bin', self.DATA).id)
+
+    def get(self, range_header, **headers):
+        return self.client.get(
+            f'/api/view/{self.file_id}/', HTTP_ACCEPT='application/octet-stream', HTTP_RANGE=range_header, **headers,
+        )
+
+    def test_parse_range(self):
+        for header, expected in [
+            (None, None),
+            ('', None),
+            ('bytes=0-9', (0, 9)),
+            ('bytes=90-', (90, 99)),
+            ('bytes=50-1000', (50, 99)),
+            ('bytes=-10', (90, 99)),
+            ('bytes=-1000', (0, 99)),
+            ('bytes=0-1,5-6', None),
+            ('items=0-9', None),
+            ('bytes=abc', None),
+        ]:
+            with self.subTest(header=header):
+                self.assertEqual(parse_range(header, 100), expected)
+        for header in ('bytes=100-', 'bytes=5-2', 'bytes=-0'):
+            with self.subTest(header=header), self.assertRaises(ValueError):
+                parse_range(header, 100)
+
+    def test_suffix_range(self):
+        response = self.get('bytes=-10')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 99990-99999/100000')
+        key = base64.b64decode(response['X-AES-Key'])
+        nonce = base64.b64decode(response['X-AES-IV'])
+        self.assertEqual(ctr_transform(key, nonce, 99990, b''.join(response.streaming_content)), self.DATA[-10:])
+
+    def test_unsatisfiable_range(self):
+        response = self.get('bytes=100000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100000')
+
+        suite = CIPHER_SUITES['aes-256-gcm-frames']
+        wire_size = suite.wire_size(len(self.DATA), settings.CIPHER_FRAME_SIZE)
+        response = self.get(f'bytes={wire_size}-', HTTP_X_CIPHER_SUITES=suite.name)
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{wire_size}')
+
+    def test_multiple_ranges_get_the_whole_file(self):
+        response = self.get('bytes=0-9,20-29')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Range', response)
+        key = base64.b64decode(response['X-AES-Key'])
+        nonce = base64.b64decode(response['X-AES-IV'])
+        self.assertEqual(ctr_transform(key, nonce, 0, b''.join(response.streaming_content)), self.DATA)
+
+
+class EncryptionAtRestTests(MediaRootMixin, TestCase):
+    """
+    Uploads are stored encrypted under a data key wrapped with
+    FILE_KEY_ENCRYPTION_KEY; files stored in plaintext before that still download.
+    """
+
+    DATA = os.urandom(10000)
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user('user')
+
+    def test_stored_bytes_are_not_the_plaintext(self):
+        uploaded_file = self.upload(self.user, 'data.bin', self.DATA)
+
+        with open(media_file_path('blobs', *uploaded_file.blob.name.split('/')), 'rb') as stored:
+            stored_bytes = stored.read()
+        self.assertEqual(len(stored_bytes), len(self.DATA))
+        self.assertNotEqual(stored_bytes, self.DATA)
+        data_key = unwrap_key(uploaded_file.wrapped_key)
+        self.assertEqual(ctr_transform(data_key, uploaded_file.key_nonce, 0, stored_bytes), self.DATA)
+        self.assertEqual(self.download(uploaded_file), self.DATA)
+
+    def test_data_key_unwraps_only_under_the_key_encryption_key(self):
+        uploaded_file = self.upload(self.user, 'data.bin', self.DATA)
+        self.assertEqual(len(unwrap_key(uploaded_file.wrapped_key)), 32)
+
+        with override_settings(FILE_KEY_ENCRYPTION_KEY='22' * 32), self.assertRaises(InvalidUnwrap):
+            unwrap_key(uploaded_file.wrapped_key)
+
+    def test_plaintext_legacy_files_still_download(self):
+        path = media_file_path('decrypted_files', 'legacy.txt')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(self.DATA)
+        legacy = UploadedFile.objects.create(
+            user=self.user, file_name='legacy.txt', file=os.path.relpath(path, settings.MEDIA_ROOT), encrypted=False,
+        )
+
+        self.assertEqual(b''.join(read_plaintext(legacy)), self.DATA)
+        self.assertEqual(self.download(legacy), self.DATA)
+        # Framed downloads derive their key from transfer_secret
+        client = APIClient()
+        client.force_authenticate(self.user)
+        suite = CIPHER_SUITES['aes-256-gcm-frames']
+        response = client.get(
+            f'/api/view/{encode_file_id(legacy.id)}/', HTTP_ACCEPT='application/octet-stream',
+            HTTP_X_CIPHER_SUITES=suite.name,
+        )
+        key = base64.b64decode(response['X-Cipher-Key'])
+        nonce = base64.b64decode(response['X-Cipher-Nonce'])
+        frame_size = int(response['X-Cipher-Frame-Size'])
+        records = suite.records([b''.join(response.streaming_content)], frame_size)
+        self.assertEqual(b''.join(suite.open_frame(key, nonce, *record) for record in records), self.DATA)
+
+
+class UploadSessionTests(MediaRootMixin, TestCase):
+    """
+    Chunked uploads resume from the server's status, accept retried chunks,
+    refuse gaps and only become files when committed.
+    """
+
+    KEY = bytes(range(32))
+    IV = bytes(range(16))
+    DATA = os.urandom(5000)
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user('user')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def start(self):
+        response = self.client.post('/api/upload/sessions/', {
+            'file_name': 'data.bin', 'aes_key': self.KEY.hex(), 'aes_iv': self.IV.hex(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['upload_id']
+
+    def put_chunk(self, upload_id, index, chunk):
+        return self.client.put(
+            f'/api/upload/sessions/{upload_id}/chunks/{index}/', chunk, content_type='application/octet-stream',
+        )
+
+    def test_resume_retry_and_commit(self):
+        ciphertext = _cbc_encrypt(self.KEY, self.IV, self.DATA)
+        chunks = [ciphertext[offset:offset + 2048] for offset in range(0, len(ciphertext), 2048)]
+        upload_id = self.start()
+
+        self.assertEqual(self.put_chunk(upload_id, 0, chunks[0]).status_code, 200)
+        # A lost response: the retried chunk is acknowledged without being appended twice
+        response = self.put_chunk(upload_id, 0, chunks[0])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['next_chunk'], response.json()['received_bytes']), (1, 2048))
+        response = self.put_chunk(upload_id, 2, chunks[2])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['next_chunk'], 1)
+
+        # An interrupted client asks where to resume
+        status = self.client.get(f'/api/upload/sessions/{upload_id}/').json()
+        for index in range(status['next_chunk'], len(chunks)):
+            self.assertEqual(self.put_chunk(upload_id, index, chunks[index]).status_code, 200)
+        self.assertFalse(UploadedFile.objects.exists())
+
+        response = self.client.post(f'/api/upload/sessions/{upload_id}/commit/')
+        self.assertEqual(response.status_code, 201)
+        uploaded_file = UploadedFile.objects.get()
+        self.assertEqual(response.json()['encrypted_file_id'], encode_file_id(uploaded_file.id))
+        self.assertEqual(b''.join(read_plaintext(uploaded_file)), self.DATA)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(self.client.get(f'/api/upload/sessions/{upload_id}/').status_code, 404)
+
+    def test_bad_padding_is_not_committed(self):
+        upload_id = self.start()
+        # Whole blocks decrypt chunk by chunk; the padding is only checked on commit
+        encryptor = Cipher(algorithms.AES(self.KEY), modes.CBC(self.IV)).encryptor()
+        unpadded = encryptor.update(bytes(1024)) + encryptor.finalize()
+        self.assertEqual(self.put_chunk(upload_id, 0, unpadded).status_code, 200)
+
+        response = self.client.post(f'/api/upload/sessions/{upload_id}/commit/')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadedFile.objects.exists())
+
+    def test_other_users_and_expired_sessions_are_not_found(self):
+        upload_id = self.start()
+        stranger = APIClient()
+        stranger.force_authenticate(CustomUser.objects.create_user('stranger'))
+        self.assertEqual(stranger.get(f'/api/upload/sessions/{upload_id}/').status_code, 404)
+
+        UploadSession.objects.update(expires_at=timezone.now())
+        self.assertEqual(self.put_chunk(upload_id, 0, bytes(16)).status_code, 404)
+
+    def test_purge_removes_expired_sessions_and_abandoned_parts(self):
+        expired, live = self.start(), self.start()
+        self.put_chunk(expired, 0, _cbc_encrypt(self.KEY, self.IV, b'expired'))
+        self.put_chunk(live, 0, _cbc_encrypt(self.KEY, self.IV, b'live'))
+        UploadSession.objects.filter(id=expired).update(expires_at=timezone.now())
+        directory = media_file_path('upload_sessions')
+        abandoned, recent = os.path.join(directory, 'abandoned.part'), os.path.join(directory, 'recent.part')
+        for path in (abandoned, recent):
+            open(path, 'wb').close()
+        stale = time.time() - settings.UPLOAD_SESSION_LIFETIME.total_seconds() - 1
+        os.utime(abandoned, (stale, stale))
+
+        out = StringIO()
+        call_command('purge_upload_sessions', batch_size=1, stdout=out)
+
+        self.assertIn("Deleted 1 upload session(s) and 2 part file(s).", out.getvalue())
+        self.assertEqual(list(UploadSession.objects.values_list('id', flat=True)), [uuid.UUID(live)])
+        self.assertEqual(sorted(os.listdir(directory)), sorted([f'{live}.part', 'recent.part']))
+
+
+class FileIdCodecTests(TestCase):
+    """
+    File IDs round-trip, reject anything not issued under a configured key,
+    and keep decoding across a key rotation.
+    """
+
+    OLD_KEY = '11' * 32
+    NEW_KEY = '22' * 32
+
+    def test_round_trip(self):
+        for file_id in (1, 42, 2 ** 63 - 1):
+            encoded = encode_file_id(file_id)
+            self.assertEqual(decode_file_id(encoded), file_id)
+            self.assertEqual(encode_file_id(file_id), encoded)
+        self.assertNotEqual(encode_file_id(1), encode_file_id(2))
+
+    def test_tampered_and_foreign_ids_are_rejected(self):
+        encoded = encode_file_id(42)
+        key_id, token = encoded.split('.')
+        tampered = f"{key_id}.{'B' if token[0] == 'A' else 'A'}{token[1:]}"
+        with override_settings(FILE_ID_KEYS={key_id: self.OLD_KEY}):
+            foreign = encode_file_id(42)
+        for bad in (tampered, foreign, f"9.{token}", token, '', 'not-an-id', f"{key_id}.{token[:-2]}"):
+            with self.assertRaises(ValueError, msg=bad):
+                decode_file_id(bad)
+
+    def test_ids_survive_key_rotation(self):
+        with override_settings(FILE_ID_KEYS={'1': self.OLD_KEY}, FILE_ID_ACTIVE_KEY='1'):
+            old = encode_file_id(42)
+
+        with override_settings(FILE_ID_KEYS={'1': self.OLD_KEY, '2': self.NEW_KEY}, FILE_ID_ACTIVE_KEY='2'):
+            new = encode_file_id(42)
+            self.assertTrue(new.startswith('2.'))
+            self.assertEqual(decode_file_id(old), 42)
+            self.assertEqual(decode_file_id(new), 42)
+
+        # Once the old key is retired, its IDs stop working
+        with override_settings(FILE_ID_KEYS={'2': self.NEW_KEY}, FILE_ID_ACTIVE_KEY='2'):
+            self.assertEqual(decode_file_id(new), 42)
+            with self.assertRaises(ValueError):
+                decode_file_id(old)
+
+
+class FileAccessTests(TestCase):
+    """
+    Cached permissions never outlive a revocation, a permission change or a
+    share's expiry, and only the owner may manage a file's shares.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user('owner')
+        self.recipient = CustomUser.objects.create_user('recipient')
+        self.stranger = CustomUser.objects.create_user('stranger')
+        self.uploaded_file = UploadedFile.objects.create(user=self.owner, file_name='report.pdf', file='report.pdf')
+        self.file_id = encode_file_id(self.uploaded_file.id)
+        SharedFile.objects.create(
+            file=self.uploaded_file, shared_with=self.recipient, owner=self.owner, view_permission=True,
+            download_permission=True, expiration_time=timezone.now() + timezone.timedelta(hours=1),
+        )
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def warm(self, user):
+        # Resolved once, the permission is served from the cache
+        self.assertTrue(resolve_file_access(user, self.uploaded_file.id).can_download)
+        with self.assertNumQueries(0):
+            self.assertTrue(resolve_file_access(user, self.uploaded_file.id).can_download)
+
+    def test_revoked_recipient_is_refused_at_once(self):
+        self.warm(self.recipient)
+
+        response = self.client_for(self.owner).post(f'/api/revoke/{self.file_id}/', {'username': 'recipient'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertFalse(resolve_file_access(self.recipient, self.uploaded_file.id).can_view)
+        for url in (f'/api/access/{self.file_id}/', f'/api/view/{self.file_id}/'):
+            self.assertEqual(self.client_for(self.recipient).get(url).status_code, 403)
+
+    def test_permission_change_is_seen_at_once(self):
+        self.warm(self.recipient)
+
+        self.client_for(self.owner).post(f'/api/update-permission/{self.file_id}/', {
+            'username': 'recipient', 'permission_type': 'download_permission', 'value': False,
+        }, format='json')
+
+        access = resolve_file_access(self.recipient, self.uploaded_file.id)
+        self.assertTrue(access.can_view)
+        self.assertFalse(access.can_download)
+        self.assertEqual(self.client_for(self.recipient).get(f'/api/access/{self.file_id}/').status_code, 403)
+
+    def test_share_expiring_while_cached_is_refused(self):
+        self.warm(self.recipient)
+
+        later = timezone.now() + timezone.timedelta(hours=2)
+        with mock.patch('accounts.access.now', return_value=later):
+            self.assertFalse(resolve_file_access(self.recipient, self.uploaded_file.id).can_view)
+            for url in (f'/api/access/{self.file_id}/', f'/api/view/{self.file_id}/'):
+                self.assertEqual(self.client_for(self.recipient).get(url).status_code, 403)
+
+    def test_only_the_owner_manages_shares(self):
+        for user in (self.recipient, self.stranger):
+            client = self.client_for(user)
+            self.assertEqual(client.get(f'/api/shared-with/{self.file_id}/').status_code, 404)
+            self.assertEqual(client.post(f'/api/update-permission/{self.file_id}/', {
+                'username': 'recipient', 'permission_type': 'view_permission', 'value': False,
+            }, format='json').status_code, 404)
+            self.assertEqual(
+                client.post(f'/api/revoke/{self.file_id}/', {'username': 'recipient'}, format='json').status_code, 404,
+            )
+            self.assertEqual(client.post(f'/api/share/{self.file_id}/', {'user_id': 'stranger'}, format='json').status_code, 404)
+
+        share = SharedFile.objects.get()
+        self.assertEqual((share.shared_with, share.view_permission), (self.recipient, True))
+        self.assertEqual(self.client_for(self.stranger).get(f'/api/access/{self.file_id}/').status_code, 403)
+
+
+class ListingPaginationTests(TestCase):
+    """
+    Listings page through every row exactly once and answer a malformed or
+    forged cursor with 400.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user('owner')
+        self.recipient = CustomUser.objects.create_user('recipient')
+        self.files = [UploadedFile.objects.create(user=self.owner, file_name=f'{i}.pdf', file=f'{i}.pdf') for i in range(5)]
+        SharedFile.objects.bulk_create([
+            SharedFile(file=uploaded_file, shared_with=self.recipient, owner=self.owner, view_permission=True)
+            for uploaded_file in self.files
+        ])
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_pages_cover_every_file_once(self):
+        for sort in ('uploaded_at', '-uploaded_at', 'file_name', '-file_name'):
+            names, cursor = [], None
+            while True:
+                params = {'sort': sort, 'page_size': 2, **({'cursor': cursor} if cursor else {})}
+                body = self.client_for(self.owner).get('/api/all-files/', params).json()
+                names += [f['file_name'] for f in body['files']]
+                cursor = body['next_cursor']
+                if not cursor:
+                    break
+            expected = [f'{i}.pdf' for i in range(5)]
+            self.assertEqual(names, expected[::-1] if sort.startswith('-') else expected)
+
+    def test_bad_cursors_are_rejected(self):
+        bad_cursors = [
+            'not base64!', encode_cursor([1]), encode_cursor(['notadate', 5]), encode_cursor([timezone.now(), 'five']),
+            encode_cursor([None, 5]), encode_cursor([[1], 5]), encode_cursor([timezone.now(), {'id': 5}]),
+        ]
+        for cursor in bad_cursors:
+            response = self.client_for(self.owner).get('/api/all-files/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+        for cursor in ('not base64!', encode_cursor(['five']), encode_cursor([None]), encode_cursor([1, 2])):
+            response = self.client_for(self.recipient).get('/api/current-access-files/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+
+
+class BulkShareTests(TestCase):
+    """
+    Bulk share and revoke report a result per item, and a failing item never
+    affects the others.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user('owner')
+        self.other = CustomUser.objects.create_user('other')
+        self.alice = CustomUser.objects.create_user('alice')
+        self.bob = CustomUser.objects.create_user('bob')
+        self.files = [UploadedFile.objects.create(user=self.owner, file_name=f'{i}.pdf', file=f'{i}.pdf') for i in range(2)]
+        self.foreign_file = UploadedFile.objects.create(user=self.other, file_name='foreign.pdf', file='foreign.pdf')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def item(self, uploaded_file, username, **fields):
+        return {'encrypted_file_id': encode_file_id(uploaded_file.id), 'username': username, **fields}
+
+    def test_bulk_share_results(self):
+        SharedFile.objects.create(file=self.files[0], shared_with=self.bob, owner=self.owner, view_permission=True)
+
+        response = self.client.post('/api/bulk-share/', {'shares': [
+            self.item(self.files[0], 'alice', view_permission=True, expiration=2),
+            self.item(self.files[0], 'bob', download_permission=True),
+            self.item(self.files[0], 'alice'),
+            self.item(self.files[1], 'nobody'),
+            self.item(self.foreign_file, 'alice', view_permission=True),
+            self.item(self.files[1], 'alice', expiration='soon'),
+            {'encrypted_file_id': 'garbage', 'username': 'alice'},
+            'not an object',
+            self.item(self.files[1], 'bob', view_permission='true'),
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['succeeded'], body['failed']), (3, 6))
+        self.assertEqual(
+            [(result['index'], result['status'], result.get('code')) for result in body['results']],
+            [
+                (0, 'created', None), (1, 'updated', None), (2, 'failed', 400), (3, 'failed', 404),
+                (4, 'failed', 404), (5, 'failed', 400), (6, 'failed', 400), (7, 'failed', 400), (8, 'created', None),
+            ],
+        )
+        self.assertEqual(body['results'][2]['error'], "Duplicate of an earlier item.")
+
+        shares = {
+            (share.file_id, share.shared_with.username): share
+            for share in SharedFile.objects.select_related('shared_with')
+        }
+        self.assertEqual(sorted(shares), sorted([
+            (self.files[0].id, 'alice'), (self.files[0].id, 'bob'), (self.files[1].id, 'bob'),
+        ]))
+        self.assertTrue(shares[self.files[0].id, 'alice'].view_permission)
+        self.assertLess(shares[self.files[0].id, 'alice'].expiration_time, timezone.now() + timezone.timedelta(hours=3))
+        updated = shares[self.files[0].id, 'bob']
+        self.assertEqual((updated.view_permission, updated.download_permission), (False, True))
+
+    def test_bulk_revoke_results(self):
+        for uploaded_file in self.files:
+            SharedFile.objects.create(file=uploaded_file, shared_with=self.alice, owner=self.owner, view_permission=True)
+        SharedFile.objects.create(file=self.foreign_file, shared_with=self.alice, owner=self.other, view_permission=True)
+
+        response = self.client.post('/api/bulk-revoke/', {'revocations': [
+            self.item(self.files[0], 'alice'),
+            self.item(self.files[0], 'bob'),
+            self.item(self.foreign_file, 'alice'),
+            self.item(self.files[1], 'nobody'),
+            self.item(self.files[1], 'alice'),
+        ]}, format='json')
+
+        body = response.json()
+        self.assertEqual((body['succeeded'], body['failed']), (2, 3))
+        self.assertEqual(
+            [(result['status'], result.get('code')) for result in body['results']],
+            [('revoked', None), ('failed', 404), ('failed', 404), ('failed', 404), ('revoked', None)],
+        )
+        self.assertEqual(list(SharedFile.objects.values_list('file_id', flat=True)), [self.foreign_file.id])
+
+    def test_malformed_batches_are_rejected(self):
+        for body in ({}, {'shares': []}, {'shares': 'all'}):
+            self.assertEqual(self.client.post('/api/bulk-share/', body, format='json').status_code, 400)
+        with override_settings(BULK_SHARE_MAX_ITEMS=1):
+            items = [self.item(self.files[0], 'alice'), self.item(self.files[1], 'alice')]
+            self.assertEqual(self.client.post('/api/bulk-revoke/', {'revocations': items}, format='json').status_code, 400)
+        self.assertFalse(SharedFile.objects.exists())
+
+
+class ListingCacheTests(MediaRootMixin, TestCase):
+    """
+    Listings are served from the cache with an ETag until an upload or a
+    share change moves them to a new generation.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.owner = CustomUser.objects.create_user('owner')
+        self.recipient = CustomUser.objects.create_user('recipient')
+        self.file = UploadedFile.objects.create(user=self.owner, file_name='a.pdf', file='a.pdf')
+        self.file_id = encode_file_id(self.file.id)
+        self.owner_client = APIClient()
+        self.owner_client.force_authenticate(self.owner)
+        self.recipient_client = APIClient()
+        self.recipient_client.force_authenticate(self.recipient)
+
+    def assertRevalidates(self, client, url, **params):
+        first = client.get(url, params)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first['ETag'])
+        with self.assertNumQueries(0):
+            cached = client.get(url, params)
+            not_modified = client.get(url, params, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(cached.content, first.content)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        return first
+
+    def test_unchanged_listings_are_not_modified(self):
+        self.assertRevalidates(self.owner_client, '/api/all-files/')
+        self.assertRevalidates(self.recipient_client, '/api/current-access-files/')
+        self.assertRevalidates(self.owner_client, f'/api/shared-with/{self.file_id}/')
+
+    def test_query_string_is_part_of_the_etag(self):
+        first = self.assertRevalidates(self.owner_client, '/api/all-files/')
+        other = self.assertRevalidates(self.owner_client, '/api/all-files/', sort='-file_name')
+        self.assertNotEqual(first['ETag'], other['ETag'])
+
+    def test_sharing_invalidates_recipient_and_file_listings(self):
+        shared_with_me = self.assertRevalidates(self.recipient_client, '/api/current-access-files/')
+        shared_users = self.assertRevalidates(self.owner_client, f'/api/shared-with/{self.file_id}/')
+
+        self.owner_client.post(f'/api/share/{self.file_id}/', {'user_id': 'recipient', 'view_permission': True}, format='json')
+
+        response = self.recipient_client.get('/api/current-access-files/', HTTP_IF_NONE_MATCH=shared_with_me['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['files']), 1)
+        response = self.owner_client.get(f'/api/shared-with/{self.file_id}/', HTTP_IF_NONE_MATCH=shared_users['ETag'])
+        self.assertEqual([user['username'] for user in response.json()['shared_users']], ['recipient'])
+
+        for url, data in [
+            (f'/api/update-permission/{self.file_id}/', {'username': 'recipient', 'permission_type': 'download_permission', 'value': True}),
+            (f'/api/revoke/{self.file_id}/', {'username': 'recipient'}),
+        ]:
+            before = self.recipient_client.get('/api/current-access-files/')
+            self.owner_client.post(url, data, format='json')
+            after = self.recipient_client.get('/api/current-access-files/', HTTP_IF_NONE_MATCH=before['ETag'])
+            self.assertEqual(after.status_code, 200)
+            self.assertNotEqual(after.content, before.content)
+
+    def test_expired_shares_leave_cached_listings(self):
+        expires = timezone.now() + timezone.timedelta(minutes=5)
+        SharedFile.objects.create(
+            file=self.file, shared_with=self.recipient, owner=self.owner, view_permission=True, expiration_time=expires,
+        )
+        listings = [
+            (self.recipient_client, '/api/current-access-files/', 'files'),
+            (self.owner_client, f'/api/shared-with/{self.file_id}/', 'shared_users'),
+        ]
+        etags = []
+        for client, url, field in listings:
+            first = self.assertRevalidates(client, url)
+            self.assertEqual(len(first.json()[field]), 1)
+            etags.append(first['ETag'])
+
+        # Past the expiry, for both the database filter and the cache's clock
+        later = expires + timezone.timedelta(seconds=1)
+        with mock.patch('django.utils.timezone.now', return_value=later), \
+                mock.patch('time.time', return_value=later.timestamp()):
+            for (client, url, field), etag in zip(listings, etags):
+                response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()[field], [])
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_upload_invalidates_uploaded_files_listing(self):
+        first = self.assertRevalidates(self.owner_client, '/api/all-files/')
+        self.upload(self.owner, 'b.txt', b'hello')
+        response = self.owner_client.get('/api/all-files/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['files']), 2)
+
+
+class BlobStoreTests(MediaRootMixin, TestCase):
+    """
+    Uploads are stored once per distinct content, under a fan-out path named
+    by the content's SHA-256, and released with their last reference.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.alice = CustomUser.objects.create_user('alice')
+        self.bob = CustomUser.objects.create_user('bob')
+
+    def stored_blobs(self):
+        # Whatever the backend, objects end in their fan-out name
+        return sorted(
+            os.path.join(*os.path.normpath(os.path.join(root, name)).split(os.sep)[-3:])
+            for root, _, names in os.walk(settings.MEDIA_ROOT) if 'upload_sessions' not in root for name in names
+        )
+
+    def test_identical_content_is_stored_once(self):
+        first = self.upload(self.alice, 'report.pdf', b'quarterly numbers')
+        second = self.upload(self.bob, 'copy.pdf', b'quarterly numbers')
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        blob = first.blob
+        blob.refresh_from_db()
+        self.assertEqual(blob.refcount, 2)
+        self.assertEqual(blob.size, len(b'quarterly numbers'))
+        digest = hashlib.sha256(b'quarterly numbers').hexdigest()
+        self.assertTrue(blob.name.startswith(f'{digest[:2]}/{digest[2:4]}/{digest}.'))
+        self.assertEqual(self.stored_blobs(), [os.path.join(*blob.name.split('/'))])
+        self.assertEqual(os.listdir(media_file_path('upload_sessions')), [])
+        self.assertEqual(self.download(first), b'quarterly numbers')
+        self.assertEqual(self.download(second), b'quarterly numbers')
+
+    def test_contents_are_published_outside_the_transaction(self):
+        storage = blob_storage()
+        save = storage.save
+        depth = len(connection.atomic_blocks)
+
+        def save_outside_transaction(name, local_path):
+            self.assertEqual(len(connection.atomic_blocks), depth)
+            save(name, local_path)
+
+        with mock.patch.object(storage, 'save', save_outside_transaction):
+            uploaded_file = self.upload(self.alice, 'report.pdf', b'quarterly numbers')
+        self.assertEqual(self.download(uploaded_file), b'quarterly numbers')
+
+    def test_concurrent_uploads_of_new_content_keep_one_copy(self):
+        publish = blobs._publish
+
+        def racing_publish(*args):
+            racing_publish.calls += 1
+            if racing_publish.calls == 1:
+                # Another upload of the same content creates the blob first
+                racing_publish.winner = self.upload(self.bob, 'copy.pdf', b'quarterly numbers')
+            return publish(*args)
+
+        racing_publish.calls = 0
+        with mock.patch('accounts.blobs._publish', racing_publish):
+            loser = self.upload(self.alice, 'report.pdf', b'quarterly numbers')
+
+        self.assertEqual(racing_publish.calls, 2)
+        self.assertEqual(loser.blob_id, racing_publish.winner.blob_id)
+        self.assertEqual(Blob.objects.get().refcount, 2)
+        self.assertEqual(self.stored_blobs(), [os.path.join(*loser.blob.name.split('/'))])
+        self.assertEqual(self.download(loser), b'quarterly numbers')
+        self.assertEqual(self.download(racing_publish.winner), b'quarterly numbers')
+
+    def test_rolled_back_upload_leaves_nothing_behind(self):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        with mock.patch.object(UploadedFile.objects, 'create', side_effect=RuntimeError("database is gone")):
+            response = client.post('/api/upload/', {
+                'file_name': 'report.pdf', 'aes_key': self.KEY.hex(), 'aes_iv': self.IV.hex(),
+                'encrypted_content': base64.b64encode(_cbc_encrypt(self.KEY, self.IV, b'quarterly numbers')).decode(),
+            }, format='json')
+        self.assertEqual(response.status_code, 500)
+
+        self.assertFalse(Blob.objects.exists())
+        self.assertEqual(self.stored_blobs(), [])
+
+    def test_same_name_no_longer_overwrites(self):
+        alices = self.upload(self.alice, 'report.pdf', b'alice')
+        bobs = self.upload(self.bob, 'report.pdf', b'bob')
+
+        self.assertEqual(len(self.stored_blobs()), 2)
+        self.assertEqual(self.download(alices), b'alice')
+        self.assertEqual(self.download(bobs), b'bob')
+
+    def test_last_reference_removes_blob(self):
+        first = self.upload(self.alice, 'a.txt', b'shared content')
+        second = self.upload(self.bob, 'b.txt', b'shared content')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(Blob.objects.get().refcount, 1)
+        self.assertEqual(len(self.stored_blobs()), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertEqual(self.stored_blobs(), [])
+
+
+@override_settings(BLOB_STORAGE={
+    'BACKEND': 'accounts.storage.ShardedBlobStorage',
+    'OPTIONS': {'shards': {
+        shard: {'BACKEND': 'accounts.storage.LocalBlobStorage', 'OPTIONS': {'root': os.path.join('shards', shard)}}
+        for shard in ('a', 'b', 'c')
+    }},
+})
+class ShardedBlobStoreTests(BlobStoreTests):
+    pass
+
+
+@override_settings(BLOB_STORAGE={
+    'BACKEND': 'accounts.storage.S3BlobStorage',
+    'OPTIONS': {'bucket': 'fileshare-blobs', 'prefix': 'blobs/', 'emulator_root': 'object-store'},
+})
+class S3BlobStoreTests(BlobStoreTests):
+
+    def test_range_request_is_a_ranged_get(self):
+        uploaded_file = self.upload(self.alice, 'big.bin', bytes(range(256)) * 1000)
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        response = client.get(
+            f'/api/view/{encode_file_id(uploaded_file.id)}/', HTTP_ACCEPT='application/octet-stream', HTTP_RANGE='bytes=1000-1999',
+        )
+        self.assertEqual(response.status_code, 206)
+        key = base64.b64decode(response['X-AES-Key'])
+        nonce = base64.b64decode(response['X-AES-IV'])
+        data = ctr_transform(key, nonce, 1000, b''.join(response.streaming_content))
+        self.assertEqual(data, (bytes(range(256)) * 1000)[1000:2000])
+
+
+class ShardRingTests(MediaRootMixin, TestCase):
+
+    def ring(self, *shards):
+        return ShardedBlobStorage({
+            shard: {'BACKEND': 'accounts.storage.LocalBlobStorage', 'OPTIONS': {'root': shard}} for shard in shards
+        })
+
+    def save(self, storage, name):
+        path = os.path.join(settings.MEDIA_ROOT, 'upload.part')
+        with open(path, 'wb') as part:
+            part.write(name.encode())
+        storage.save(name, path)
+
+    def test_names_spread_evenly(self):
+        storage = self.ring('a', 'b', 'c', 'd')
+        counts = {}
+        for i in range(4000):
+            owner = storage.owners(hashlib.sha256(str(i).encode()).hexdigest())[0]
+            counts[owner] = counts.get(owner, 0) + 1
+        self.assertEqual(sorted(counts), ['a', 'b', 'c', 'd'])
+        self.assertLess(max(counts.values()) / min(counts.values()), 1.5)
+
+    def test_adding_a_shard_moves_few_names_and_keeps_them_readable(self):
+        names = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(200)]
+        before = self.ring('a', 'b', 'c')
+        for name in names:
+            self.save(before, name)
+
+        after = self.ring('a', 'b', 'c', 'd')
+        moved = [name for name in names if after.owners(name)[0] != before.owners(name)[0]]
+        self.assertTrue(all(after.owners(name)[0] == 'd' for name in moved))
+        self.assertLess(len(moved), len(names) / 2)
+        for name in names:
+            self.assertEqual(b''.join(after.open(name)), name.encode())
+
+
+class CompressionTests(MediaRootMixin, TestCase):
+    """
+    Compressible uploads are stored compressed and read back transparently;
+    already-compressed types and incompressible content are stored as they are.
+    """
+
+    TEXT = b'date,account,amount\n' + b''.join(b'2024-01-%02d,ACME-%d,%d.00\n' % (i % 28 + 1, i % 7, i) for i in range(5000))
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = CustomUser.objects.create_user('user')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_compressible_upload_is_stored_compressed(self):
+        uploaded_file = self.upload(self.user, 'ledger.csv', self.TEXT)
+
+        self.assertTrue(uploaded_file.blob.codec)
+        self.assertEqual(uploaded_file.blob.size, len(self.TEXT))
+        self.assertLess(uploaded_file.blob.stored_size * 3, len(self.TEXT))
+        self.assertEqual(self.download(uploaded_file), self.TEXT)
+        self.assertEqual(self.download(uploaded_file, HTTP_RANGE='bytes=70000-70999'), self.TEXT[70000:71000])
+
+        json_response = self.client.get(f'/api/view/{encode_file_id(uploaded_file.id)}/').json()
+        decryptor = Cipher(
+            algorithms.AES(base64.b64decode(json_response['aes_key'])), modes.CBC(base64.b64decode(json_response['aes_iv'])),
+        ).decryptor()
+        padded = decryptor.update(base64.b64decode(json_response['encrypted_content'])) + decryptor.finalize()
+        unpadder = padding.PKCS7(128).unpadder()
+        self.assertEqual(unpadder.update(padded) + unpadder.finalize(), self.TEXT)
+
+    def test_compressed_types_are_skipped(self):
+        uploaded_file = self.upload(self.user, 'photo.jpg', self.TEXT)
+        self.assertEqual(uploaded_file.blob.codec, '')
+        self.assertEqual(self.download(uploaded_file), self.TEXT)
+
+    def test_incompressible_content_is_skipped(self):
+        data = os.urandom(100000)
+        uploaded_file = self.upload(self.user, 'noise.bin', data)
+        self.assertEqual(uploaded_file.blob.codec, '')
+        self.assertEqual(self.download(uploaded_file), data)
+
+    @override_settings(FILE_COMPRESSION_CODEC='zlib')
+    def test_bytes_saved_are_counted(self):
+        uploaded_file = self.upload(self.user, 'ledger.csv', self.TEXT)
+        self.upload(self.user, 'photo.jpg', self.TEXT + b'\n')  # distinct content, or it would be deduplicated
+        self.upload(self.user, 'noise.bin', os.urandom(1000))
+
+        self.assertEqual(uploaded_file.blob.codec, 'zlib')
+        counters = metrics.snapshot(['compression.bytes_in', 'compression.bytes_out', 'compression.skipped_type', 'compression.skipped_ratio'])
+        self.assertEqual(counters, {
+            'compression.bytes_in': len(self.TEXT),
+            'compression.bytes_out': uploaded_file.blob.stored_size,
+            'compression.skipped_type': 1,
+            'compression.skipped_ratio': 1,
+        })
+
+    def test_storage_stats_reports_bytes_saved(self):
+        uploaded_file = self.upload(self.user, 'ledger.csv', self.TEXT)
+        self.upload(self.user, 'photo.jpg', self.TEXT + b'\n')
+
+        out = StringIO()
+        call_command('storage_stats', stdout=out)
+        saved = len(self.TEXT) - uploaded_file.blob.stored_size
+        self.assertIn(f"{saved} saved", out.getvalue())
+
+
+@override_settings(FILE_X_ACCEL_REDIRECT_PREFIX='/protected-media/')
+class XAccelRedirectTests(MediaRootMixin, TestCase):
+    """
+    Files stored exactly as they are served are handed to nginx with
+    X-Accel-Redirect; compressed and plaintext legacy files stream from Django.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = CustomUser.objects.create_user('user')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fetch(self, uploaded_file):
+        return self.client.get(f'/api/view/{encode_file_id(uploaded_file.id)}/', HTTP_ACCEPT='application/octet-stream')
+
+    def test_stored_ciphertext_is_sent_by_nginx(self):
+        data = os.urandom(10000)
+        uploaded_file = self.upload(self.user, 'report.pdf', data)
+        self.assertEqual(uploaded_file.blob.codec, '')
+
+        response = self.fetch(uploaded_file)
+
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/blobs/{uploaded_file.blob.name}')
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertEqual(response['X-Cipher-Suite'], 'aes-256-ctr')
+        self.assertEqual(response['X-File-Name'], 'report.pdf')
+        self.assertIn('attachment', response['Content-Disposition'])
+        # The key headers decrypt the stored bytes nginx will send
+        with open(media_file_path('blobs', *uploaded_file.blob.name.split('/')), 'rb') as stored:
+            key = base64.b64decode(response['X-AES-Key'])
+            nonce = base64.b64decode(response['X-AES-IV'])
+            self.assertEqual(ctr_transform(key, nonce, 0, stored.read()), data)
+
+    def test_compressed_and_plaintext_files_stream_from_django(self):
+        compressed = self.upload(self.user, 'table.csv', b'date,account,amount\n' * 5000)
+        self.assertTrue(compressed.blob.codec)
+        path = media_file_path('decrypted_files', 'legacy.txt')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(b'stored before encryption at rest')
+        legacy = UploadedFile.objects.create(
+            user=self.user, file_name='legacy.txt', file=os.path.relpath(path, settings.MEDIA_ROOT), encrypted=False,
+        )
+
+        for uploaded_file, data in ((compressed, b'date,account,amount\n' * 5000), (legacy, b'stored before encryption at rest')):
+            response = self.fetch(uploaded_file)
+            self.assertTrue(response.streaming)
+            self.assertNotIn('X-Accel-Redirect', response)
+            key = base64.b64decode(response['X-AES-Key'])
+            nonce = base64.b64decode(response['X-AES-IV'])
+            self.assertEqual(ctr_transform(key, nonce, 0, b''.join(response.streaming_content)), data)
+
+
+class AsyncFileEndpointTests(MediaRootMixin, TestCase):
+    """
+    The async upload, view and access endpoints behave like their synchronous
+    counterparts, and concurrent downloads do not each hold a thread.
+    """
+
+    KEY = bytes(range(32))
+    IV = bytes(range(16))
+    DATA = os.urandom(300000)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.owner = CustomUser.objects.create_user('owner')
+        self.stranger = CustomUser.objects.create_user('stranger')
+        self.owner_auth = {'Authorization': f'Bearer {AccessToken.for_user(self.owner)}'}
+
+    async def upload_async(self, file_name, data):
+        response = await self.async_client.post(
+            '/api/async/upload/', _cbc_encrypt(self.KEY, self.IV, data), content_type='application/octet-stream',
+            headers={**self.owner_auth, 'X-File-Name': file_name, 'X-AES-Key': self.KEY.hex(), 'X-AES-IV': self.IV.hex()},
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        uploaded_file = await UploadedFile.objects.aget(file_name=file_name)
+        return encode_file_id(uploaded_file.id)
+
+    async def download_async(self, file_id, **headers):
+        response = await self.async_client.get(
+            f'/api/async/access/{file_id}/', headers={**self.owner_auth, 'Accept': 'application/octet-stream', **headers},
+        )
+        return response, b''.join([block async for block in response.streaming_content])
+
+    async def test_upload_and_ranged_download(self):
+        file_id = await self.upload_async('data.bin', self.DATA)
+
+        response, ciphertext = await self.download_async(file_id, Range='bytes=100000-199999')
+        self.assertEqual(response.status_code, 206)
+        key = base64.b64decode(response['X-AES-Key'])
+        nonce = base64.b64decode(response['X-AES-IV'])
+        self.assertEqual(ctr_transform(key, nonce, 100000, ciphertext), self.DATA[100000:200000])
+
+    async def test_large_json_upload_for_legacy_clients(self):
+        data = os.urandom(settings.DATA_UPLOAD_MAX_MEMORY_SIZE)  # Over the limit once base64 encoded
+        response = await self.async_client.post('/api/async/upload/', {
+            'file_name': 'large.bin', 'aes_key': self.KEY.hex(), 'aes_iv': self.IV.hex(),
+            'encrypted_content': base64.b64encode(_cbc_encrypt(self.KEY, self.IV, data)).decode(),
+        }, content_type='application/json', headers=self.owner_auth)
+        self.assertEqual(response.status_code, 200, response.content)
+
+        uploaded_file = await UploadedFile.objects.select_related('blob').aget(file_name='large.bin')
+        self.assertEqual(uploaded_file.blob.size, len(data))
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=100)
+    async def test_oversized_form_fields_are_refused(self):
+        response = await self.async_client.post('/api/async/upload/', {
+            'file_name': 'x' * 200, 'aes_key': self.KEY.hex(), 'aes_iv': self.IV.hex(),
+            'file': SimpleUploadedFile('data.bin', _cbc_encrypt(self.KEY, self.IV, b'data')),
+        }, headers=self.owner_auth)
+        self.assertEqual(response.status_code, 413)
+
+    async def test_json_view_for_legacy_clients(self):
+        file_id = await self.upload_async('notes.txt', b'meeting notes')
+
+        response = await self.async_client.get(f'/api/async/view/{file_id}/', headers=self.owner_auth)
+        body = response.json()
+        decryptor = Cipher(
+            algorithms.AES(base64.b64decode(body['aes_key'])), modes.CBC(base64.b64decode(body['aes_iv'])),
+        ).decryptor()
+        padded = decryptor.update(base64.b64decode(body['encrypted_content'])) + decryptor.finalize()
+        unpadder = padding.PKCS7(128).unpadder()
+        self.assertEqual(unpadder.update(padded) + unpadder.finalize(), b'meeting notes')
+
+    async def test_requires_a_valid_token_and_permission(self):
+        file_id = await self.upload_async('data.bin', b'secret')
+
+        response = await self.async_client.get(f'/api/async/access/{file_id}/')
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(f'/api/async/access/{file_id}/', headers={'Authorization': 'Bearer nonsense'})
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(
+            f'/api/async/access/{file_id}/', headers={'Authorization': f'Bearer {AccessToken.for_user(self.stranger)}'},
+        )
+        self.assertEqual(response.status_code, 403)
+        response = await self.async_client.post(f'/api/async/access/{file_id}/', headers=self.owner_auth)
+        self.assertEqual(response.status_code, 405)
+
+    async def test_concurrent_downloads_share_the_event_loop(self):
+        file_id = await self.upload_async('data.bin', self.DATA)
+        threads_before = threading.active_count()
+
+        # Many clients, each reading one block in turn as a slow client would
+        responses = await asyncio.gather(*[
+            self.async_client.get(
+                f'/api/async/access/{file_id}/', headers={**self.owner_auth, 'Accept': 'application/octet-stream'},
+            )
+            for _ in range(100)
+        ])
+        streams = [response.streaming_content.__aiter__() for response in responses]
+        received = [[] for _ in streams]
+        for _ in range(len(self.DATA) // settings.DOWNLOAD_BLOCK_SIZE + 1):
+            for stream, blocks in zip(streams, received):
+                blocks.append(await stream.__anext__())
+
+        self.assertLess(threading.active_count() - threads_before, 50)
+        for response, blocks in zip(responses, received):
+            key = base64.b64decode(response['X-AES-Key'])
+            nonce = base64.b64decode(response['X-AES-IV'])
+            self.assertEqual(ctr_transform(key, nonce, 0, b''.join(blocks)), self.DATA)
+
+
+    async def test_synchronous_endpoints_stream_under_asgi(self):
+        file_id = await self.upload_async('data.bin', self.DATA)
+
+        for url in (f'/api/view/{file_id}/', f'/api/access/{file_id}/'):
+            with self.subTest(url=url):
+                response = await self.async_client.get(
+                    url, headers={**self.owner_auth, 'Accept': 'application/octet-stream'},
+                )
+                # Produced a block at a time rather than read into memory first
+                self.assertTrue(response.is_async)
+                ciphertext = b''.join([block async for block in response.streaming_content])
+                key = base64.b64decode(response['X-AES-Key'])
+                nonce = base64.b64decode(response['X-AES-IV'])
+                self.assertEqual(ctr_transform(key, nonce, 0, ciphertext), self.DATA)
+
+@override_settings(CRYPTO_THREADS=4, CRYPTO_SEGMENT_SIZE=4096)
+class ParallelCryptoTests(TestCase):
+    """
+    Segmented crypto on the thread pool produces exactly the serial result.
+    """
+
+    KEY, NONCE = new_data_key()
+    DATA = os.urandom(100000)
+
+    def test_ctr_segments_match_one_pass(self):
+        for offset in (0, 5, 4096, 123457):
+            with self.subTest(offset=offset):
+                expected = ctr_transform(self.KEY, self.NONCE, offset, self.DATA)
+                self.assertEqual(ctr_transform_parallel(self.KEY, self.NONCE, offset, self.DATA), expected)
+                self.assertEqual(ctr_transform_parallel(self.KEY, self.NONCE, offset, self.DATA, threads=2), expected)
+                # Irregular blocks are regrouped into segments
+                blocks = [self.DATA[i:i + 7777] for i in range(0, len(self.DATA), 7777)]
+                self.assertEqual(b''.join(ctr_transform_stream(blocks, self.KEY, self.NONCE, offset)), expected)
+
+    def test_upload_ingest_decrypts_segments_in_place(self):
+        aes_key, aes_iv = os.urandom(32), os.urandom(16)
+        ciphertext = _cbc_encrypt(aes_key, aes_iv, self.DATA)
+        pieces = [ciphertext[i:i + 10001] for i in range(0, len(ciphertext), 10001)]
+        path = os.path.join(tempfile.mkdtemp(), 'upload.part')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+
+        self.assertEqual(decrypt_stream_to_file(aes_key, aes_iv, pieces, path, self.KEY, self.NONCE), len(self.DATA))
+        with open(path, 'rb') as f:
+            self.assertEqual(ctr_transform(self.KEY, self.NONCE, 0, f.read()), self.DATA)
+
+        with self.assertRaises(ValueError):
+            decrypt_stream_to_file(aes_key, aes_iv, [ciphertext[:-1]], path, self.KEY, self.NONCE)
+
+
+@override_settings(CIPHER_FRAME_SIZE=1000, CIPHER_SUITES=['aes-256-gcm-frames', 'chacha20-poly1305-frames', 'aes-256-ctr'])
+class CipherSuiteTests(MediaRootMixin, TestCase):
+    """
+    Transfers use the server's preferred suite among those the client offers,
+    and framed suites detect tampered, reordered and truncated frames.
+    """
+
+    KEY = bytes(range(32))
+    DATA = os.urandom(4500)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = CustomUser.objects.create_user('user')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def open_all(self, suite, key, nonce, ciphertext, frame_size=1000):
+        return b''.join(
+            suite.open_frame(key, nonce, index, record, final)
+            for index, record, final in suite.records([ciphertext], frame_size)
+        )
+
+    def upload_with_suite(self, suite_name, ciphertext, nonce, file_name='data.bin'):
+        return self.client.post(
+            '/api/upload/', ciphertext, content_type='application/octet-stream',
+            HTTP_X_FILE_NAME=file_name, HTTP_X_CIPHER_SUITE=suite_name, HTTP_X_CIPHER_FRAME_SIZE='1000',
+            HTTP_X_CIPHER_KEY=self.KEY.hex(), HTTP_X_CIPHER_NONCE=nonce.hex(),
+        )
+
+    def test_frames_detect_tampering_reordering_and_truncation(self):
+        for suite in (CIPHER_SUITES['aes-256-gcm-frames'], CIPHER_SUITES['chacha20-poly1305-frames']):
+            with self.subTest(suite=suite.name):
+                key, nonce = suite.new_key()
+                ciphertext = suite.encrypt(key, nonce, self.DATA, 1000)
+                self.assertEqual(len(ciphertext), suite.wire_size(len(self.DATA), 1000))
+                self.assertEqual(self.open_all(suite, key, nonce, ciphertext), self.DATA)
+
+                record = 1000 + TAG_BYTES
+                tampered = bytearray(ciphertext)
+                tampered[5] ^= 1
+                swapped = ciphertext[record:2 * record] + ciphertext[:record] + ciphertext[2 * record:]
+                for broken in (bytes(tampered), swapped, ciphertext[:4 * record], ciphertext[:-1]):
+                    with self.assertRaises(IntegrityError):
+                        self.open_all(suite, key, nonce, broken)
+
+    def test_negotiation_picks_the_servers_preference(self):
+        self.assertEqual(negotiate('aes-256-ctr, chacha20-poly1305-frames').name, 'chacha20-poly1305-frames')
+        self.assertEqual(negotiate('AES-256-GCM-FRAMES,aes-256-ctr').name, 'aes-256-gcm-frames')
+        self.assertIsNone(negotiate('rot13'))
+        self.assertIsNone(negotiate(None))
+        with override_settings(CIPHER_SUITES=None):
+            # The default order is fixed, authenticated suites first
+            with mock.patch('accounts.cipher_suites.measure_throughput') as measure_throughput:
+                self.assertEqual(suite_ranking(), ('aes-256-gcm-frames', 'chacha20-poly1305-frames', 'aes-256-ctr'))
+            measure_throughput.assert_not_called()
+
+    def test_framed_upload_and_ranged_download(self):
+        suite = CIPHER_SUITES['chacha20-poly1305-frames']
+        _, nonce = suite.new_key()
+        self.assertEqual(self.upload_with_suite(suite.name, suite.encrypt(self.KEY, nonce, self.DATA, 1000), nonce).status_code, 200)
+        file_id = encode_file_id(UploadedFile.objects.get().id)
+
+        response = self.client.get(
+            f'/api/view/{file_id}/', HTTP_ACCEPT='application/octet-stream',
+            HTTP_X_CIPHER_SUITES='aes-256-gcm-frames, aes-256-ctr',
+        )
+        self.assertEqual(response['X-Cipher-Suite'], 'aes-256-gcm-frames')
+        gcm = CIPHER_SUITES['aes-256-gcm-frames']
+        key, nonce = base64.b64decode(response['X-Cipher-Key']), base64.b64decode(response['X-Cipher-Nonce'])
+        ciphertext = b''.join(response.streaming_content)
+        self.assertEqual(self.open_all(gcm, key, nonce, ciphertext), self.DATA)
+
+        # A range of the framed representation matches the full response
+        response = self.client.get(
+            f'/api/view/{file_id}/', HTTP_ACCEPT='application/octet-stream',
+            HTTP_X_CIPHER_SUITES='aes-256-gcm-frames', HTTP_RANGE='bytes=1500-3100',
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 1500-3100/{len(ciphertext)}')
+        self.assertEqual(b''.join(response.streaming_content), ciphertext[1500:3101])
+
+    def test_json_download_with_a_negotiated_suite(self):
+        suite = CIPHER_SUITES['aes-256-gcm-frames']
+        _, nonce = suite.new_key()
+        self.upload_with_suite(suite.name, suite.encrypt(self.KEY, nonce, self.DATA, 1000), nonce)
+        file_id = encode_file_id(UploadedFile.objects.get().id)
+
+        body = self.client.get(f'/api/access/{file_id}/', HTTP_X_CIPHER_SUITES='aes-256-gcm-frames').json()
+        self.assertEqual(body['cipher_suite'], 'aes-256-gcm-frames')
+        self.assertEqual(self.open_all(
+            suite, base64.b64decode(body['key']), base64.b64decode(body['nonce']),
+            base64.b64decode(body['encrypted_content']), body['frame_size'],
+        ), self.DATA)
+
+        # Without an offer, binary clients still get the AES-CTR stream
+        response = self.client.get(f'/api/access/{file_id}/', HTTP_ACCEPT='application/octet-stream')
+        self.assertEqual(response['X-AES-Mode'], 'CTR')
+
+    def test_rejected_uploads(self):
+        suite = CIPHER_SUITES['aes-256-gcm-frames']
+        _, nonce = suite.new_key()
+        ciphertext = bytearray(suite.encrypt(self.KEY, nonce, self.DATA, 1000))
+        ciphertext[-1] ^= 1
+
+        response = self.upload_with_suite(suite.name, bytes(ciphertext), nonce)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Integrity check failed', response.json()['error'])
+        response = self.upload_with_suite('rot13', bytes(ciphertext), nonce)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('aes-256-gcm-frames', response.json()['cipher_suites'])
+        self.assertFalse(UploadedFile.objects.exists())
+        self.assertEqual(os.listdir(media_file_path('upload_sessions')), [])
+
+
+class CachedAuthenticationTests(TestCase):
+    """
+    Authenticated requests load the user from a cached principal, which any
+    save of the user invalidates.
+    """
+
+    def setUp(self):
+        cache.clear()
+        rate_store.cache_clear()
+        self.user = CustomUser.objects.create_user('owner', first_name='Ada', last_name='Lovelace', role='user')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_cache_hit_needs_no_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/user-details/').json()['name'], 'Ada Lovelace')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/user-details/')
+        self.assertEqual(response.json(), {'username': 'owner', 'role': 'user', 'name': 'Ada Lovelace'})
+
+    def test_saving_the_user_invalidates(self):
+        self.client.get('/api/user-details/')
+        self.user.first_name = 'Grace'
+        self.user.save()
+        self.assertEqual(self.client.get('/api/user-details/').json()['name'], 'Grace Lovelace')
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/user-details/').status_code, 401)
+        self.assertEqual(self.client.get('/api/async/view/x/').status_code, 401)
+
+    def test_password_reset_invalidates(self):
+        self.client.get('/api/user-details/')
+        token = issue_token(self.user, OneTimeToken.RESET_PASSWORD, timezone.timedelta(hours=1))
+        CustomUser.objects.filter(id=self.user.id).update(role='guest')
+
+        self.client.post('/api/reset-password-confirm/', {'token': token, 'new_password': 'changed'}, format='json')
+        self.assertEqual(self.client.get('/api/user-details/').json()['role'], 'guest')
+
+    def test_deleted_user_is_rejected(self):
+        self.client.get('/api/user-details/')
+        self.user.delete()
+        self.assertEqual(self.client.get('/api/user-details/').status_code, 401)
+
+
+    def test_saves_invalidate_in_a_process_that_never_authenticated(self):
+        # A fresh process, such as a management command, that saves a user
+        # before any request has imported the authentication module
+        script = (
+            "import sys, django; django.setup(); "
+            "from django.core.cache import cache; "
+            "from django.db.models.signals import post_save; "
+            "from accounts.models import CustomUser; "
+            "cache.set('auth-user-version:1', 5, None); "
+            "post_save.send(sender=CustomUser, instance=CustomUser(id=1), created=False); "
+            "sys.exit(cache.get('auth-user-version:1') == 5)"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, capture_output=True, text=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'backend.settings'},
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+class CountingEmailBackend(LocmemEmailBackend):
+    """
+    The locmem backend with the SMTP backend's connection lifecycle, counting
+    the connections it opens.
+    """
+    opened = 0
+    connected = False
+
+    def open(self):
+        if self.connected:
+            return False
+        CountingEmailBackend.opened += 1
+        self.connected = True
+        return True
+
+    def close(self):
+        self.connected = False
+
+
+class FailingEmailBackend(LocmemEmailBackend):
+    def send_messages(self, messages):
+        raise ConnectionRefusedError("SMTP server unavailable")
+
+
+class MailQueueTests(TestCase):
+    """
+    Views queue their emails; send_queued_mail delivers them in batches over
+    one connection and retries failures with backoff.
+    """
+
+    def setUp(self):
+        cache.clear()
+        rate_store.cache_clear()
+
+    def test_registration_queues_instead_of_sending(self):
+        response = APIClient().post('/api/register/', {
+            'username': 'newcomer', 'password': 'secret', 'email': 'newcomer@example.com',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(OutboundEmail.objects.get().recipients, ['newcomer@example.com'])
+
+        self.assertEqual(send_queued_mail(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('/api/verify-email/?token=', mail.outbox[0].body)
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    def test_password_reset_link(self):
+        CustomUser.objects.create_user('owner', email='owner@example.com')
+        APIClient().post('/api/reset-password/', {'email': 'owner@example.com'}, format='json')
+        send_queued_mail()
+        self.assertIn(f"{settings.BACKEND_URL}/reset-password/?token=", mail.outbox[0].body)
+
+    @override_settings(EMAIL_BACKEND=f'{__name__}.CountingEmailBackend')
+    def test_batches_share_one_connection(self):
+        CountingEmailBackend.opened = 0
+        for i in range(5):
+            queue_mail(f"Message {i}", "Body", [f"user{i}@example.com"])
+
+        self.assertEqual(send_queued_mail(batch_size=2), (5, 0))
+        self.assertEqual([message.subject for message in mail.outbox], [f"Message {i}" for i in range(5)])
+        self.assertEqual(CountingEmailBackend.opened, 1)
+
+    @override_settings(EMAIL_BACKEND=f'{__name__}.FailingEmailBackend', MAIL_QUEUE_MAX_ATTEMPTS=3)
+    def test_failures_back_off_then_give_up(self):
+        message = queue_mail("Subject", "Body", ['user@example.com'])
+        self.assertEqual(send_queued_mail(), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual(message.attempts, 1)
+        self.assertIn('SMTP server unavailable', message.last_error)
+        self.assertGreater(message.next_attempt_at, timezone.now() + retry_delay(1) - timezone.timedelta(seconds=5))
+        # Not due yet
+        self.assertEqual(send_queued_mail(), (0, 0))
+
+        self.assertEqual(retry_delay(2), 2 * retry_delay(1))
+        for attempts in (2, 3):
+            OutboundEmail.objects.filter(id=message.id).update(next_attempt_at=timezone.now())
+            self.assertEqual(send_queued_mail(), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual(message.attempts, 3)
+        self.assertIsNone(message.next_attempt_at)
+        self.assertEqual(metrics.get('mail.failed'), 3)
+
+
+def _signing_certificate(key_id):
+    """
+    Returns (signer, PEM certificate) for a fresh RSA key, as Google publishes them.
+    """
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, key_id)])
+    now = timezone.now()
+    certificate = (
+        x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(private_key.public_key())
+        .serial_number(x509.random_serial_number()).not_valid_before(now).not_valid_after(now + timezone.timedelta(days=1))
+        .sign(private_key, hashes.SHA256())
+    )
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+    )
+    return crypt.RSASigner.from_string(private_pem, key_id), certificate.public_bytes(serialization.Encoding.PEM).decode()
+
+
+class GoogleCertCacheTests(TestCase):
+    """
+    Google ID tokens are verified against certificates fetched from a stub
+    endpoint once per max-age, however many logins arrive at once.
+    """
+
+    CLIENT_ID = 'client.apps.googleusercontent.com'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.signer, certificate = _signing_certificate('key-1')
+        cls.certs = {'key-1': certificate}
+        cls.cache_control = 'public, max-age=3600'
+        cls.fetches = 0
+
+        tests = cls
+
+        class CertsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                tests.fetches += 1
+                time.sleep(0.05)
+                body = json.dumps(tests.certs).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Cache-Control', tests.cache_control)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), CertsHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.certs_settings = override_settings(
+            GOOGLE_OAUTH_CERTS_URL=f'http://127.0.0.1:{cls.server.server_port}/certs',
+            GOOGLE_OAUTH_CLIENT_ID=cls.CLIENT_ID,
+        )
+        cls.certs_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.certs_settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        rate_store.cache_clear()
+        type(self).fetches = 0
+        type(self).cache_control = 'public, max-age=3600'
+
+    def token(self, signer=None, **claims):
+        issued = int(time.time())
+        payload = {
+            'iss': 'https://accounts.google.com', 'aud': self.CLIENT_ID, 'iat': issued, 'exp': issued + 600,
+            'email': 'someone@example.com', **claims,
+        }
+        return google_jwt.encode(signer or self.signer, payload).decode()
+
+    def test_login_burst_fetches_once(self):
+        token = self.token()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(verify_google_id_token(token, self.CLIENT_ID))) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([claims['email'] for claims in results], ['someone@example.com'] * 20)
+        self.assertEqual(self.fetches, 1)
+
+    def test_max_age_is_honored(self):
+        verify_google_id_token(self.token(), self.CLIENT_ID)
+        verify_google_id_token(self.token(), self.CLIENT_ID)
+        self.assertEqual(self.fetches, 1)
+
+        cache.clear()
+        type(self).cache_control = 'no-cache, max-age=0'
+        verify_google_id_token(self.token(), self.CLIENT_ID)
+        verify_google_id_token(self.token(), self.CLIENT_ID)
+        self.assertEqual(self.fetches, 3)
+
+    def test_unknown_key_refetches_at_most_once_per_interval(self):
+        verify_google_id_token(self.token(), self.CLIENT_ID)
+        stranger, _ = _signing_certificate('key-2')
+        for _ in range(3):
+            with self.assertRaises(ValueError):
+                verify_google_id_token(self.token(stranger), self.CLIENT_ID)
+        self.assertEqual(self.fetches, 1)
+
+        with override_settings(GOOGLE_CERTS_MIN_REFRESH=0):
+            with self.assertRaises(ValueError):
+                verify_google_id_token(self.token(stranger), self.CLIENT_ID)
+        self.assertEqual(self.fetches, 2)
+
+    def test_google_login_view(self):
+        response = APIClient().post('/api/google-login/', {'token': self.token()}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.json())
+        self.assertTrue(CustomUser.objects.filter(email='someone@example.com').exists())
+
+        for token in (self.token(iss='https://evil.example.com'), self.token(aud='someone-else'), 'not-a-token'):
+            response = APIClient().post('/api/google-login/', {'token': token}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+
+class OneTimeTokenTests(TestCase):
+    """
+    Verification and reset tokens are stored hashed, work once, expire, and
+    are purged in batches.
+    """
+
+    def setUp(self):
+        cache.clear()
+        rate_store.cache_clear()
+        self.user = CustomUser.objects.create_user('owner', email='owner@example.com', password='secret')
+
+    def test_email_verification(self):
+        APIClient().post('/api/register/', {
+            'username': 'newcomer', 'password': 'secret', 'email': 'newcomer@example.com',
+        }, format='json')
+        newcomer = CustomUser.objects.get(username='newcomer')
+        token = OutboundEmail.objects.get().body.split('token=')[1]
+        self.assertEqual(OneTimeToken.objects.get(user=newcomer).token_hash, hash_token(token))
+        self.assertFalse(OneTimeToken.objects.filter(token_hash=token).exists())
+
+        self.assertEqual(APIClient().get('/api/verify-email/', {'token': token}).status_code, 200)
+        newcomer.refresh_from_db()
+        self.assertTrue(newcomer.is_active)
+        # Used up
+        self.assertEqual(APIClient().get('/api/verify-email/', {'token': token}).status_code, 400)
+
+    def test_password_reset(self):
+        APIClient().post('/api/reset-password/', {'email': 'owner@example.com'}, format='json')
+        first = OutboundEmail.objects.get().body.split('token=')[1]
+        APIClient().post('/api/reset-password/', {'email': 'owner@example.com'}, format='json')
+        second = OutboundEmail.objects.latest('id').body.split('token=')[1]
+
+        # A new request replaces the earlier link
+        response = APIClient().post('/api/reset-password-confirm/', {'token': first, 'new_password': 'changed'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = APIClient().post('/api/reset-password-confirm/', {'token': second, 'new_password': 'changed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('changed'))
+        self.assertFalse(OneTimeToken.objects.exists())
+
+    def test_tokens_are_purpose_bound_and_expire(self):
+        token = issue_token(self.user, OneTimeToken.RESET_PASSWORD, timezone.timedelta(hours=1))
+        self.assertIsNone(consume_token(token, OneTimeToken.VERIFY_EMAIL))
+        expired = issue_token(self.user, OneTimeToken.VERIFY_EMAIL, timezone.timedelta(seconds=-1))
+        self.assertIsNone(consume_token(expired, OneTimeToken.VERIFY_EMAIL))
+        self.assertIsNone(consume_token(None, OneTimeToken.VERIFY_EMAIL))
+        self.assertEqual(consume_token(token, OneTimeToken.RESET_PASSWORD), self.user)
+
+    def test_purge_expired_tokens(self):
+        users = [CustomUser.objects.create_user(f'user{i}') for i in range(5)]
+        for user in users:
+            issue_token(user, OneTimeToken.VERIFY_EMAIL, timezone.timedelta(seconds=-1))
+        live = issue_token(self.user, OneTimeToken.VERIFY_EMAIL, timezone.timedelta(hours=1))
+
+        self.assertEqual(purge_expired_tokens(batch_size=2), 5)
+        out = StringIO()
+        call_command('purge_expired_tokens', stdout=out)
+        self.assertIn('Deleted 0 expired token(s).', out.getvalue())
+        self.assertEqual(consume_token(live, OneTimeToken.VERIFY_EMAIL), self.user)
+
+
+class ShareExpiryTests(TestCase):
+    """
+    Expired shares drop out of listings at once and are deleted in batches by
+    the reaper, which invalidates what they were cached in.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user('owner')
+        self.owner_client = APIClient()
+        self.owner_client.force_authenticate(self.owner)
+        self.recipient = CustomUser.objects.create_user('recipient')
+        self.recipient_client = APIClient()
+        self.recipient_client.force_authenticate(self.recipient)
+        self.files = [UploadedFile.objects.create(user=self.owner, file_name=f'{i}.pdf', file=f'{i}.pdf') for i in range(5)]
+        current_time = timezone.now()
+        # Files 0-2 expired, 3 expires later and 4 never does
+        for uploaded_file, expiration_time in zip(self.files, [
+            current_time - timezone.timedelta(hours=3), current_time - timezone.timedelta(hours=2),
+            current_time - timezone.timedelta(hours=1), current_time + timezone.timedelta(hours=1), None,
+        ]):
+            SharedFile.objects.create(
+                file=uploaded_file, shared_with=self.recipient, owner=self.owner, view_permission=True,
+                expiration_time=expiration_time,
+            )
+
+    def test_listings_exclude_expired_shares(self):
+        files = self.recipient_client.get('/api/current-access-files/').json()['files']
+        self.assertEqual(sorted(f['file_name'] for f in files), ['3.pdf', '4.pdf'])
+        for uploaded_file, expected in [(self.files[0], []), (self.files[3], ['recipient'])]:
+            response = self.owner_client.get(f'/api/shared-with/{encode_file_id(uploaded_file.id)}/')
+            self.assertEqual([user['username'] for user in response.json()['shared_users']], expected)
+
+    def test_reaper_deletes_expired_shares_in_batches(self):
+        file_id = encode_file_id(self.files[0].id)
+        # Warm the permission cache and listing caches with the expired share
+        self.assertEqual(self.recipient_client.get(f'/api/view/{file_id}/').status_code, 403)
+        shared_users = self.owner_client.get(f'/api/shared-with/{file_id}/')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(reap_expired_shares(batch_size=2), 3)
+        # Two full batches, then an empty read
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('DELETE')]), 2)
+        self.assertEqual(
+            sorted(SharedFile.objects.values_list('file__file_name', flat=True)), ['3.pdf', '4.pdf'],
+        )
+        response = self.owner_client.get(f'/api/shared-with/{file_id}/', HTTP_IF_NONE_MATCH=shared_users['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+        out = StringIO()
+        call_command('reap_expired_shares', stdout=out)
+        self.assertIn('Deleted 0 expired share(s).', out.getvalue())
+
+
+def mock_time(seconds):
+    """
+    Freezes the rate limiter's clock at seconds past the epoch.
+    """
+    return mock.patch('accounts.throttling.time', SimpleNamespace(time=lambda: seconds, monotonic=time.monotonic))
+
+
+class AuthThrottleTests(TestCase):
+    """
+    Sign-in endpoints answer 429 from sliding-window counters per address and
+    per username, before any password is hashed.
+    """
+
+    def setUp(self):
+        cache.clear()
+        rate_store.cache_clear()
+        CustomUser.objects.create_user('owner', email='owner@example.com', password='secret')
+
+    def login(self, username, address='10.0.0.1'):
+        return APIClient().post(
+            '/api/login/', {'username': username, 'password': 'wrong'}, format='json', REMOTE_ADDR=address,
+        )
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '5/min', 'login_username': '3/min',
+    }})
+    def test_login_is_limited_per_username_and_address(self):
+        for _ in range(3):
+            self.assertEqual(self.login('owner').status_code, 401)
+        # The fourth try at one username is refused without a query, let alone a hash
+        with self.assertNumQueries(0):
+            response = self.login('owner', address='10.0.0.2')
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(response['Retry-After'])
+
+        # Other usernames from the first address until its own limit
+        self.assertEqual(self.login('someone').status_code, 401)
+        self.assertEqual(self.login('someone-else').status_code, 401)
+        self.assertEqual(self.login('another').status_code, 429)
+        self.assertEqual(metrics.get('throttle.login_username.throttled'), 1)
+        self.assertEqual(metrics.get('throttle.login_ip.throttled'), 1)
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'google_login_ip': '2/min'}})
+    def test_function_views_are_scoped_by_url_name(self):
+        statuses = [APIClient().post('/api/google-login/', {}, format='json').status_code for _ in range(3)]
+        self.assertEqual(statuses, [400, 400, 429])
+        # No rate for login: not limited
+        self.assertEqual([self.login('owner').status_code for _ in range(5)], [401] * 5)
+
+    def test_sliding_window_weighs_previous_window(self):
+        throttle_settings = override_settings(
+            REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'login_ip': '4/min'}},
+        )
+        with throttle_settings:
+            # Four attempts at the end of one minute
+            with mock_time(59.0):
+                self.assertEqual([self.login('a').status_code for _ in range(4)], [401] * 4)
+            # A quarter into the next minute they still weigh 3: one more fits
+            with mock_time(75.0):
+                self.assertEqual([self.login('a').status_code for _ in range(2)], [401, 429])
+            # Two minutes on, the slate is clean
+            with mock_time(180.0):
+                self.assertEqual(self.login('a').status_code, 401)
+
+    def test_stores(self):
+        for store in (LocalMemoryRateStore(), CacheRateStore()):
+            self.assertEqual([store.incr('key', 60) for _ in range(3)], [1, 2, 3])
+            self.assertEqual(store.get('key'), 3)
+            self.assertEqual(store.get('other'), 0)
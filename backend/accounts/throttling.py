@@ -0,0 +1,174 @@
+import hashlib
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+from .storage import build_storage
+
+# The login, registration, password reset and Google sign-in endpoints are
+# rate limited before the view runs, so a rejected attempt costs a counter
+# update instead of a password hash. The scope is the view's throttle_scope,
+# or its URL name for function views, and DEFAULT_THROTTLE_RATES holds
+# '<scope>_ip' and '<scope>_username' rates such as '10/min'; a scope without
+# a rate is not limited.
+#
+# Limits use a sliding-window counter: the count of the current fixed window
+# plus the previous window's count weighted by how much of it the sliding
+# window still covers. That needs two counters per key instead of a log of
+# every request, and has no burst at window boundaries as fixed windows do.
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+class LocalMemoryRateStore:
+    """
+    Counters in this process's memory. Fast, but each process counts alone,
+    so the effective limit is the rate times the number of processes.
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._next_purge = 1024
+
+    def incr(self, key, timeout):
+        """
+        Adds one to the counter called key, which expires timeout seconds after
+        it was created, and returns the new value.
+        """
+        current_time = time.monotonic()
+        with self._lock:
+            if len(self._counters) >= self._next_purge:
+                self._counters = {k: entry for k, entry in self._counters.items() if entry[1] > current_time}
+                self._next_purge = max(2 * len(self._counters), 1024)
+            value, expires_at = self._counters.get(key, (0, 0))
+            if expires_at <= current_time:
+                value, expires_at = 0, current_time + timeout
+            self._counters[key] = (value + 1, expires_at)
+            return value + 1
+
+    def get(self, key):
+        value, expires_at = self._counters.get(key, (0, 0))
+        return value if expires_at > time.monotonic() else 0
+
+
+class CacheRateStore:
+    """
+    Counters in a Django cache, shared by every process and node using it.
+    """
+
+    def __init__(self, alias='default'):
+        self._cache = caches[alias]
+
+    def incr(self, key, timeout):
+        try:
+            return self._cache.incr(key)
+        except ValueError:
+            # New or expired counter; a racing add means another request created it
+            if self._cache.add(key, 1, timeout):
+                return 1
+            return self._cache.incr(key)
+
+    def get(self, key):
+        return self._cache.get(key, 0)
+
+
+@lru_cache(maxsize=None)
+def rate_store():
+    """
+    The store configured in RATE_LIMIT_STORE, built once per process.
+    """
+    return build_storage(settings.RATE_LIMIT_STORE)
+
+
+@receiver(setting_changed)
+def _reset_rate_store(setting, **kwargs):
+    if setting == 'RATE_LIMIT_STORE':
+        rate_store.cache_clear()
+
+
+def parse_rate(rate):
+    """
+    Parses a rate such as '10/min' into (requests, window seconds).
+    """
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    Limits requests per key to the view's '<throttle_scope>_<kind>' rate.
+    """
+    kind = None
+
+    def get_key(self, request):
+        """
+        What to count requests by, or None to let the request through uncounted.
+        """
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None) or getattr(request.resolver_match, 'url_name', None)
+        rate_name = f"{scope}_{self.kind}"
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(rate_name)
+        key = self.get_key(request) if scope and rate else None
+        if key is None:
+            return True
+
+        limit, window = parse_rate(rate)
+        current_time = time.time()
+        window_index, elapsed = divmod(current_time, window)
+        counter = f"throttle:{rate_name}:{hashlib.sha256(key.encode()).hexdigest()[:32]}"
+        store = rate_store()
+        # Counters outlive their window by one more, while they weigh on the next
+        current = store.incr(f"{counter}:{int(window_index)}", 2 * window)
+        previous = store.get(f"{counter}:{int(window_index) - 1}")
+        self.wait_seconds = window - elapsed
+        if previous * (1 - elapsed / window) + current > limit:
+            metrics.increment(f"throttle.{rate_name}.throttled")
+            return False
+        metrics.increment(f"throttle.{rate_name}.allowed")
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class IPRateThrottle(SlidingWindowThrottle):
+    """
+    Counts requests per client address. Uvicorn takes it from nginx's
+    X-Forwarded-For, so NUM_PROXIES is 0.
+    """
+    kind = 'ip'
+
+    def get_key(self, request):
+        return self.get_ident(request)
+
+
+class UsernameRateThrottle(SlidingWindowThrottle):
+    """
+    Counts requests per username or email named in the request body, whatever
+    address they come from.
+    """
+    kind = 'username'
+
+    def get_key(self, request):
+        try:
+            data = request.data
+        except Exception:
+            # An unparsable body is rejected by the view without hashing anything
+            return None
+        if not hasattr(data, 'get'):
+            return None
+        value = data.get('username') or data.get('email')
+        if not isinstance(value, str) or not value.strip():
+            return None
+        return value.strip().lower()
@@ -0,0 +1,185 @@
+import os
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives import padding
+
+from .encryption import AES_BLOCK_BYTES, ctr_transform
+from .models import UploadSession
+from .parallel_crypto import map_in_order, regroup
+from .storage import media_file_path
+
+
+def decrypt_chunk(aes_key, aes_iv, chunk):
+    """
+    Decrypts one AES-CBC ciphertext chunk and returns (plaintext, next_iv).
+
+    CBC chains through the last ciphertext block, so the IV for the following
+    chunk is simply the tail of this one. That lets a transfer be resumed from
+    the saved IV instead of keeping a decryptor alive between requests.
+    """
+    if not chunk or len(chunk) % AES_BLOCK_BYTES:
+        raise ValueError("Chunk length must be a non-zero multiple of the AES block size.")
+
+    decryptor = Cipher(algorithms.AES(aes_key), modes.CBC(aes_iv)).decryptor()
+    plaintext = decryptor.update(chunk) + decryptor.finalize()
+    return plaintext, chunk[-AES_BLOCK_BYTES:]
+
+
+def write_chunk(path, offset, plaintext, data_key, data_nonce):
+    """
+    Encrypts decrypted bytes under the file's at-rest data key and writes them at
+    the given offset, so a retried chunk overwrites itself.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    mode = 'r+b' if os.path.exists(path) else 'wb'
+    with open(path, mode) as f:
+        f.seek(offset)
+        f.write(ctr_transform(data_key, data_nonce, offset, plaintext))
+        f.truncate()
+
+
+def strip_padding(path, data_key, data_nonce):
+    """
+    Validates and removes the PKCS7 padding from the final block of a file
+    encrypted at rest. CTR keeps offsets aligned, so only that block is decrypted.
+    """
+    with open(path, 'r+b') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size < AES_BLOCK_BYTES:
+            raise ValueError("Decrypted content is shorter than one AES block.")
+
+        f.seek(size - AES_BLOCK_BYTES)
+        last_block = ctr_transform(data_key, data_nonce, size - AES_BLOCK_BYTES, f.read(AES_BLOCK_BYTES))
+
+        unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+        unpadded = unpadder.update(last_block) + unpadder.finalize()
+
+        f.truncate(size - AES_BLOCK_BYTES + len(unpadded))
+
+
+def _write_in_place(path, decrypt_piece, pieces, data_key, data_nonce, threads=None):
+    """
+    Decrypts pieces on a crypto thread pool of the given size (default
+    crypto_threads()) and writes each one's plaintext, re-encrypted under the
+    file's data key, at its own offset in path.
+
+    pieces yields (offset, *arguments) tuples and decrypt_piece(*arguments)
+    returns the piece's plaintext. Pieces are independent, so they can finish
+    in any order; at most one per thread is in memory at a time.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        def store(offset, *arguments):
+            os.pwrite(f.fileno(), ctr_transform(data_key, data_nonce, offset, decrypt_piece(*arguments)), offset)
+
+        for _ in map_in_order(store, pieces, threads):
+            pass
+
+
+def _cbc_segment(aes_key, aes_iv, segment):
+    return decrypt_chunk(aes_key, aes_iv, segment)[0]
+
+
+def decrypt_stream_to_file(aes_key, aes_iv, chunks, path, data_key, data_nonce, threads=None):
+    """
+    Decrypts an iterable of AES-CBC ciphertext pieces of any size and stores
+    them in path re-encrypted under the file's at-rest data key.
+
+    Pieces are regrouped into CRYPTO_SEGMENT_SIZE segments. A CBC segment
+    decrypts with just the ciphertext block before it as its IV, and its CTR
+    offset is known up front, so segments are decrypted in parallel (see
+    _write_in_place), on threads threads when given. Memory stays at about one
+    piece plus one segment per thread regardless of the total size. Returns the
+    plaintext size.
+    """
+    segment_size = settings.CRYPTO_SEGMENT_SIZE - settings.CRYPTO_SEGMENT_SIZE % AES_BLOCK_BYTES
+
+    def segments():
+        offset = 0
+        iv = aes_iv
+        for segment in regroup(chunks, segment_size):
+            if len(segment) % AES_BLOCK_BYTES:
+                raise ValueError("Ciphertext length must be a non-zero multiple of the AES block size.")
+            yield offset, aes_key, iv, segment
+            iv = segment[-AES_BLOCK_BYTES:]
+            offset += len(segment)
+        if not offset:
+            raise ValueError("Ciphertext length must be a non-zero multiple of the AES block size.")
+
+    _write_in_place(path, _cbc_segment, segments(), data_key, data_nonce, threads)
+    strip_padding(path, data_key, data_nonce)
+    return os.path.getsize(path)
+
+
+def decrypt_upload_to_file(cipher_suite, key, nonce, chunks, path, data_key, data_nonce, frame_size=None):
+    """
+    Decrypts an upload encrypted with a negotiated cipher suite (None for the
+    original AES-CBC format) into path under the file's data key.
+
+    Framed suites verify every frame before it is written; IntegrityError is
+    raised on the first one that fails. Returns the plaintext size.
+    """
+    if cipher_suite is None:
+        return decrypt_stream_to_file(key, nonce, chunks, path, data_key, data_nonce)
+
+    if cipher_suite.framed:
+        pieces = (
+            (index * frame_size, key, nonce, index, record, final)
+            for index, record, final in cipher_suite.records(chunks, frame_size)
+        )
+        _write_in_place(path, cipher_suite.open_frame, pieces, data_key, data_nonce)
+    else:
+        def segments():
+            offset = 0
+            for segment in regroup(chunks, settings.CRYPTO_SEGMENT_SIZE):
+                yield offset, key, nonce, offset, segment
+                offset += len(segment)
+
+        _write_in_place(path, ctr_transform, segments(), data_key, data_nonce)
+    return os.path.getsize(path)
+
+
+def read_stream(stream, chunk_size):
+    """
+    Yields a file-like request body in chunks of at most chunk_size bytes.
+    """
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def purge_upload_sessions(batch_size=1000):
+    """
+    Deletes expired upload sessions batch_size at a time, with their part files,
+    then any part file under media/upload_sessions/ left untouched for longer
+    than UPLOAD_SESSION_LIFETIME (an upload whose worker died before it
+    cleaned up). Returns (sessions deleted, files deleted).
+    """
+    sessions = files = 0
+    cutoff = timezone.now()
+    while True:
+        expired = list(UploadSession.objects.filter(expires_at__lte=cutoff).only('id')[:batch_size])
+        if not expired:
+            break
+        for session in expired:
+            if os.path.exists(session.part_path):
+                os.remove(session.part_path)
+                files += 1
+        sessions += UploadSession.objects.filter(id__in=[session.id for session in expired]).delete()[0]
+
+    # Parts of live sessions and uploads in progress are younger than a session's lifetime
+    directory = media_file_path('upload_sessions')
+    stale_before = time.time() - settings.UPLOAD_SESSION_LIFETIME.total_seconds()
+    if os.path.isdir(directory):
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.stat().st_mtime < stale_before:
+                    os.remove(entry.path)
+                    files += 1
+    return sessions, files
@@ -1,6 +1,7 @@
 from django.urls import path
 from .views import *  # Make sure views are correctly imported
 from .views_auth import *
+from .views_async import *
 
 urlpatterns = [
     # Authentication
@@ -19,14 +20,26 @@ urlpatterns = [
 
     # File Operations
     path('api/upload/', upload_file, name='upload_file'),
+    path('api/upload/sessions/', init_upload_session, name='init_upload_session'),
+    path('api/upload/sessions/<uuid:upload_id>/', upload_session_status, name='upload_session_status'),
+    path('api/upload/sessions/<uuid:upload_id>/chunks/<int:chunk_index>/', upload_chunk, name='upload_chunk'),
+    path('api/upload/sessions/<uuid:upload_id>/commit/', commit_upload_session, name='commit_upload_session'),
     path('api/share/<str:encrypted_file_id>/', share_file, name='share_file'),
     path('api/access/<str:encrypted_file_id>/', access_shared_file, name='access_shared_file'),
     path('api/revoke/<str:encrypted_file_id>/', revoke_access, name='revoke_access'),
     path('api/current-access-files/', get_current_access_files, name='get_current_access_files'),
     path('api/view/<str:encrypted_file_id>/', view_file, name='view_file'),
+    path('api/cipher-suites/', get_cipher_suites, name='get_cipher_suites'),
 
     # Additional Endpoints
     path('api/all-files/', get_all_uploaded_files, name='get_all_uploaded_files'),
     path('api/shared-with/<str:encrypted_file_id>/', get_shared_users, name='get_shared_users'),
     path('api/update-permission/<str:encrypted_file_id>/', update_permission, name='update_permission'),
+    path('api/bulk-share/', bulk_share_files, name='bulk_share_files'),
+    path('api/bulk-revoke/', bulk_revoke_access, name='bulk_revoke_access'),
+
+    # Async file transfers, for ASGI deployments
+    path('api/async/upload/', upload_file_async, name='upload_file_async'),
+    path('api/async/view/<str:encrypted_file_id>/', view_file_async, name='view_file_async'),
+    path('api/async/access/<str:encrypted_file_id>/', access_shared_file_async, name='access_shared_file_async'),
 ]
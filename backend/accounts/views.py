@@ -1,35 +1,51 @@
+import asyncio
 import base64
+import binascii
 import json
 import logging
 import os
+from urllib.parse import quote, unquote
 
-from cryptography.fernet import Fernet
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives import padding
-from Crypto.Cipher import AES
-from Crypto.Random import get_random_bytes
 from base64 import b64decode
 
 
-from django.http import JsonResponse, HttpResponse
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.utils.decorators import method_decorator
+from django.utils.http import content_disposition_header
 from django.views.decorators.csrf import csrf_exempt
 
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
-from .models import CustomUser, UploadedFile, SharedFile
+from .models import CustomUser, UploadedFile, SharedFile, UploadSession
+from .access import resolve_file_access, invalidate_file_access
+from .blobs import content_size, media_path, open_content, read_plaintext, stored_as_served, stored_blob, transfer_secret
+from .cipher_suites import TAG_BYTES, AesCtrSuite, IntegrityError, negotiate, suite_ranking, upload_cipher
+from .downloads import ctr_encrypt_blocks, parse_range, slice_blocks
+from .encryption import new_data_key, wrap_key, unwrap_key
+from .file_ids import encode_file_id, decode_file_id
+from .listing_cache import (
+    FILE_SHARES, SHARED_WITH_USER, UPLOADED_FILES, bump, bump_share_listings, cached_listing, earliest_expiry,
+)
+from .pagination import InvalidPageRequest, datetime_from, keyset_page, page_size_from
+from .parallel_crypto import regroup
+from .renderers import OctetStreamRenderer
+from .sharing import active_shares, bulk_share, bulk_revoke
+from .storage import upload_part_path
+from .uploads import decrypt_chunk, write_chunk, strip_padding, decrypt_upload_to_file, read_stream
 from django.utils import timezone
 from datetime import timedelta
 logger = logging.getLogger(__name__)
 
-# Encryption key setup
-ENCRYPTION_KEY = Fernet.generate_key()
-cipher_suite = Fernet(ENCRYPTION_KEY)
 
 @api_view(['GET'])
 def get_user_details(request):
@@ -60,59 +76,473 @@ def is_hex(s):
     except ValueError:
         return False
 
+def _upload_fields(request):
+    """
+    Reads the upload metadata and a ciphertext chunk iterator for the request's transport.
+
+    JSON bodies carry base64 ciphertext (legacy clients), multipart bodies carry
+    it in a 'file' part, and application/octet-stream bodies are the raw
+    ciphertext with the metadata in X-File-Name / X-Cipher-Key / X-Cipher-Nonce
+    (or X-AES-Key / X-AES-IV) / X-Cipher-Suite / X-Cipher-Frame-Size headers.
+    Returns (file_name, key hex, nonce hex, chunks, cipher suite name, frame size).
+    """
+    content_type = request.content_type or ''
+    if content_type.startswith('application/octet-stream'):
+        headers = request.headers
+        file_name = unquote(headers.get('X-File-Name', ''))
+        chunks = read_stream(request.stream, settings.UPLOAD_CHUNK_SIZE) if request.stream else None
+        return (
+            file_name, headers.get('X-Cipher-Key') or headers.get('X-AES-Key', ''),
+            headers.get('X-Cipher-Nonce') or headers.get('X-AES-IV', ''), chunks,
+            headers.get('X-Cipher-Suite'), headers.get('X-Cipher-Frame-Size'),
+        )
+
+    data = request.data
+    if content_type.startswith('multipart/form-data'):
+        upload = request.FILES.get('file')
+        chunks = upload.chunks(settings.UPLOAD_CHUNK_SIZE) if upload else None
+        file_name = data.get('file_name') or (upload.name if upload else None)
+    else:
+        encrypted_content_b64 = data.get('encrypted_content', '')
+        chunks = [b64decode(encrypted_content_b64)] if encrypted_content_b64 else None
+        file_name = data.get('file_name')
+    return (
+        file_name, data.get('key') or data.get('aes_key', ''), data.get('nonce') or data.get('aes_iv', ''), chunks,
+        data.get('cipher_suite'), data.get('frame_size'),
+    )
+
+
+def _save_upload(user, file_name, part_path, data_key, data_nonce):
+    """
+    Files an upload encrypted at rest in part_path and records it for user.
+    """
+    # Store the content once per distinct hash and save the file metadata to the database
+    with stored_blob(part_path, data_key, data_nonce, file_name) as blob:
+        uploaded_file = UploadedFile.objects.create(
+            user=user,  # Ensure this is a valid `CustomUser` instance
+            file_name=file_name,
+            file=blob.name,  # File field to store the blob's storage name
+            encrypted=True,  # Stored encrypted under the blob's data key
+            blob=blob,
+        )
+    bump(UPLOADED_FILES, [user.id])
+    return uploaded_file
+
+
 @api_view(['POST'])
 def upload_file(request):
     """
     Uploads the file to the server
     """
     try:
-        data = request.data  # Use request.data instead of json.loads(request.body)
-        file_name = data.get('file_name')
-        encrypted_content_b64 = data.get('encrypted_content', '')
-        aes_key_hex = data.get('aes_key', '')
-        aes_iv_hex = data.get('aes_iv', '')
+        try:
+            file_name, aes_key_hex, aes_iv_hex, chunks, suite_name, frame_size = _upload_fields(request)
+        except binascii.Error:
+            return JsonResponse({"error": "Invalid base64 in 'encrypted_content'."}, status=400)
 
-        if not all([file_name, encrypted_content_b64, aes_key_hex, aes_iv_hex]):
+        if not all([file_name, chunks, aes_key_hex, aes_iv_hex]):
             return JsonResponse({"error": "Missing required fields."}, status=400)
 
         try:
-            encrypted_content = b64decode(encrypted_content_b64)
+            cipher_suite, frame_size = upload_cipher(suite_name, frame_size)
+        except ValueError as e:
+            return JsonResponse({"error": str(e), "cipher_suites": list(suite_ranking())}, status=400)
+
+        part_path = upload_part_path()
+        data_key, data_nonce = new_data_key()
+
+        try:
             aes_key = bytes.fromhex(aes_key_hex)
             aes_iv = bytes.fromhex(aes_iv_hex)
 
-            # Decrypt using AES in CBC mode with PKCS7 padding
-            cipher = Cipher(algorithms.AES(aes_key), modes.CBC(aes_iv))
-            decryptor = cipher.decryptor()
-            decrypted_padded_content = decryptor.update(encrypted_content) + decryptor.finalize()
-
-            # Remove padding after decryption
-            unpadder = padding.PKCS7(128).unpadder()
-            decrypted_content = unpadder.update(decrypted_padded_content) + unpadder.finalize()
+            # Decrypt (and verify, for authenticated suites) piece by piece,
+            # re-encrypting under the file's own data key into a temporary file
+            decrypt_upload_to_file(cipher_suite, aes_key, aes_iv, chunks, part_path, data_key, data_nonce, frame_size)
+        except IntegrityError as e:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            return JsonResponse({"error": f"Integrity check failed: {str(e)}"}, status=400)
         except Exception as e:
+            if os.path.exists(part_path):
+                os.remove(part_path)
             return JsonResponse({"error": f"Decryption failed: {str(e)}"}, status=500)
 
-        file_path = os.path.join('media', 'decrypted_files', file_name)
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        _save_upload(request.user, file_name, part_path, data_key, data_nonce)
+
+        return JsonResponse({"message": "File uploaded and encrypted at rest successfully!"}, status=200)
+    except Exception as e:
+        return JsonResponse({"error": f'An unexpected error occurred: {str(e)}'}, status=500)
 
-        with open(file_path, "wb") as file:
-            file.write(decrypted_content)
 
-        # Save the file metadata to the database
-        uploaded_file = UploadedFile.objects.create(
-            user=request.user,  # Ensure this is a valid `CustomUser` instance
+def _upload_session_status(session):
+    return {
+        "upload_id": str(session.id),
+        "file_name": session.file_name,
+        "next_chunk": session.next_chunk,
+        "received_bytes": session.received_bytes,
+        "chunk_size": settings.UPLOAD_CHUNK_SIZE,
+        "expires_at": session.expires_at.isoformat(),
+    }
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def init_upload_session(request):
+    """
+    Starts a resumable upload. Chunks are then sent in order with upload_chunk.
+    """
+    try:
+        file_name = request.data.get('file_name')
+        aes_key_hex = request.data.get('aes_key', '')
+        aes_iv_hex = request.data.get('aes_iv', '')
+
+        if not all([file_name, aes_key_hex, aes_iv_hex]):
+            return JsonResponse({"error": "Missing required fields."}, status=400)
+
+        if not is_hex(aes_key_hex) or len(aes_key_hex) not in (32, 48, 64):
+            return JsonResponse({"error": "Invalid AES key."}, status=400)
+        if not is_hex(aes_iv_hex) or len(aes_iv_hex) != 32:
+            return JsonResponse({"error": "Invalid AES IV."}, status=400)
+
+        data_key, data_nonce = new_data_key()
+        session = UploadSession.objects.create(
+            user=request.user,
             file_name=file_name,
-            file=file_path,  # File field to store the decrypted file's path
-            encrypted=False,  # Set encrypted to False since it’s now decrypted
+            aes_key=aes_key_hex,
+            next_iv=aes_iv_hex,
+            data_key=wrap_key(data_key),
+            data_nonce=data_nonce,
+            expires_at=timezone.now() + settings.UPLOAD_SESSION_LIFETIME,
         )
+        return JsonResponse(_upload_session_status(session), status=201)
+    except Exception as e:
+        logger.error(f"Error starting upload session: {str(e)}")
+        return JsonResponse({"error": "Failed to start upload session."}, status=500)
+
+
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated])
+def upload_chunk(request, upload_id, chunk_index):
+    """
+    Decrypts one ciphertext chunk (raw request body) and appends it to the session's file.
+    """
+    try:
+        session = UploadSession.objects.filter(id=upload_id, user=request.user).first()
+        if not session or session.is_expired():
+            return JsonResponse({"error": "Upload session not found or expired."}, status=404)
+
+        # A chunk we already have is a retry after a lost response.
+        if chunk_index < session.next_chunk:
+            return JsonResponse(_upload_session_status(session), status=200)
+        if chunk_index > session.next_chunk:
+            return JsonResponse({
+                "error": f"Expected chunk {session.next_chunk}.",
+                **_upload_session_status(session),
+            }, status=409)
+
+        chunk = request.body
+        if len(chunk) > settings.UPLOAD_CHUNK_SIZE:
+            return JsonResponse({"error": "Chunk exceeds the maximum chunk size."}, status=413)
 
+        try:
+            plaintext, next_iv = decrypt_chunk(
+                bytes.fromhex(session.aes_key), bytes.fromhex(session.next_iv), chunk
+            )
+        except Exception as e:
+            return JsonResponse({"error": f"Decryption failed: {str(e)}"}, status=400)
 
-        return JsonResponse({"message": "File uploaded and decrypted successfully!"}, status=200)
+        write_chunk(
+            session.part_path, session.received_bytes, plaintext,
+            unwrap_key(session.data_key), bytes(session.data_nonce),
+        )
+
+        # Only advance if no concurrent retry of the same chunk got there first.
+        UploadSession.objects.filter(id=session.id, next_chunk=chunk_index).update(
+            next_chunk=chunk_index + 1,
+            next_iv=next_iv.hex(),
+            received_bytes=session.received_bytes + len(plaintext),
+        )
+        session.refresh_from_db()
+        return JsonResponse(_upload_session_status(session), status=200)
     except Exception as e:
-        return JsonResponse({"error": f'An unexpected error occurred: {str(e)}'}, status=500)
+        logger.error(f"Error uploading chunk: {str(e)}")
+        return JsonResponse({"error": "Failed to upload chunk."}, status=500)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def upload_session_status(request, upload_id):
+    """
+    Reports how far an upload got, so an interrupted client knows which chunk to resume from.
+    """
+    session = UploadSession.objects.filter(id=upload_id, user=request.user).first()
+    if not session or session.is_expired():
+        return JsonResponse({"error": "Upload session not found or expired."}, status=404)
+    return JsonResponse(_upload_session_status(session), status=200)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def commit_upload_session(request, upload_id):
+    """
+    Finishes an upload: strips the padding, files the content in the blob store and records it.
+    """
+    try:
+        session = UploadSession.objects.filter(id=upload_id, user=request.user).first()
+        if not session or session.is_expired():
+            return JsonResponse({"error": "Upload session not found or expired."}, status=404)
+        if session.next_chunk == 0:
+            return JsonResponse({"error": "No chunks have been uploaded."}, status=400)
+
+        try:
+            strip_padding(session.part_path, unwrap_key(session.data_key), bytes(session.data_nonce))
+        except Exception as e:
+            return JsonResponse({"error": f"Decryption failed: {str(e)}"}, status=400)
+
+        with stored_blob(
+            session.part_path, unwrap_key(session.data_key), bytes(session.data_nonce), session.file_name,
+        ) as blob:
+            uploaded_file = UploadedFile.objects.create(
+                user=request.user,
+                file_name=session.file_name,
+                file=blob.name,
+                encrypted=True,
+                blob=blob,
+            )
+            session.delete()
+        bump(UPLOADED_FILES, [request.user.id])
+
+        return JsonResponse({
+            "message": "File uploaded and encrypted at rest successfully!",
+            "encrypted_file_id": encode_file_id(uploaded_file.id),
+        }, status=201)
+    except Exception as e:
+        logger.error(f"Error committing upload session: {str(e)}")
+        return JsonResponse({"error": "Failed to commit upload."}, status=500)
+
+
+# File responses depend on the negotiated transport and cipher suite
+FILE_RESPONSE_VARY = 'Accept, X-Cipher-Suites'
+
+
+def _wants_binary(request):
+    """
+    True when content negotiation picked raw ciphertext over the legacy JSON body.
+    """
+    return request.accepted_renderer.format == OctetStreamRenderer.format
+
+
+def _encrypted_file_response(request, uploaded_file, binary):
+    """
+    Returns a file encrypted for the client in the negotiated transport and cipher suite.
+
+    Clients list the suites they support in X-Cipher-Suites and the server
+    picks its preferred one among them. Binary clients get a stream of
+    authenticated frames, or AES-CTR when that is what was picked or nothing
+    was offered; JSON clients get the whole file base64-encoded, under the
+    picked suite or AES-CBC.
+    """
+    cipher_suite = negotiate(request.headers.get('X-Cipher-Suites'))
+    if binary:
+        if cipher_suite and cipher_suite.framed:
+            return _framed_file_response(request, uploaded_file, cipher_suite)
+        return _streaming_file_response(request, uploaded_file)
+    if cipher_suite:
+        return _negotiated_json_response(uploaded_file, cipher_suite)
+
+    # Read the file content, decrypting it on all cores and decompressing it as stored
+    file_content = b''.join(read_plaintext(uploaded_file, parallel=True))
+
+    # Generate AES key and IV
+    aes_key = os.urandom(32)  # 256-bit AES key
+    aes_iv = os.urandom(16)   # 128-bit IV
+
+    # Encrypt the file content using AES in CBC mode with PKCS7 padding
+    padder = padding.PKCS7(algorithms.AES.block_size).padder()
+    padded_file_content = padder.update(file_content) + padder.finalize()
+
+    cipher = Cipher(algorithms.AES(aes_key), modes.CBC(aes_iv), backend=default_backend())
+    encryptor = cipher.encryptor()
+    encrypted_content = encryptor.update(padded_file_content) + encryptor.finalize()
+
+    # Return the Base64 encrypted content, key, IV, and file name
+    response = JsonResponse({
+        "encrypted_content": base64.b64encode(encrypted_content).decode('utf-8'),
+        "aes_key": base64.b64encode(aes_key).decode('utf-8'),
+        "aes_iv": base64.b64encode(aes_iv).decode('utf-8'),
+        "file_name": uploaded_file.file_name,
+    })
+    response['Vary'] = FILE_RESPONSE_VARY
+    return response
+
+
+def _negotiated_json_response(uploaded_file, cipher_suite):
+    """
+    Returns the whole file encrypted with a negotiated suite under a fresh key, base64-encoded.
+    """
+    frame_size = settings.CIPHER_FRAME_SIZE
+    key, nonce = cipher_suite.new_key()
+    file_content = b''.join(read_plaintext(uploaded_file, parallel=True))
+    response = JsonResponse({
+        "encrypted_content": base64.b64encode(cipher_suite.encrypt(key, nonce, file_content, frame_size)).decode('utf-8'),
+        "cipher_suite": cipher_suite.name,
+        "key": base64.b64encode(key).decode('utf-8'),
+        "nonce": base64.b64encode(nonce).decode('utf-8'),
+        "frame_size": frame_size,
+        "file_name": uploaded_file.file_name,
+    })
+    response['Vary'] = FILE_RESPONSE_VARY
+    return response
+
+
+def _framed_file_response(request, uploaded_file, cipher_suite):
+    """
+    Streams a file as the authenticated frames of a negotiated AEAD suite.
+
+    Frames are sealed under a key derived from the file's own secret, so the
+    framed representation of a file is always the same and a Range header
+    (in bytes of that representation) is answered with 206 Partial Content.
+    Only the frames a range overlaps are read and sealed.
+    """
+    frame_size = settings.CIPHER_FRAME_SIZE
+    size = content_size(uploaded_file)
+    wire_size = cipher_suite.wire_size(size, frame_size)
+    try:
+        byte_range = parse_range(request.headers.get('Range'), wire_size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{wire_size}"
+        return response
+
+    start, end = byte_range or (0, wire_size - 1)
+    record_size = frame_size + TAG_BYTES
+    first_frame, last_frame = start // record_size, end // record_size
+    plaintext_start = first_frame * frame_size
+    plaintext = read_plaintext(
+        uploaded_file, plaintext_start, min((last_frame + 1) * frame_size, size) - plaintext_start,
+    )
+
+    key, nonce = cipher_suite.derive_key(*transfer_secret(uploaded_file), frame_size)
+    records = cipher_suite.seal_frames(
+        key, nonce, regroup(plaintext, frame_size), first_frame, cipher_suite.frame_count(size, frame_size) - 1,
+    )
+    response = StreamingHttpResponse(
+        slice_blocks(records, start - first_frame * record_size, end - start + 1),
+        status=206 if byte_range else 200, content_type='application/octet-stream',
+    )
+    if byte_range:
+        response['Content-Range'] = f"bytes {start}-{end}/{wire_size}"
+    response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    response['X-Cipher-Suite'] = cipher_suite.name
+    response['X-Cipher-Key'] = base64.b64encode(key).decode('utf-8')
+    response['X-Cipher-Nonce'] = base64.b64encode(nonce).decode('utf-8')
+    response['X-Cipher-Frame-Size'] = frame_size
+    _set_file_headers(response, uploaded_file.file_name)
+    return response
+
+
+def _streaming_file_response(request, uploaded_file):
+    """
+    Streams a file as raw AES-CTR ciphertext, with key material and file name in headers.
+
+    Files encrypted at rest are sent exactly as stored and only their data
+    key is unwrapped; compressed files and older plaintext files are
+    decompressed or read and encrypted on the fly under a fresh key. A
+    single-range Range header is answered with 206 Partial Content. The
+    X-AES-IV counter block always refers to byte 0 of the file, so clients
+    decrypt a range by advancing the counter by start // 16 blocks.
+    """
+    if stored_as_served(uploaded_file) and settings.FILE_X_ACCEL_REDIRECT_PREFIX:
+        relative_path = media_path(uploaded_file)
+        if relative_path is not None:
+            return _x_accel_file_response(uploaded_file, relative_path)
+
+    size = content_size(uploaded_file)
+    try:
+        byte_range = parse_range(request.headers.get('Range'), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1
+
+    if stored_as_served(uploaded_file):
+        aes_key, aes_nonce = unwrap_key(uploaded_file.wrapped_key), uploaded_file.key_nonce
+        content = open_content(uploaded_file, start, length)
+    else:
+        aes_key, aes_nonce = new_data_key()
+        content = ctr_encrypt_blocks(read_plaintext(uploaded_file, start, length), aes_key, aes_nonce, start)
+
+    response = StreamingHttpResponse(
+        content, status=206 if byte_range else 200, content_type='application/octet-stream'
+    )
+    if byte_range:
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+    # CTR ciphertext is exactly as long as the plaintext
+    response['Content-Length'] = length
+    response['Accept-Ranges'] = 'bytes'
+    _set_key_headers(response, uploaded_file.file_name, aes_key, aes_nonce)
+    return response
+
+
+async def _iterate_in_threads(blocks):
+    """
+    Yields the blocks of a blocking iterator, producing each on a worker thread.
+    """
+    while (block := await asyncio.to_thread(next, blocks, None)) is not None:
+        yield block
+
+
+def _stream_under_asgi(request, response):
+    """
+    Under an ASGI server, makes a streaming response read and encrypt its
+    blocks on worker threads one at a time. Django would otherwise read a
+    blocking iterator to the end before sending the first byte.
+    """
+    if response.streaming and isinstance(request, ASGIRequest):
+        response.streaming_content = _iterate_in_threads(iter(response.streaming_content))
+    return response
+
+
+def _x_accel_file_response(uploaded_file, relative_path):
+    """
+    Hands the transfer of a file encrypted at rest to nginx.
+
+    The stored ciphertext is already what the client receives, so once the
+    permission check has passed the only work left is unwrapping the data key.
+    nginx serves the bytes from an internal location with sendfile, including
+    Range requests, and the worker is free as soon as this response is returned.
+    relative_path is the file's location under media/.
+    """
+    response = HttpResponse(content_type='application/octet-stream')
+    response['X-Accel-Redirect'] = settings.FILE_X_ACCEL_REDIRECT_PREFIX + quote(relative_path)
+    _set_key_headers(
+        response, uploaded_file.file_name,
+        unwrap_key(uploaded_file.wrapped_key), uploaded_file.key_nonce,
+    )
+    return response
+
+
+def _set_key_headers(response, file_name, aes_key, aes_nonce):
+    response['X-AES-Mode'] = 'CTR'
+    response['X-AES-Key'] = base64.b64encode(aes_key).decode('utf-8')
+    response['X-AES-IV'] = base64.b64encode(aes_nonce).decode('utf-8')
+    response['X-Cipher-Suite'] = AesCtrSuite.name
+    _set_file_headers(response, file_name)
+
+
+def _set_file_headers(response, file_name):
+    response['X-File-Name'] = quote(file_name)
+    response['Content-Disposition'] = content_disposition_header(True, file_name)
+    response['Vary'] = FILE_RESPONSE_VARY
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, OctetStreamRenderer])
 def access_shared_file(request, encrypted_file_id):
     """
     Endpoint to retrieve and encrypt a file for download.
@@ -120,113 +550,119 @@ def access_shared_file(request, encrypted_file_id):
     try:
         # Decrypt the file ID
         try:
-            file_id = int(cipher_suite.decrypt(encrypted_file_id.encode()).decode())
+            file_id = decode_file_id(encrypted_file_id)
             
         except Exception as e:
             return JsonResponse({"error": "Invalid or malformed file ID."}, status=400)
 
-        # Check if the file is shared with the user with download permission
-        if SharedFile.objects.filter(
-            file__id=file_id,
-            shared_with=request.user,
-            download_permission=True,
-            expiration_time__gte=timezone.now()
-        ).exists():
-            uploaded_file = UploadedFile.objects.get(id=file_id)
-            uploaded_file_path = uploaded_file.file.path
-            uploaded_file_name = uploaded_file.file_name
-
-        # Check if the user is the owner of the file
-        elif UploadedFile.objects.filter(id=file_id, user=request.user).exists():
-            uploaded_file = UploadedFile.objects.get(id=file_id, user=request.user)
-            uploaded_file_path = uploaded_file.file.path
-            uploaded_file_name = uploaded_file.file_name
-
-        else:
+        # Owner, or shared with download permission and not expired
+        access = resolve_file_access(request.user, file_id)
+        if not access or not access.can_download:
             return JsonResponse({"error": "You don't have permission to access this file."}, status=403)
 
-        # Read the file content
-        with open(uploaded_file_path, 'rb') as f:
-            file_content = f.read()
+        response = _encrypted_file_response(request, access.file, _wants_binary(request))
+        return _stream_under_asgi(request._request, response)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
 
-        # Generate AES key and IV
-        aes_key = os.urandom(32)  # 256-bit AES key
-        aes_iv = os.urandom(16)   # 128-bit IV
 
-        # Encrypt the file content using AES in CBC mode with PKCS7 padding
-        padder = padding.PKCS7(algorithms.AES.block_size).padder()
-        padded_file_content = padder.update(file_content) + padder.finalize()
 
-        cipher = Cipher(algorithms.AES(aes_key), modes.CBC(aes_iv), backend=default_backend())
-        encryptor = cipher.encryptor()
-        encrypted_content = encryptor.update(padded_file_content) + encryptor.finalize()
 
-        # Encode the encrypted content, AES key, and IV in Base64
-        encrypted_content_b64 = base64.b64encode(encrypted_content).decode('utf-8')
-        aes_key_b64 = base64.b64encode(aes_key).decode('utf-8')
-        aes_iv_b64 = base64.b64encode(aes_iv).decode('utf-8')
+# Listing sort options, each ending in a unique tiebreaker for keyset pagination
+UPLOADED_FILE_SORTS = {
+    'uploaded_at': ['uploaded_at', 'id'],
+    '-uploaded_at': ['-uploaded_at', '-id'],
+    'file_name': ['file_name', 'id'],
+    '-file_name': ['-file_name', '-id'],
+}
+SHARED_FILE_SORTS = {
+    'shared_at': ['id'],
+    '-shared_at': ['-id'],
+}
 
-        # Return the encrypted content, key, IV, and file name
-        return JsonResponse({
-            "encrypted_content": encrypted_content_b64,
-            "aes_key": aes_key_b64,
-            "aes_iv": aes_iv_b64,
-            "file_name": uploaded_file_name,
-        })
-    except Exception as e:
-        return JsonResponse({"error": str(e)}, status=500)
 
+def _uploaded_files_page(request, user):
+    """
+    Builds one page of the files uploaded by user.
+    """
+    params = request.query_params
+    ordering = UPLOADED_FILE_SORTS.get(params.get('sort', 'uploaded_at'))
+    if not ordering:
+        return JsonResponse({"error": f"'sort' must be one of {', '.join(UPLOADED_FILE_SORTS)}."}, status=400)
+
+    # Fetch the user's files, filtered on the indexed columns
+    files = UploadedFile.objects.filter(user=user)
+    try:
+        page_size = page_size_from(params)
+        if params.get('name_prefix'):
+            files = files.filter(file_name__startswith=params['name_prefix'])
+        if params.get('uploaded_after'):
+            files = files.filter(uploaded_at__gte=datetime_from(params, 'uploaded_after'))
+        if params.get('uploaded_before'):
+            files = files.filter(uploaded_at__lt=datetime_from(params, 'uploaded_before'))
+
+        files, next_cursor = keyset_page(
+            files.values('id', 'file_name', 'uploaded_at'), ordering, params.get('cursor'), page_size
+        )
+    except InvalidPageRequest as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    # Encrypt file IDs and construct response
+    files_with_encryption = [
+        {
+            "encrypted_file_id": encode_file_id(file["id"]),  # Encrypted ID
+            "file_name": file["file_name"],
+            "uploaded_at": file["uploaded_at"].isoformat(),  # Convert to ISO format for JSON compatibility
+        }
+        for file in files
+    ]
 
+    return JsonResponse({"files": files_with_encryption, "next_cursor": next_cursor}, status=200)
 
 
 @api_view(['GET'])
 def get_all_uploaded_files(request):
     """
-    Returns a list of all files uploaded by the current user, including encrypted file IDs.
+    Returns one page of the files uploaded by the current user, including encrypted file IDs.
+
+    Query parameters: page_size, cursor (the previous page's next_cursor),
+    sort (uploaded_at, -uploaded_at, file_name, -file_name), name_prefix,
+    uploaded_after and uploaded_before (ISO 8601). Responses carry an ETag;
+    sending it back in If-None-Match yields a 304 while the listing is unchanged.
     """
     try:
         user = request.user
         if not user.is_authenticated:
             return JsonResponse({"error": "Unauthorized. Please log in."}, status=401)
 
-        # Fetch all files uploaded by the user
-        files = UploadedFile.objects.filter(user=user).values('id', 'file_name', 'uploaded_at')
-
-        # Encrypt file IDs and construct response
-        files_with_encryption = [
-            {
-                "encrypted_file_id": cipher_suite.encrypt(str(file["id"]).encode()).decode(),  # Encrypted ID
-                "file_name": file["file_name"],
-                "uploaded_at": file["uploaded_at"].isoformat(),  # Convert to ISO format for JSON compatibility
-            }
-            for file in files
-        ]
-
-        return JsonResponse({"files": files_with_encryption}, status=200)
+        return cached_listing(request, UPLOADED_FILES, user.id, lambda: _uploaded_files_page(request, user))
     except Exception as e:
         logger.error(f"Failed to fetch uploaded files: {str(e)}")
         return JsonResponse({"error": "Failed to fetch files."}, status=500)
 
 
 @api_view(['POST'])
+@permission_classes([IsAuthenticated])
 def share_file(request, encrypted_file_id):
     """
     Share a file with another user, allowing configurable permissions and expiration time.
     """
     try:
         try:
-            file_id = int(cipher_suite.decrypt(encrypted_file_id.encode()).decode())
+            file_id = decode_file_id(encrypted_file_id)
         except Exception as e:
             return JsonResponse({"error": "Invalid or malformed file ID."}, status=400)
         # Validate the file to be shared
-        file = get_object_or_404(UploadedFile, id=file_id, user=request.user)
+        access = resolve_file_access(request.user, file_id)
+        if not access or not access.is_owner:
+            return JsonResponse({"error": "File not found or unauthorized."}, status=404)
 
         # Validate the target user for sharing
         username = request.data.get('user_id')
         if not username:
             return JsonResponse({"error": "Missing 'username' in request data."}, status=400)
 
-        shared_with = get_object_or_404(CustomUser, username=username)
+        shared_with = CustomUser.objects.get(username=username)
 
         # Parse and validate permissions
         view_permission = request.data.get('view_permission', False) in [True, 'true', 'True']
@@ -241,7 +677,7 @@ def share_file(request, encrypted_file_id):
 
         # Create or update the shared file record
         shared_file, created = SharedFile.objects.update_or_create(
-            file=file,
+            file_id=file_id,
             shared_with=shared_with,
             defaults={
                 "owner": request.user,  # Set the owner to the current user
@@ -250,9 +686,11 @@ def share_file(request, encrypted_file_id):
                 "expiration_time": expiration_time,
             },
         )
+        invalidate_file_access(file_id, [shared_with.id])
+        bump_share_listings(file_id, [shared_with.id])
 
         # Encrypt the file ID
-        encrypted_file_id = cipher_suite.encrypt(str(file_id).encode()).decode()
+        encrypted_file_id = encode_file_id(file_id)
 
         # Response indicating the sharing status
         return JsonResponse({
@@ -267,10 +705,6 @@ def share_file(request, encrypted_file_id):
             },
         })
 
-    except UploadedFile.DoesNotExist:
-        logger.error(f"File with id {file_id} not found or not owned by the user.")
-        return JsonResponse({"error": "File not found or unauthorized."}, status=404)
-
     except CustomUser.DoesNotExist:
         logger.error(f"User with username '{username}' not found.")
         return JsonResponse({"error": f"User '{username}' not found."}, status=404)
@@ -279,16 +713,19 @@ def share_file(request, encrypted_file_id):
         logger.error(f"Unexpected error during file sharing: {e}")
         return JsonResponse({"error": "File sharing failed due to an unexpected error."}, status=500)
 @api_view(['POST'])
+@permission_classes([IsAuthenticated])
 def add_shared_user(request, encrypted_file_id):
     """
     Adds a new user to share the file with.
     """
     try:
         try:
-            file_id = int(cipher_suite.decrypt(encrypted_file_id.encode()).decode())
+            file_id = decode_file_id(encrypted_file_id)
         except Exception as e:
             return JsonResponse({"error": "Invalid or malformed file ID."}, status=400)
-        file = get_object_or_404(UploadedFile, id=file_id, user=request.user)
+        access = resolve_file_access(request.user, file_id)
+        if not access or not access.is_owner:
+            return JsonResponse({"error": "File not found or unauthorized."}, status=404)
         shared_with_username = request.data.get('username')
         shared_with = get_object_or_404(CustomUser, username=shared_with_username)
 
@@ -298,14 +735,17 @@ def add_shared_user(request, encrypted_file_id):
         expiration_time = timezone.now()  + timedelta(hours=expiration_hours)
 
         SharedFile.objects.update_or_create(
-            file=file,
+            file_id=file_id,
             shared_with=shared_with,
             defaults={
+                "owner": request.user,
                 "view_permission": view_permission,
                 "download_permission": download_permission,
                 "expiration_time": expiration_time,
             },
         )
+        invalidate_file_access(file_id, [shared_with.id])
+        bump_share_listings(file_id, [shared_with.id])
 
         return JsonResponse({"message": f"User {shared_with.username} added successfully."})
     except Exception as e:
@@ -313,6 +753,8 @@ def add_shared_user(request, encrypted_file_id):
         return JsonResponse({"error": "Failed to add user for sharing."}, status=500)
 
 @api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, OctetStreamRenderer])
 def view_file(request, encrypted_file_id):
     """
     Endpoint to retrieve and decrypt a file for viewing.
@@ -321,116 +763,100 @@ def view_file(request, encrypted_file_id):
     try:
         # Decrypt the file ID
         try:
-            file_id = int(cipher_suite.decrypt(encrypted_file_id.encode()).decode())
+            file_id = decode_file_id(encrypted_file_id)
             
         except Exception as e:
             return JsonResponse({"error": "Invalid or malformed file ID."}, status=400)
 
-        # Check if the file is shared with the user with view permission
-        if SharedFile.objects.filter(
-            file__id=file_id,
-            shared_with=request.user,
-            view_permission=True,
-            expiration_time__gte=timezone.now()
-        ).exists():
-            uploaded_file = UploadedFile.objects.get(id=file_id)
-            uploaded_file_path = uploaded_file.file.path
-            uploaded_file_name = uploaded_file.file_name
-
-        # Check if the user is the owner of the file
-        elif UploadedFile.objects.filter(id=file_id, user=request.user).exists():
-            uploaded_file = UploadedFile.objects.get(id=file_id, user=request.user)
-            uploaded_file_path = uploaded_file.file.path
-            uploaded_file_name = uploaded_file.file_name
-
-        else:
+        # Owner, or shared with view permission and not expired
+        access = resolve_file_access(request.user, file_id)
+        if not access or not access.can_view:
             return JsonResponse({"error": "You don't have permission to access this file."}, status=403)
 
-        # Read the file content
-        with open(uploaded_file_path, 'rb') as f:
-            file_content = f.read()
-
-        # Generate AES key and IV
-        aes_key = os.urandom(32)  # 256-bit AES key
-        aes_iv = os.urandom(16)   # 128-bit IV
-
-        # Encrypt the file content using AES in CBC mode with PKCS7 padding
-        padder = padding.PKCS7(algorithms.AES.block_size).padder()
-        padded_file_content = padder.update(file_content) + padder.finalize()
-
-        cipher = Cipher(algorithms.AES(aes_key), modes.CBC(aes_iv), backend=default_backend())
-        encryptor = cipher.encryptor()
-        encrypted_content = encryptor.update(padded_file_content) + encryptor.finalize()
-
-        # Encode the encrypted content, AES key, and IV in Base64
-        encrypted_content_b64 = base64.b64encode(encrypted_content).decode('utf-8')
-        aes_key_b64 = base64.b64encode(aes_key).decode('utf-8')
-        aes_iv_b64 = base64.b64encode(aes_iv).decode('utf-8')
-
-        # Return the encrypted content, key, IV, and file name
-        return JsonResponse({
-            "encrypted_content": encrypted_content_b64,
-            "aes_key": aes_key_b64,
-            "aes_iv": aes_iv_b64,
-            "file_name": uploaded_file_name,
-        })
+        response = _encrypted_file_response(request, access.file, _wants_binary(request))
+        return _stream_under_asgi(request._request, response)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
   
+def _shared_users_listing(file_id):
+    """
+    Builds the list of users file_id is shared with.
+    """
+    # One joined query projecting only the columns in the response; expired
+    # shares are left out and later deleted by reap_expired_shares
+    shared_files = list(active_shares().filter(file_id=file_id).order_by('id').values(
+        "shared_with_id", "shared_with__username", "shared_with__email", "view_permission", "download_permission",
+        "expiration_time",
+    ))
+    shared_users = [
+        {
+            "user_id": sf["shared_with_id"],
+            "username": sf["shared_with__username"],
+            "email": sf["shared_with__email"],
+            "view_permission": sf["view_permission"],
+            "download_permission": sf["download_permission"],
+        }
+        for sf in shared_files
+    ]
+    response = JsonResponse({"shared_users": shared_users}, status=200)
+    # Cached only until the first of these shares expires
+    response.valid_until = earliest_expiry(shared_files)
+    return response
+
+
 @api_view(['GET'])
+@permission_classes([IsAuthenticated])
 def get_shared_users(request, encrypted_file_id):
     """
     Endpoint to retrieve shared users for a file.
     """
     try:
         try:
-            file_id = int(cipher_suite.decrypt(encrypted_file_id.encode()).decode())
+            file_id = decode_file_id(encrypted_file_id)
         except Exception as e:
             return JsonResponse({"error": "Invalid or malformed file ID."}, status=400)
-        shared_files = SharedFile.objects.filter(file_id=file_id)
-        shared_users = [
-            {
-                "user_id": sf.shared_with.id,
-                "username": sf.shared_with.username,
-                "email": sf.shared_with.email,
-                "view_permission": sf.view_permission,
-                "download_permission": sf.download_permission,
-            }
-            for sf in shared_files
-        ]
-        return JsonResponse({"shared_users": shared_users}, status=200)
+        access = resolve_file_access(request.user, file_id)
+        if not access or not access.is_owner:
+            return JsonResponse({"error": "File not found or unauthorized."}, status=404)
+
+        return cached_listing(request, FILE_SHARES, file_id, lambda: _shared_users_listing(file_id))
     except Exception as e:
         logger.error(f"Error fetching shared users: {str(e)}")
         return JsonResponse({"error": "Failed to fetch shared users."}, status=500)
 @api_view(['POST'])
+@permission_classes([IsAuthenticated])
 def update_permission(request, encrypted_file_id):
     """
     Updates permissions (view/download) for a shared file based on the username.
     """
     try:
         try:
-            file_id = int(cipher_suite.decrypt(encrypted_file_id.encode()).decode())
+            file_id = decode_file_id(encrypted_file_id)
         except Exception as e:
             return JsonResponse({"error": "Invalid or malformed file ID."}, status=400)
+        access = resolve_file_access(request.user, file_id)
+        if not access or not access.is_owner:
+            return JsonResponse({"error": "File not found or unauthorized."}, status=404)
+
         username = request.data.get("username")
         permission_type = request.data.get("permission_type")
         value = request.data.get("value", False) in ['true', 'True', True]
 
-        # Ensure the username and file_id combination is unique
-        shared_files = SharedFile.objects.filter(file_id=file_id, shared_with__username=username)
+        if permission_type not in ("view_permission", "download_permission"):
+            return JsonResponse({"error": "'permission_type' must be 'view_permission' or 'download_permission'."}, status=400)
 
-        if not shared_files.exists():
+        # The username and file_id combination is unique, so this is at most one row
+        shared_files = SharedFile.objects.filter(file_id=file_id, shared_with__username=username)
+        user_ids = list(shared_files.values_list('shared_with_id', flat=True))
+        if not user_ids:
             return JsonResponse({"error": "No shared record found for this user and file."}, status=404)
 
-        # Update permissions for all matching records
-        for shared_file in shared_files:
-            if permission_type == "view_permission":
-                shared_file.view_permission = value
-            elif permission_type == "download_permission":
-                shared_file.download_permission = value
-            shared_file.save()
+        # Update in place with a single UPDATE statement
+        SharedFile.objects.filter(file_id=file_id, shared_with_id__in=user_ids).update(**{permission_type: value})
+        invalidate_file_access(file_id, user_ids)
+        bump_share_listings(file_id, user_ids)
 
         return JsonResponse({"message": "Permission updated successfully"})
     except Exception as e:
@@ -439,15 +865,20 @@ def update_permission(request, encrypted_file_id):
 
 
 @api_view(['POST'])
+@permission_classes([IsAuthenticated])
 def revoke_access(request, encrypted_file_id):
     """
     Revokes access to a shared file for a specific username.
     """
     try:
         try:
-            file_id = int(cipher_suite.decrypt(encrypted_file_id.encode()).decode())
+            file_id = decode_file_id(encrypted_file_id)
         except Exception as e:
             return JsonResponse({"error": "Invalid or malformed file ID."}, status=400)
+        access = resolve_file_access(request.user, file_id)
+        if not access or not access.is_owner:
+            return JsonResponse({"error": "File not found or unauthorized."}, status=404)
+
         username = request.data.get("username")
 
         # Find all shared records matching the file_id and username
@@ -457,39 +888,150 @@ def revoke_access(request, encrypted_file_id):
             return JsonResponse({"error": "No shared record found for this user and file."}, status=404)
 
         # Delete all matching shared records
+        user_ids = list(shared_files.values_list('shared_with_id', flat=True))
         shared_files.delete()
+        invalidate_file_access(file_id, user_ids)
+        bump_share_listings(file_id, user_ids)
         return JsonResponse({"message": "Access revoked successfully"})
     except Exception as e:
         logger.error(f"Error revoking access: {str(e)}")
         return JsonResponse({"error": "Failed to revoke access."}, status=500)
+
+
+def _bulk_items(request, key):
+    items = request.data.get(key) if isinstance(request.data, dict) else None
+    if not isinstance(items, list) or not items:
+        return None, JsonResponse({"error": f"'{key}' must be a non-empty list."}, status=400)
+    if len(items) > settings.BULK_SHARE_MAX_ITEMS:
+        return None, JsonResponse(
+            {"error": f"At most {settings.BULK_SHARE_MAX_ITEMS} items are accepted per request."}, status=400,
+        )
+    return items, None
+
+
+def _bulk_response(results):
+    failed = sum(1 for result in results if result["status"] == "failed")
+    return JsonResponse({"results": results, "succeeded": len(results) - failed, "failed": failed}, status=200)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_share_files(request):
+    """
+    Shares many files with many users in one request.
+
+    Body: {"shares": [{"encrypted_file_id", "username", "view_permission",
+    "download_permission", "expiration"}, ...]}. Existing shares are updated.
+    Every item gets its own result; failed items do not stop the others.
+    """
+    try:
+        items, error = _bulk_items(request, 'shares')
+        if error:
+            return error
+        return _bulk_response(bulk_share(request.user, items))
+    except Exception as e:
+        logger.error(f"Error during bulk sharing: {str(e)}")
+        return JsonResponse({"error": "Bulk sharing failed due to an unexpected error."}, status=500)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_revoke_access(request):
+    """
+    Revokes many shares in one request.
+
+    Body: {"revocations": [{"encrypted_file_id", "username"}, ...]}.
+    """
+    try:
+        items, error = _bulk_items(request, 'revocations')
+        if error:
+            return error
+        return _bulk_response(bulk_revoke(request.user, items))
+    except Exception as e:
+        logger.error(f"Error during bulk revocation: {str(e)}")
+        return JsonResponse({"error": "Bulk revocation failed due to an unexpected error."}, status=500)
+def _shared_files_page(request, user):
+    """
+    Builds one page of the files shared with user.
+    """
+    params = request.query_params
+    ordering = SHARED_FILE_SORTS.get(params.get('sort', 'shared_at'))
+    if not ordering:
+        return JsonResponse({"error": f"'sort' must be one of {', '.join(SHARED_FILE_SORTS)}."}, status=400)
+
+    # Fetch unexpired shared files, walking the recipient's shares in index order
+    shared_files = active_shares().filter(shared_with=user)
+    try:
+        page_size = page_size_from(params)
+        if params.get('name_prefix'):
+            shared_files = shared_files.filter(file__file_name__startswith=params['name_prefix'])
+        if params.get('uploaded_after'):
+            shared_files = shared_files.filter(file__uploaded_at__gte=datetime_from(params, 'uploaded_after'))
+        if params.get('uploaded_before'):
+            shared_files = shared_files.filter(file__uploaded_at__lt=datetime_from(params, 'uploaded_before'))
+        if params.get('owner'):
+            shared_files = shared_files.filter(owner__username=params['owner'])
+        if params.get('permission'):
+            if params['permission'] not in ('view', 'download'):
+                raise InvalidPageRequest("'permission' must be 'view' or 'download'.")
+            shared_files = shared_files.filter(**{f"{params['permission']}_permission": True})
+
+        shared_files, next_cursor = keyset_page(
+            shared_files.values(
+                "id", "file__id", "file__file_name", "file__uploaded_at", "view_permission",
+                "download_permission", "owner__username", "expiration_time",
+            ),
+            ordering, params.get('cursor'), page_size,
+        )
+    except InvalidPageRequest as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    # Encrypt file IDs and transform data
+    files = [
+        {
+            "encrypted_file_id": encode_file_id(sf["file__id"]),  # Encrypted ID
+            "file_name": sf["file__file_name"],  # Keep file_name in case it's needed internally
+            "uploaded_at": sf["file__uploaded_at"],
+            "view_permission": sf["view_permission"],
+            "download_permission": sf["download_permission"],
+            "shared_by": sf["owner__username"],
+        }
+        for sf in shared_files
+    ]
+
+    response = JsonResponse({"files": files, "next_cursor": next_cursor}, status=200)
+    # Cached only until the first share on the page expires
+    response.valid_until = earliest_expiry(shared_files)
+    return response
+
+
 @api_view(['GET'])
 def get_current_access_files(request):
     """
-    Returns a list of files the current user has access to, including encrypted file ID.
+    Returns one page of the files shared with the current user, including encrypted file ID.
+
+    Query parameters: page_size, cursor (the previous page's next_cursor),
+    sort (shared_at, -shared_at), name_prefix, uploaded_after and
+    uploaded_before (ISO 8601), owner (username) and permission (view or download).
+    Supports ETag / If-None-Match like get_all_uploaded_files.
     """
     try:
         user = request.user
         if not user.is_authenticated:
             return JsonResponse({"error": "Unauthorized. Please log in."}, status=401)
 
-        # Fetch shared files
-        shared_files = SharedFile.objects.filter(shared_with=user).select_related('file', 'owner').values(
-            "file__id", "file__file_name", "file__uploaded_at", "view_permission", "download_permission", "owner__username"
-        )
-
-        # Encrypt file IDs and transform data
-        files = [
-            {
-                "encrypted_file_id": cipher_suite.encrypt(str(sf["file__id"]).encode()).decode(),  # Encrypted ID
-                "file_name": sf["file__file_name"],  # Keep file_name in case it's needed internally
-                "uploaded_at": sf["file__uploaded_at"],
-                "view_permission": sf["view_permission"],
-                "download_permission": sf["download_permission"],
-                "shared_by": sf["owner__username"],
-            }
-            for sf in shared_files
-        ]
-
-        return JsonResponse({"files": files}, status=200)
+        return cached_listing(request, SHARED_WITH_USER, user.id, lambda: _shared_files_page(request, user))
     except Exception as e:
         return JsonResponse({"error": f"Failed to fetch accessible files. {str(e)}"}, status=500)
+
+
+@api_view(['GET'])
+def get_cipher_suites(request):
+    """
+    Lists the transfer cipher suites in the server's order of preference.
+    """
+    try:
+        return JsonResponse({"cipher_suites": list(suite_ranking()), "frame_size": settings.CIPHER_FRAME_SIZE}, status=200)
+    except Exception as e:
+        logger.error(f"Error listing cipher suites: {str(e)}")
+        return JsonResponse({"error": "Failed to list cipher suites."}, status=500)
@@ -0,0 +1,228 @@
+import asyncio
+import binascii
+import json
+import logging
+import os
+from base64 import b64decode
+from functools import wraps
+from urllib.parse import unquote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.http import JsonResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .access import aresolve_file_access
+from .authentication import CachedJWTAuthentication
+from .cipher_suites import IntegrityError, suite_ranking, upload_cipher
+from .encryption import new_data_key
+from .file_ids import decode_file_id
+from .renderers import OctetStreamRenderer
+from .storage import upload_part_path
+from .uploads import decrypt_upload_to_file, read_stream
+from .views import _encrypted_file_response, _save_upload, _stream_under_asgi
+
+logger = logging.getLogger(__name__)
+
+# Async versions of the upload, view and access endpoints, for running under
+# an ASGI server. Database queries are awaited, and blocking work (reading the
+# request body and stored blocks, hashing, encryption) runs on worker threads
+# one step at a time, so a transfer only holds a thread while a block is being
+# read or encrypted. A slow client costs a coroutine, not a thread.
+
+
+async def _authenticate(request):
+    """
+    Returns the active user of the request's JWT bearer token, or None.
+    """
+    authentication = CachedJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        validated_token = authentication.get_validated_token(raw_token)
+        # Usually a cache hit; the database is only queried on a miss
+        return await sync_to_async(authentication.get_user)(validated_token)
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+
+
+def async_api_view(methods):
+    """
+    The counterpart of @api_view with IsAuthenticated for async views: checks
+    the method and the bearer token and sets request.user.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+            user = await _authenticate(request)
+            if user is None:
+                response = JsonResponse({"detail": "Authentication credentials were not provided or are invalid."}, status=401)
+                response['WWW-Authenticate'] = 'Bearer realm="api"'
+                return response
+            request.user = user
+            return await view(request, *args, **kwargs)
+
+        # Authenticated by bearer token only, never by cookie
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+def _wants_binary(request):
+    """
+    True when the client asks for raw ciphertext rather than JSON, as DRF's
+    negotiation decides for the synchronous views.
+    """
+    accepted = {media_type.split(';')[0].strip() for media_type in request.headers.get('Accept', '').split(',')}
+    return OctetStreamRenderer.media_type in accepted and 'application/json' not in accepted
+
+
+def _upload_fields(request):
+    """
+    Reads the upload metadata and a ciphertext chunk iterator from a plain
+    HttpRequest, accepting the same transports and fields as upload_file.
+    Blocking: the body is read from the server's spooled copy.
+    """
+    content_type = request.content_type or ''
+    if content_type.startswith('application/octet-stream'):
+        headers = request.headers
+        file_name = unquote(headers.get('X-File-Name', ''))
+        chunks = read_stream(request, settings.UPLOAD_CHUNK_SIZE) if headers.get('Content-Length', '0') != '0' else None
+        return (
+            file_name, headers.get('X-Cipher-Key') or headers.get('X-AES-Key', ''),
+            headers.get('X-Cipher-Nonce') or headers.get('X-AES-IV', ''), chunks,
+            headers.get('X-Cipher-Suite'), headers.get('X-Cipher-Frame-Size'),
+        )
+
+    if content_type.startswith('multipart/form-data'):
+        data = request.POST
+        upload = request.FILES.get('file')
+        chunks = upload.chunks(settings.UPLOAD_CHUNK_SIZE) if upload else None
+        file_name = data.get('file_name') or (upload.name if upload else None)
+    else:
+        # Read from the stream, as DRF's JSONParser does: request.body caps the
+        # body at DATA_UPLOAD_MAX_MEMORY_SIZE, which legacy uploads exceed
+        data = json.loads(request.read() or b'{}')
+        encrypted_content_b64 = data.get('encrypted_content', '')
+        chunks = [b64decode(encrypted_content_b64)] if encrypted_content_b64 else None
+        file_name = data.get('file_name')
+    return (
+        file_name, data.get('key') or data.get('aes_key', ''), data.get('nonce') or data.get('aes_iv', ''), chunks,
+        data.get('cipher_suite'), data.get('frame_size'),
+    )
+
+
+def _receive_upload(cipher_suite, key_hex, nonce_hex, chunks, part_path, data_key, data_nonce, frame_size):
+    """
+    Decrypts the uploaded chunks into part_path under the file's data key,
+    removing the part file if that fails. Blocking.
+    """
+    try:
+        decrypt_upload_to_file(
+            cipher_suite, bytes.fromhex(key_hex), bytes.fromhex(nonce_hex), chunks,
+            part_path, data_key, data_nonce, frame_size,
+        )
+    except Exception:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+
+async def _encrypted_file_response_async(request, access):
+    uploaded_file = await access.aget_file()
+    response = await asyncio.to_thread(_encrypted_file_response, request, uploaded_file, _wants_binary(request))
+    return _stream_under_asgi(request, response)
+
+
+@async_api_view(['POST'])
+async def upload_file_async(request):
+    """
+    Uploads the file to the server (async version of upload_file).
+    """
+    try:
+        try:
+            file_name, aes_key_hex, aes_iv_hex, chunks, suite_name, frame_size = await asyncio.to_thread(
+                _upload_fields, request,
+            )
+        except binascii.Error:
+            return JsonResponse({"error": "Invalid base64 in 'encrypted_content'."}, status=400)
+        except RequestDataTooBig as e:
+            return JsonResponse({"error": str(e)}, status=413)
+        except ValueError:
+            return JsonResponse({"error": "Invalid JSON body."}, status=400)
+
+        if not all([file_name, chunks, aes_key_hex, aes_iv_hex]):
+            return JsonResponse({"error": "Missing required fields."}, status=400)
+
+        try:
+            cipher_suite, frame_size = upload_cipher(suite_name, frame_size)
+        except ValueError as e:
+            return JsonResponse({"error": str(e), "cipher_suites": list(suite_ranking())}, status=400)
+
+        part_path = upload_part_path()
+        data_key, data_nonce = new_data_key()
+        try:
+            await asyncio.to_thread(
+                _receive_upload, cipher_suite, aes_key_hex, aes_iv_hex, chunks, part_path, data_key, data_nonce, frame_size,
+            )
+        except IntegrityError as e:
+            return JsonResponse({"error": f"Integrity check failed: {str(e)}"}, status=400)
+        except Exception as e:
+            return JsonResponse({"error": f"Decryption failed: {str(e)}"}, status=500)
+
+        await sync_to_async(_save_upload)(request.user, file_name, part_path, data_key, data_nonce)
+
+        return JsonResponse({"message": "File uploaded and encrypted at rest successfully!"}, status=200)
+    except Exception as e:
+        logger.error(f"Error uploading file: {str(e)}")
+        return JsonResponse({"error": f'An unexpected error occurred: {str(e)}'}, status=500)
+
+
+@async_api_view(['GET'])
+async def view_file_async(request, encrypted_file_id):
+    """
+    Endpoint to retrieve a file for viewing (async version of view_file).
+    """
+    try:
+        try:
+            file_id = decode_file_id(encrypted_file_id)
+        except Exception:
+            return JsonResponse({"error": "Invalid or malformed file ID."}, status=400)
+
+        # Owner, or shared with view permission and not expired
+        access = await aresolve_file_access(request.user, file_id)
+        if not access or not access.can_view:
+            return JsonResponse({"error": "You don't have permission to access this file."}, status=403)
+
+        return await _encrypted_file_response_async(request, access)
+    except Exception as e:
+        logger.error(f"Error viewing file: {str(e)}")
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@async_api_view(['GET'])
+async def access_shared_file_async(request, encrypted_file_id):
+    """
+    Endpoint to retrieve a file for download (async version of access_shared_file).
+    """
+    try:
+        try:
+            file_id = decode_file_id(encrypted_file_id)
+        except Exception:
+            return JsonResponse({"error": "Invalid or malformed file ID."}, status=400)
+
+        # Owner, or shared with download permission and not expired
+        access = await aresolve_file_access(request.user, file_id)
+        if not access or not access.can_download:
+            return JsonResponse({"error": "You don't have permission to access this file."}, status=403)
+
+        return await _encrypted_file_response_async(request, access)
+    except Exception as e:
+        logger.error(f"Error accessing file: {str(e)}")
+        return JsonResponse({"error": str(e)}, status=500)
@@ -1,19 +1,20 @@
 import logging
 import smtplib
-from secrets import token_urlsafe
-from django.utils.timezone import now, timedelta
+from django.utils.timezone import timedelta
 from django.conf import settings
-from django.core.mail import send_mail
 from django.contrib.auth import authenticate
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, throttle_classes
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
-from google.oauth2 import id_token
-from google.auth.transport import requests
-from .models import CustomUser
+from requests import RequestException
+from .google_auth import verify_google_id_token
+from .mail import queue_mail
+from .models import CustomUser, OneTimeToken
+from .one_time_tokens import consume_token, issue_token
+from .throttling import IPRateThrottle, UsernameRateThrottle
 from django.http.response import HttpResponse
 logger = logging.getLogger(__name__)
 
@@ -27,19 +28,20 @@ def get_tokens_for_user(user):
 
 # Google Authentication
 @api_view(['POST'])
+@throttle_classes([IPRateThrottle])
 def google_auth_view(request):
     google_id_token = request.data.get('token')
     if not google_id_token:
         return Response({"error": "Missing Google token."}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        id_info = id_token.verify_oauth2_token(
-            google_id_token,
-            requests.Request(),
-            settings.GOOGLE_OAUTH_CLIENT_ID
-        )
+        # Verified locally against Google's cached signing certificates
+        id_info = verify_google_id_token(google_id_token, settings.GOOGLE_OAUTH_CLIENT_ID)
     except ValueError:
         return Response({"error": "Invalid Google token."}, status=status.HTTP_400_BAD_REQUEST)
+    except RequestException as e:
+        logger.error(f"Error fetching Google certificates: {str(e)}")
+        return Response({"error": "Google sign-in is temporarily unavailable."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
     email = id_info.get("email")
     if not email:
@@ -56,6 +58,9 @@ def google_auth_view(request):
 
 # User Registration
 class RegisterView(APIView):
+    throttle_classes = [IPRateThrottle]
+    throttle_scope = 'register'
+
     def post(self, request):
         username = request.data.get("username")
         password = request.data.get("password")
@@ -70,25 +75,21 @@ class RegisterView(APIView):
         if CustomUser.objects.filter(username=username).exists() or CustomUser.objects.filter(email=email).exists():
             return Response({"error": "User already exists."}, status=status.HTTP_400_BAD_REQUEST)
 
-        verification_token = token_urlsafe(32)
-        expiration_time = now() + timedelta(hours=24)
-
         user = CustomUser.objects.create(
             username=username,
             email=email,
             role=role,
             is_active=False,
-            email_verification_code=verification_token,
-            email_verification_expiry=expiration_time
         )
         user.set_password(password)
         user.save()
+        verification_token = issue_token(user, OneTimeToken.VERIFY_EMAIL, timedelta(hours=24))
 
+        # Sent by send_queued_mail, so sign-up never waits on the mail server
         verification_link = f"{settings.BACKEND_URL}/api/verify-email/?token={verification_token}"
-        send_mail(
+        queue_mail(
             "Verify Your Email",
             f"Click the link to verify your email: {verification_link}",
-            settings.DEFAULT_FROM_EMAIL,
             [email]
         )
         return Response({"message": "Verification email sent."}, status=status.HTTP_201_CREATED)
@@ -97,20 +98,21 @@ class RegisterView(APIView):
 class VerifyLinkView(APIView):
     def get(self, request):
         token = request.query_params.get("token")
-        user = CustomUser.objects.filter(email_verification_code=token).first()
+        user = consume_token(token, OneTimeToken.VERIFY_EMAIL)
 
-        if not user or now() > user.email_verification_expiry:
+        if not user:
             return HttpResponse("Invalid or expired token.", status=status.HTTP_400_BAD_REQUEST)
 
         user.is_active = True
-        user.email_verification_code = None
-        user.email_verification_expiry = None
         user.save()
         return HttpResponse("Email verified successfully. Now you can log in.", status=status.HTTP_200_OK)
     
 
 # Login with JWT
 class LoginView(TokenObtainPairView):
+    throttle_classes = [IPRateThrottle, UsernameRateThrottle]
+    throttle_scope = 'login'
+
     def post(self, request, *args, **kwargs):
         username = request.data.get("username")
         password = request.data.get("password")
@@ -133,35 +135,38 @@ def logout_view(request):
 
 # Reset Password
 class ResetPasswordRequestView(APIView):
+    throttle_classes = [IPRateThrottle, UsernameRateThrottle]
+    throttle_scope = 'reset_password'
+
     def post(self, request):
         email = request.data.get("email")
         user = CustomUser.objects.filter(email=email).first()
 
         if user:
-            reset_token = token_urlsafe(32)
-            user.password_reset_token = reset_token
-            user.password_reset_expiry = now() + timedelta(hours=24)
-            user.save()
+            reset_token = issue_token(user, OneTimeToken.RESET_PASSWORD, timedelta(hours=24))
 
-            reset_link = "{settings.BACKEND_URL}/reset-password/?token={reset_token}"
-            send_mail(
+            reset_link = f"{settings.BACKEND_URL}/reset-password/?token={reset_token}"
+            queue_mail(
                 "Reset Password",
                 f"Click here to reset your password: {reset_link}",
-                settings.DEFAULT_FROM_EMAIL,
                 [email]
             )
         return Response({"message": "If the email exists, a reset link will be sent."}, status=status.HTTP_200_OK)
 
 class ResetPasswordConfirmView(APIView):
+    throttle_classes = [IPRateThrottle]
+    throttle_scope = 'reset_password_confirm'
+
     def post(self, request):
         token = request.data.get("token")
         new_password = request.data.get("new_password")
 
-        user = CustomUser.objects.filter(password_reset_token=token).first()
-        if user and now() <= user.password_reset_expiry:
+        if not new_password:
+            return Response({"error": "New password is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        user = consume_token(token, OneTimeToken.RESET_PASSWORD)
+        if user:
             user.set_password(new_password)
-            user.password_reset_token = None
-            user.password_reset_expiry = None
             user.save()
             return Response({"message": "Password reset successful."}, status=status.HTTP_200_OK)
         return Response({"error": "Invalid or expired token."}, status=status.HTTP_400_BAD_REQUEST)
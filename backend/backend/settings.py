@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -36,6 +37,27 @@ CORS_ALLOWED_ORIGINS = [
 ]
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Binary file transport carries the key material and file name in headers
+CORS_ALLOW_HEADERS = (
+    'accept',
+    'authorization',
+    'content-type',
+    'if-none-match',
+    'range',
+    'user-agent',
+    'x-aes-iv',
+    'x-aes-key',
+    'x-cipher-frame-size',
+    'x-cipher-key',
+    'x-cipher-nonce',
+    'x-cipher-suite',
+    'x-cipher-suites',
+    'x-csrftoken',
+    'x-file-name',
+    'x-requested-with',
+)
+CORS_EXPOSE_HEADERS = ['Accept-Ranges', 'Content-Disposition', 'Content-Length', 'Content-Range', 'ETag', 'X-AES-IV', 'X-AES-Key', 'X-AES-Mode', 'X-Cipher-Frame-Size', 'X-Cipher-Key', 'X-Cipher-Nonce', 'X-Cipher-Suite', 'X-File-Name']
+
 
 # Application definition
 
@@ -65,9 +87,34 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ),
+    # Sign-in endpoints are rate limited per client address and per username
+    # (accounts/throttling.py); requests over a rate get a 429 before any
+    # password is hashed
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '30/min',
+        'login_username': '10/min',
+        'register_ip': '10/hour',
+        'reset_password_ip': '10/hour',
+        'reset_password_username': '5/hour',
+        'reset_password_confirm_ip': '20/hour',
+        'google_login_ip': '30/min',
+    },
+    # Uvicorn already resolves the client address from nginx's X-Forwarded-For
+    'NUM_PROXIES': 0,
 }
+
+# Where rate limit counters live. Local memory counts per process; with a shared
+# Redis cache (see CACHE_REDIS_URL) every process and node counts together.
+if os.environ.get('CACHE_REDIS_URL'):
+    RATE_LIMIT_STORE = {
+        'BACKEND': 'accounts.throttling.CacheRateStore', 'OPTIONS': {'alias': 'default'},
+    }
+else:
+    RATE_LIMIT_STORE = {
+        'BACKEND': 'accounts.throttling.LocalMemoryRateStore',
+    }
 # JWT Settings (optional, modify as needed)
 from datetime import timedelta
 
@@ -79,6 +126,9 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Seconds an authenticated user's principal is cached; saving the user invalidates it
+AUTH_USER_CACHE_TIMEOUT = 60
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
@@ -127,6 +177,135 @@ EMAIL_HOST_USER = '1charan144493@gmail.com'
 EMAIL_HOST_PASSWORD = 'examplepassword'
 DEFAULT_FROM_EMAIL = 'your_email@example.com'
 
+# Emails are queued in the database and sent by `manage.py send_queued_mail`,
+# MAIL_QUEUE_BATCH_SIZE at a time over one connection. A failed message is
+# retried after MAIL_QUEUE_RETRY_DELAY, doubling up to MAIL_QUEUE_MAX_RETRY_DELAY,
+# until MAIL_QUEUE_MAX_ATTEMPTS. A sender that dies mid-batch releases its
+# messages after MAIL_QUEUE_LEASE.
+MAIL_QUEUE_BATCH_SIZE = 100
+MAIL_QUEUE_MAX_ATTEMPTS = 8
+MAIL_QUEUE_RETRY_DELAY = timedelta(minutes=1)
+MAIL_QUEUE_MAX_RETRY_DELAY = timedelta(hours=1)
+MAIL_QUEUE_LEASE = timedelta(minutes=5)
+
+# Files are stored encrypted under per-file data keys, which are wrapped with this
+# key (64 hex characters). The fallback is for development only.
+# SECURITY WARNING: set FILE_KEY_ENCRYPTION_KEY in the environment in production!
+FILE_KEY_ENCRYPTION_KEY = os.environ.get(
+    'FILE_KEY_ENCRYPTION_KEY', 'bc28e43a532c5a643ee9f61c3972ff6752d64cafe18a63edc85d0b57ea1300b2',
+)
+
+# Keys for the opaque file IDs used in URLs, read from FILE_ID_KEYS as
+# comma-separated '<key id>:<64 hex characters>' entries. IDs name the key that
+# encoded them, so to rotate add a new entry, make it FILE_ID_ACTIVE_KEY and keep
+# old ones until retired. The fallback is for development only.
+# SECURITY WARNING: set FILE_ID_KEYS in the environment in production!
+FILE_ID_KEYS = dict(
+    entry.strip().split(':', 1)
+    for entry in os.environ.get(
+        'FILE_ID_KEYS', '1:ba93a86252f8824d7170db4b4b88db4ed55851b2123499cfe4cd86d824595604',
+    ).split(',')
+)
+FILE_ID_ACTIVE_KEY = os.environ.get('FILE_ID_ACTIVE_KEY', '1')
+
+# How long resolved (user, file) permissions stay in the cache. Sharing, updating
+# and revoking invalidate entries directly; expiry is always checked live.
+FILE_ACL_CACHE_TIMEOUT = 300
+
+# File listings are paginated with a cursor
+FILE_LIST_PAGE_SIZE = 50
+FILE_LIST_MAX_PAGE_SIZE = 500
+
+# How long a rendered listing page stays in the cache. Uploads and share changes
+# move listings to a new generation, and pages of shares are only kept until the
+# first of them expires, so this only bounds memory use.
+FILE_LISTING_CACHE_TIMEOUT = 600
+
+# Cached permissions and listings live in the default cache. Local memory is per
+# process, so deployments with several workers must point CACHE_REDIS_URL at a
+# shared Redis for invalidations to reach every worker (docker-compose.yml does).
+if os.environ.get('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CACHE_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            # Room for the permissions, listings and users of a busy process;
+            # the default of 300 would evict them long before they expire
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        }
+    }
+
+# Expired shares are hidden from listings and deleted by `manage.py
+# reap_expired_shares`. Set SHARE_REAPER_INTERVAL (seconds) to also reap them
+# from a background thread in every process instead of scheduling the command.
+SHARE_REAPER_INTERVAL = None
+
+# Largest number of items accepted by one bulk share or bulk revoke request
+BULK_SHARE_MAX_ITEMS = 1000
+
+# Chunked uploads
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Largest accepted chunk, must stay below DATA_UPLOAD_MAX_MEMORY_SIZE
+UPLOAD_SESSION_LIFETIME = timedelta(hours=24)
+
+# Streaming downloads read and encrypt files in blocks of this size
+DOWNLOAD_BLOCK_SIZE = 64 * 1024
+
+# Whole-file encryption and decryption (upload ingest, hashing, compression,
+# JSON downloads) is split into segments of this size (a multiple of 16) and
+# spread over CRYPTO_THREADS threads; None uses one thread per core.
+CRYPTO_SEGMENT_SIZE = 1024 * 1024
+CRYPTO_THREADS = None
+
+# Cipher suites offered for transfers, most preferred first; None uses
+# DEFAULT_SUITE_ORDER in accounts/cipher_suites.py. `manage.py benchmark_crypto`
+# compares their speed on this machine. Framed suites seal CIPHER_FRAME_SIZE
+# bytes of plaintext per authenticated frame.
+CIPHER_SUITES = None
+CIPHER_FRAME_SIZE = 64 * 1024
+
+# Where uploaded file contents (blobs) are stored. The default keeps them on this
+# node's disk; with several Django nodes use shared storage, for example
+# (relative roots are under MEDIA_ROOT):
+#
+#   Sharded over mount points or nodes with a consistent-hash ring:
+#     {'BACKEND': 'accounts.storage.ShardedBlobStorage', 'OPTIONS': {'shards': {
+#         'a': {'BACKEND': 'accounts.storage.LocalBlobStorage', 'OPTIONS': {'root': '/mnt/blobs-a'}},
+#         'b': {'BACKEND': 'accounts.storage.LocalBlobStorage', 'OPTIONS': {'root': '/mnt/blobs-b'}},
+#     }}}
+#   An S3-compatible bucket (needs boto3; set endpoint_url for MinIO and the like,
+#   or emulator_root to use the local stand-in):
+#     {'BACKEND': 'accounts.storage.S3BlobStorage', 'OPTIONS': {'bucket': 'fileshare-blobs'}}
+BLOB_STORAGE = {
+    'BACKEND': 'accounts.storage.LocalBlobStorage',
+    'OPTIONS': {'root': os.path.join('media', 'blobs')},
+}
+
+# New blobs are compressed before encryption unless their type is already
+# compressed or a sample of them shrinks by less than FILE_COMPRESSION_MIN_RATIO.
+# 'auto' uses zstd when the zstandard package is installed and zlib otherwise;
+# '' turns compression off. Existing blobs keep the codec they were written with.
+FILE_COMPRESSION_CODEC = 'auto'
+FILE_COMPRESSION_MIN_RATIO = 1.1
+FILE_COMPRESSION_PROBE_BYTES = 64 * 1024
+FILE_COMPRESSION_SKIP_TYPES = (
+    'image/', 'audio/', 'video/',
+    'application/zip', 'application/gzip', 'application/x-7z-compressed', 'application/x-bzip2',
+    'application/x-rar-compressed', 'application/x-xz', 'application/zstd',
+    'application/vnd.openxmlformats-officedocument.', 'application/vnd.oasis.opendocument.',
+    'application/epub+zip', 'application/java-archive',
+)
+
+# When set, files encrypted at rest are delivered by nginx through this internal
+# location (X-Accel-Redirect) instead of being streamed by a Django worker.
+# It must map to the media/ directory, see nginx/nginx-django.conf.
+FILE_X_ACCEL_REDIRECT_PREFIX = os.environ.get('FILE_X_ACCEL_REDIRECT_PREFIX', '')
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -189,4 +368,13 @@ LOGGING = {
 
 
 
-GOOGLE_OAUTH_CLIENT_ID ='example.apps.googleusercontent.com'
\ No newline at end of file
+GOOGLE_OAUTH_CLIENT_ID ='example.apps.googleusercontent.com'
+
+# Google's ID token signing certificates ({key id: x509 PEM}) are cached for the
+# max-age Google sends, or GOOGLE_CERTS_DEFAULT_MAX_AGE seconds without one. A
+# token signed with an unknown key refetches them at most once per
+# GOOGLE_CERTS_MIN_REFRESH seconds.
+GOOGLE_OAUTH_CERTS_URL = 'https://www.googleapis.com/oauth2/v1/certs'
+GOOGLE_CERTS_DEFAULT_MAX_AGE = 300
+GOOGLE_CERTS_MIN_REFRESH = 60
+GOOGLE_CERTS_TIMEOUT = 10
\ No newline at end of file
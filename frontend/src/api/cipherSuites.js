@@ -0,0 +1,100 @@
+// Transfer cipher suites this client supports, most preferred first. The
+// server picks its own preferred suite among them for each download.
+export const CLIENT_CIPHER_SUITES = ['aes-256-gcm-frames', 'aes-256-ctr'];
+export const FRAMED_SUITE = 'aes-256-gcm-frames';
+
+const TAG_BYTES = 16;
+const DEFAULT_FRAME_SIZE = 64 * 1024;
+
+const base64ToBytes = (base64) => Uint8Array.from(window.atob(base64), (c) => c.charCodeAt(0));
+const bytesToHex = (bytes) => Array.from(bytes, (b) => b.toString(16).padStart(2, '0')).join('');
+
+// Frame i uses the base nonce with its last 8 bytes XORed with i
+const frameNonce = (nonce, index) => {
+  const frame = new Uint8Array(nonce);
+  const view = new DataView(frame.buffer);
+  view.setUint32(4, view.getUint32(4) ^ Math.floor(index / 2 ** 32));
+  view.setUint32(8, view.getUint32(8) ^ (index >>> 0));
+  return frame;
+};
+
+// Each frame authenticates its index and whether it is the last one
+const frameAad = (index, final) => {
+  const aad = new Uint8Array(9);
+  const view = new DataView(aad.buffer);
+  view.setUint32(0, Math.floor(index / 2 ** 32));
+  view.setUint32(4, index >>> 0);
+  aad[8] = final ? 1 : 0;
+  return aad;
+};
+
+const frameCount = (size, frameSize) => Math.max(Math.ceil(size / frameSize), 1);
+
+// Encrypts a file as AES-256-GCM frames for upload
+export const sealFrames = async (plaintext, frameSize = DEFAULT_FRAME_SIZE) => {
+  const keyBytes = window.crypto.getRandomValues(new Uint8Array(32));
+  const nonce = window.crypto.getRandomValues(new Uint8Array(12));
+  const key = await window.crypto.subtle.importKey('raw', keyBytes, 'AES-GCM', false, ['encrypt']);
+
+  const count = frameCount(plaintext.byteLength, frameSize);
+  const records = await Promise.all(
+    Array.from({ length: count }, (_, index) =>
+      window.crypto.subtle.encrypt(
+        { name: 'AES-GCM', iv: frameNonce(nonce, index), additionalData: frameAad(index, index === count - 1) },
+        key,
+        plaintext.slice(index * frameSize, (index + 1) * frameSize)
+      )
+    )
+  );
+  return {
+    ciphertext: new Blob(records),
+    key: bytesToHex(keyBytes),
+    nonce: bytesToHex(nonce),
+    frameSize,
+  };
+};
+
+// Decrypts and verifies a whole framed ciphertext; throws if any frame was altered
+const openFrames = async (ciphertext, keyBytes, nonce, frameSize) => {
+  const key = await window.crypto.subtle.importKey('raw', keyBytes, 'AES-GCM', false, ['decrypt']);
+  const recordSize = frameSize + TAG_BYTES;
+  const count = Math.max(Math.ceil(ciphertext.byteLength / recordSize), 1);
+  return Promise.all(
+    Array.from({ length: count }, (_, index) =>
+      window.crypto.subtle.decrypt(
+        { name: 'AES-GCM', iv: frameNonce(nonce, index), additionalData: frameAad(index, index === count - 1) },
+        key,
+        ciphertext.slice(index * recordSize, (index + 1) * recordSize)
+      )
+    )
+  );
+};
+
+// Request headers that ask for raw ciphertext in a negotiated suite
+export const binaryDownloadHeaders = {
+  Accept: 'application/octet-stream',
+  'X-Cipher-Suites': CLIENT_CIPHER_SUITES.join(', '),
+};
+
+// Decrypts a binary download (axios response with responseType 'arraybuffer')
+// in whichever suite the server picked. Returns an array of ArrayBuffers.
+export const decryptDownload = async (response) => {
+  const { headers, data } = response;
+  if (headers['x-cipher-suite'] === FRAMED_SUITE) {
+    return openFrames(
+      data,
+      base64ToBytes(headers['x-cipher-key']),
+      base64ToBytes(headers['x-cipher-nonce']),
+      Number(headers['x-cipher-frame-size'])
+    );
+  }
+
+  // AES-CTR, with a 64-bit counter in the last half of the counter block
+  const key = await window.crypto.subtle.importKey('raw', base64ToBytes(headers['x-aes-key']), 'AES-CTR', false, ['decrypt']);
+  const plaintext = await window.crypto.subtle.decrypt(
+    { name: 'AES-CTR', counter: base64ToBytes(headers['x-aes-iv']), length: 64 },
+    key,
+    data
+  );
+  return [plaintext];
+};
@@ -1,9 +1,10 @@
 import axiosInstance from './axiosInstance';
+import { FRAMED_SUITE } from './cipherSuites';
 
 // UPLOAD FILE
 export const uploadFile = async (payload) => {
   try {
-    const response = await axiosInstance.post('/api/upload/', payload, {
+    const response = await axiosInstance.post('/api/async/upload/', payload, {
       headers: {
         Authorization: `Bearer ${localStorage.getItem('accessToken')}`, // Include the access token
         'Content-Type': 'application/json',
@@ -17,3 +18,27 @@ export const uploadFile = async (payload) => {
     throw new Error(err.response?.data?.error || 'Upload failed.');
   }
 };
+
+// UPLOAD FILE AS RAW FRAMED CIPHERTEXT (see sealFrames in cipherSuites.js)
+export const uploadFramedFile = async (fileName, sealed) => {
+  try {
+    const response = await axiosInstance.post('/api/async/upload/', sealed.ciphertext, {
+      headers: {
+        Authorization: `Bearer ${localStorage.getItem('accessToken')}`,
+        'Content-Type': 'application/octet-stream',
+        'X-File-Name': encodeURIComponent(fileName),
+        'X-Cipher-Suite': FRAMED_SUITE,
+        'X-Cipher-Key': sealed.key,
+        'X-Cipher-Nonce': sealed.nonce,
+        'X-Cipher-Frame-Size': String(sealed.frameSize),
+      },
+      timeout: 0,
+    });
+
+    console.log('Upload successful:', response.data);
+    return response.data;
+  } catch (err) {
+    console.error('Upload error:', err.response?.data || err.message);
+    throw new Error(err.response?.data?.error || 'Upload failed.');
+  }
+};
@@ -5,7 +5,7 @@ import axiosInstance from '../api/axiosInstance';
 const handleDownload = async (fileId) => {
   try {
     // Fetch encrypted content, key, and IV from the server
-    const response = await axiosInstance.get(`/api/access/${fileId}/`);
+    const response = await axiosInstance.get(`/api/async/access/${fileId}/`);
     const { encrypted_content, key, iv, file_name } = response.data;
 
     // Decrypt the content using AES
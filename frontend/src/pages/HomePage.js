@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState } from 'react';
 import {
   Container,
   Typography,
@@ -13,34 +13,18 @@ import {
 } from '@mui/icons-material';
 import { useNavigate } from 'react-router-dom';
 import Header from '../components/Header';
-import CryptoJS from 'crypto-js';
-import { uploadFile } from '../api/fileApi'; // Import the uploadFile function
+import { uploadFramedFile } from '../api/fileApi'; // Import the upload helper
+import { sealFrames } from '../api/cipherSuites';
 
 const HomePage = () => {
   const [file, setFile] = useState(null); // Selected file
   const [fileContent, setFileContent] = useState(null); // File content as ArrayBuffer
-  const [aesKey, setAESKey] = useState(''); // AES Key
-  const [aesIv, setAESIv] = useState(''); // AES IV
   const [uploading, setUploading] = useState(false); // Uploading state
   const [success, setSuccess] = useState(false); // Success state
   const [error, setError] = useState(''); // Error state
 
   const navigate = useNavigate(); // For navigation
 
-  // Generate AES Key and IV
-  useEffect(() => {
-    const generateAESKeyAndIV = () => {
-      const key = CryptoJS.lib.WordArray.random(32).toString(
-        CryptoJS.enc.Hex
-      ); // 256-bit key
-      const iv = CryptoJS.lib.WordArray.random(16).toString(CryptoJS.enc.Hex); // 128-bit IV
-      setAESKey(key);
-      setAESIv(iv);
-    };
-
-    generateAESKeyAndIV();
-  }, []);
-
   // Handle file selection
   const handleFileChange = (e) => {
     const selectedFile = e.target.files[0];
@@ -72,33 +56,11 @@ const HomePage = () => {
     setSuccess(false);
 
     try {
-      // Encrypt the file content
-      const key = CryptoJS.enc.Hex.parse(aesKey);
-      const iv = CryptoJS.enc.Hex.parse(aesIv);
-
-      // Convert ArrayBuffer to WordArray
-      const wordArray = CryptoJS.lib.WordArray.create(fileContent);
-
-      const encrypted = CryptoJS.AES.encrypt(wordArray, key, {
-        iv: iv,
-        mode: CryptoJS.mode.CBC,
-        padding: CryptoJS.pad.Pkcs7,
-      });
-
-      const encryptedContent = CryptoJS.enc.Base64.stringify(
-        encrypted.ciphertext
-      );
-
-      // Prepare JSON payload
-      const payload = {
-        file_name: file.name,
-        encrypted_content: encryptedContent,
-        aes_key: aesKey,
-        aes_iv: aesIv,
-      };
-
-      // Call the API helper to upload the file
-      await uploadFile(payload);
+      // Encrypt the file as authenticated AES-256-GCM frames
+      const sealed = await sealFrames(fileContent);
+
+      // Stream the raw ciphertext to the server
+      await uploadFramedFile(file.name, sealed);
 
       setSuccess(true);
     } catch (err) {
@@ -21,10 +21,12 @@ import {
 } from '@mui/material';
 import { useNavigate } from 'react-router-dom';
 import axiosInstance from '../api/axiosInstance';
+import { binaryDownloadHeaders, decryptDownload } from '../api/cipherSuites';
 import Header from '../components/Header';
 
 const UploadedFilesPage = () => {
   const [files, setFiles] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [openShareDialog, setOpenShareDialog] = useState(false);
@@ -45,6 +47,7 @@ const UploadedFilesPage = () => {
       try {
         const response = await axiosInstance.get('/api/all-files/');
         setFiles(response.data.files || []);
+        setNextCursor(response.data.next_cursor || null);
       } catch (err) {
         console.error('Error fetching files:', err);
         setError('Failed to fetch uploaded files.');
@@ -55,16 +58,18 @@ const UploadedFilesPage = () => {
 
     fetchUploadedFiles();
   }, []);
-// Utility function to convert Base64 to ArrayBuffer
-function base64ToArrayBuffer(base64) {
-  const binaryString = window.atob(base64);
-  const len = binaryString.length;
-  const bytes = new Uint8Array(len);
-  for (let i = 0; i < len; i++) {
-    bytes[i] = binaryString.charCodeAt(i);
-  }
-  return bytes.buffer;
-}
+
+  // Fetch the next page of the listing and append it
+  const handleLoadMore = async () => {
+    try {
+      const response = await axiosInstance.get('/api/all-files/', { params: { cursor: nextCursor } });
+      setFiles((current) => [...current, ...(response.data.files || [])]);
+      setNextCursor(response.data.next_cursor || null);
+    } catch (err) {
+      console.error('Error fetching files:', err);
+      setError('Failed to fetch uploaded files.');
+    }
+  };
 
   const handleDownload = async (encryptedFileId, fileName) => {
     if (!encryptedFileId) {
@@ -73,41 +78,17 @@ function base64ToArrayBuffer(base64) {
     }
   
     try {
-      const response = await axiosInstance.get(`/api/access/${encryptedFileId}/`);
-  
-      const {
-        encrypted_content,
-        aes_key,
-        aes_iv,
-        file_name,
-      } = response.data;
-  
-      // Decode Base64 data
-      const encryptedContentBytes = base64ToArrayBuffer(encrypted_content);
-      const aesKeyBytes = base64ToArrayBuffer(aes_key);
-      const aesIvBytes = base64ToArrayBuffer(aes_iv);
-  
-      // Import the AES key
-      const cryptoKey = await window.crypto.subtle.importKey(
-        'raw',
-        aesKeyBytes,
-        'AES-CBC',
-        false,
-        ['decrypt']
-      );
-  
-      // Decrypt the content
-      const decryptedContent = await window.crypto.subtle.decrypt(
-        {
-          name: 'AES-CBC',
-          iv: aesIvBytes,
-        },
-        cryptoKey,
-        encryptedContentBytes
-      );
-  
+      // Raw ciphertext in a negotiated cipher suite; framed suites verify every frame
+      const response = await axiosInstance.get(`/api/async/access/${encryptedFileId}/`, {
+        headers: binaryDownloadHeaders,
+        responseType: 'arraybuffer',
+        timeout: 0,
+      });
+      const decryptedContent = await decryptDownload(response);
+      const file_name = decodeURIComponent(response.headers['x-file-name'] || '');
+
       // Create a Blob from the decrypted content
-      const blob = new Blob([decryptedContent]);
+      const blob = new Blob(decryptedContent);
   
       // Trigger the download
       const url = window.URL.createObjectURL(blob);
@@ -216,6 +197,12 @@ function base64ToArrayBuffer(base64) {
           </TableContainer>
         )}
 
+        {nextCursor && (
+          <Button variant="outlined" sx={{ mt: 2 }} onClick={handleLoadMore}>
+            Load more
+          </Button>
+        )}
+
         {/* Share Dialog */}
         <Dialog open={openShareDialog} onClose={() => setOpenShareDialog(false)}>
           <DialogTitle>Share File</DialogTitle>
@@ -2,6 +2,7 @@ import React, { useEffect, useState } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { Container, CircularProgress, Alert, Button, Box } from '@mui/material';
 import axiosInstance from '../api/axiosInstance';
+import { binaryDownloadHeaders, decryptDownload } from '../api/cipherSuites';
 import { Worker, Viewer } from '@react-pdf-viewer/core';
 import '@react-pdf-viewer/core/lib/styles/index.css';
 import '@react-pdf-viewer/default-layout/lib/styles/index.css';
@@ -17,35 +18,18 @@ const ViewFilePage = () => {
   useEffect(() => {
     const fetchAndRenderPDF = async () => {
       try {
-        const response = await axiosInstance.get(`/api/view/${encryptedFileId}/`);
-        const { encrypted_content, aes_key, aes_iv } = response.data;
+        // Ask for raw ciphertext in a negotiated cipher suite instead of base64-in-JSON
+        const response = await axiosInstance.get(`/api/async/view/${encryptedFileId}/`, {
+          headers: binaryDownloadHeaders,
+          responseType: 'arraybuffer',
+          timeout: 0,
+        });
 
-        // Decode Base64 data
-        const encryptedContentBytes = base64ToArrayBuffer(encrypted_content);
-        const aesKeyBytes = base64ToArrayBuffer(aes_key);
-        const aesIvBytes = base64ToArrayBuffer(aes_iv);
+        // Decrypt (and, for framed suites, verify) the content
+        const decryptedContent = await decryptDownload(response);
 
-        // Import the AES key
-        const cryptoKey = await window.crypto.subtle.importKey(
-          'raw',
-          aesKeyBytes,
-          'AES-CBC',
-          false,
-          ['decrypt']
-        );
-
-        // Decrypt the content
-        const decryptedContent = await window.crypto.subtle.decrypt(
-          {
-            name: 'AES-CBC',
-            iv: aesIvBytes,
-          },
-          cryptoKey,
-          encryptedContentBytes
-        );
-
-        // Convert ArrayBuffer to Blob
-        const blob = new Blob([decryptedContent], { type: 'application/pdf' });
+        // Convert the decrypted pieces to a Blob
+        const blob = new Blob(decryptedContent, { type: 'application/pdf' });
 
         setPdfData(blob);
       } catch (err) {
@@ -59,16 +43,6 @@ const ViewFilePage = () => {
     fetchAndRenderPDF();
   }, [encryptedFileId]);
 
-  function base64ToArrayBuffer(base64) {
-    const binaryString = window.atob(base64);
-    const len = binaryString.length;
-    const bytes = new Uint8Array(len);
-    for (let i = 0; i < len; i++) {
-      bytes[i] = binaryString.charCodeAt(i);
-    }
-    return bytes.buffer;
-  }
-
   return (
     <>
       <Header /> {/* Add Header component */}